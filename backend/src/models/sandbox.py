@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
 from typing import Optional
 
@@ -10,6 +10,8 @@ class Sandbox(BaseModel):
     created_at: datetime
     type: str = "vulnerable-webapp"
     difficulty: str = "beginner"
+    # Секретный токен-ловушка в БД песочницы; не отдаётся в ответах API
+    honeypot_token: Optional[str] = Field(default=None, exclude=True)
 
 class SandboxCreate(BaseModel):
     name: str
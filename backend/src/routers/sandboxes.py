@@ -1,9 +1,22 @@
-from fastapi import APIRouter, HTTPException
+import os
+import secrets
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException
 from models.sandbox import SandboxCreate
 from services.sandbox_service import SandboxService
 
 router = APIRouter()
 
+# Ключ служебных запросов детектора (без него служебные эндпоинты выключены)
+SERVICE_TOKEN = os.environ.get("BACKEND_SERVICE_TOKEN", "")
+
+def require_service_token(token: Optional[str]):
+    """Пропускает только служебный запрос с верным X-Service-Token"""
+    if not SERVICE_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not token or not secrets.compare_digest(token, SERVICE_TOKEN):
+        raise HTTPException(status_code=403, detail="Требуется служебный ключ")
+
 @router.post("/sandboxes")
 def create_sandbox(sandbox_data: SandboxCreate):
     sandbox = SandboxService.create_sandbox(
@@ -32,6 +45,15 @@ def get_sandbox(sandbox_id: str):
         raise HTTPException(status_code=404, detail="Песочница не найдена")
     return sandbox
 
+@router.get("/sandboxes/{sandbox_id}/honeypot-token")
+def get_honeypot_token(sandbox_id: str, x_service_token: Optional[str] = Header(default=None)):
+    """Служебный эндпоинт: токен-ловушка одной песочницы для верификатора детектора"""
+    require_service_token(x_service_token)
+    token = SandboxService.get_honeypot_token(sandbox_id)
+    if token is None:
+        raise HTTPException(status_code=404, detail="Песочница не найдена")
+    return {"sandbox_id": sandbox_id, "token": token}
+
 @router.delete("/sandboxes/{sandbox_id}")
 def delete_sandbox(sandbox_id: str):
     # Здесь будет логика удаления
@@ -1,10 +1,14 @@
 import uuid
+import secrets
 from datetime import datetime
+from typing import Dict, Optional
 from models.sandbox import Sandbox
 
 # Временная "база данных"
 sandboxes_db = []
 logs_db = []
+# Токены-ловушки: sandbox_id -> токен (для верификатора детектора)
+honeypot_tokens_db: Dict[str, str] = {}
 
 class SandboxService:
     @staticmethod
@@ -22,6 +26,7 @@ class SandboxService:
         )
         
         sandboxes_db.append(new_sandbox)
+        SandboxService.register_honeypot_token(sandbox_id)
         
         # Логируем создание
         logs_db.append({
@@ -46,4 +51,24 @@ class SandboxService:
     
     @staticmethod
     def get_logs():
-        return logs_db
\ No newline at end of file
+        return logs_db
+    
+    @staticmethod
+    def generate_honeypot_token(sandbox_id: str) -> str:
+        """Уникальный токен-ловушка (email в БД уязвимого приложения песочницы)"""
+        return f"honeypot_{sandbox_id}_{secrets.token_hex(6)}@cyberrange.test"
+    
+    @staticmethod
+    def register_honeypot_token(sandbox_id: str, token: Optional[str] = None) -> str:
+        """Регистрирует токен песочницы (новый, если token не задан) и возвращает его"""
+        token = token or SandboxService.generate_honeypot_token(sandbox_id)
+        honeypot_tokens_db[sandbox_id] = token
+        sandbox = SandboxService.get_sandbox_by_id(sandbox_id)
+        if sandbox is not None:
+            sandbox.honeypot_token = token
+        return token
+    
+    @staticmethod
+    def get_honeypot_token(sandbox_id: str) -> Optional[str]:
+        """Токен песочницы (None, если песочница не зарегистрирована)"""
+        return honeypot_tokens_db.get(sandbox_id)
\ No newline at end of file
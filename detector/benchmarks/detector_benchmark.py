@@ -0,0 +1,532 @@
+#!/usr/bin/env python3
+"""
+БЕНЧМАРК ДЕТЕКТОРА С ПРОВЕРКОЙ РЕГРЕССИЙ
+
+Замеры на сгенерированном корпусе обычных и вредоносных запросов
+(SQL-инъекции, XSS, Path Traversal) заданного размера и распределения
+длины нагрузки:
+  - detector.*  - каждый детектор отдельно: регулярные SQLi/XSS/Path
+                  Traversal, лексер SQLi, пакет правил, потоковый сканер,
+                  триаж и поиск токенов-ловушек в логах
+  - analyze.*   - CyberRangeDetector.analyze_request целиком: без базы,
+                  с записью в базу и в режиме triage
+  - db.*        - запись и чтение DatabaseManager
+
+Для каждого замера печатается пропускная способность (операций в секунду,
+лучший прогон; прогонов не меньше --runs и не меньше --min-time секунд)
+и p50/p99 времени одной операции по всем прогонам. Каждый прогон - на
+новом экземпляре, чтобы кеши результатов не переносились между
+прогонами; база создаётся во временной папке.
+
+До и после каждого замера выполняется калибровочный цикл на чистом
+Python, и пропускная способность и p99 переводятся в доли его скорости
+(лучшей из двух): так базовый замер, снятый на другой машине или при
+другой фоновой нагрузке, сравним с текущим.
+
+Результаты сравниваются с сохранённым базовым замером (--baseline) по
+этим долям: код возврата 1, если пропускная способность упала больше
+чем на --threshold (--db-threshold для замеров с записью на диск) или
+p99 вырос больше чем на --p99-threshold. Базовый замер записывается с
+--save-baseline.
+
+Запуск: python detector/benchmarks/detector_benchmark.py --size 2000
+        python detector/benchmarks/detector_benchmark.py --only detector --save-baseline
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+BENCHMARKS_PATH = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_PATH, '..', 'src'))
+
+from sqli_engine_benchmark import WORDS  # noqa: E402
+from main import CyberRangeDetector  # noqa: E402
+from database.db_manager import DatabaseManager  # noqa: E402
+from detectors.sql_injection import SQLInjectionDetector  # noqa: E402
+from detectors.sql_tokenizer import SQLTokenDetector  # noqa: E402
+from detectors.xss_detector import XSSDetector  # noqa: E402
+from detectors.path_traversal import PathTraversalDetector  # noqa: E402
+from detectors.stream_scanner import StreamScanner, collect_rules  # noqa: E402
+from detectors.rule_pack import PackDetector, load_rule_pack  # noqa: E402
+from detectors.triage import TriagePlan  # noqa: E402
+from detectors.behavioral_sqli_verifier import BehavioralSQLiVerifier  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(BENCHMARKS_PATH, 'detector_baseline.json')
+DEFAULT_RULE_PACK = os.path.abspath(os.path.join(BENCHMARKS_PATH, '..', 'rules', 'default.json'))
+
+# Шаблоны корпуса для замеров скорости (качество движков SQLi проверяется
+# на отложенном корпусе sqli_engine_benchmark)
+SQLI_TEMPLATES = (
+    "{w}' or {n}={n}--", "{w}' OR '{w}'='{w}", "{w}' or {n}={n} #", "{w}')) or (({n}={n}", "{n} or {n}={n}",
+    "{n}) OR ({n}={n}", "{w}' AND {n}>{m}--", "{w}\" or \"{w}\"=\"{w}", "{w}'--", "{w}' /*",
+    "{w}' union select {w},{w} from {w}--", "-{n} UNION ALL SELECT NULL,NULL,NULL--", "{n} union select {n},{n}",
+    "{w}' UNION SELECT @@version,{n}#", "{w}')  union  select {w} from {w} where {n}={n}--",
+    "{w}'; drop table {w}--", "{n}; DELETE FROM {w}", "{w}'; INSERT INTO {w} VALUES ({n},'{w}')--",
+    "{w}'; update {w} set {w}='{w}'--", "{n};shutdown--", "{w}'; exec {w}--",
+    "{w}' and sleep({n})--", "{n} AND SLEEP({n})", "{w}' or benchmark({n},md5({n}))#", "{w}' AND pg_sleep({n})--",
+    "{w}'; WAITFOR DELAY '0:0:{n}'--", "{n} or if({n}={n},sleep({n}),0)",
+    "{w}' AND extractvalue({n},concat({n},version()))--", "{n} AND {n}=CONVERT(int,@@version)",
+    "{w}' and (select {n} from {w})--", "{n}/*!union*/select {n}", "{w}' ORDER BY {n}--", "{w}' order by {n}#",
+)
+
+BENIGN_TEMPLATES = (
+    "{w}", "{w} {w}", "{n}", "{w}@{w}.com", "{W}'s {w}", "O'{W}", "{w} and {w}", "{w} or {w}",
+    "{W} & {W}", "{w} = {w}", "price={n}", "rating>={n}", "{n}-{n}-{n}", "{n}.{n}", "+7 {n} {n}",
+    "select {w} {w}", "drop {w} a line", "union {w}", "order by {w}", "{w}-{w}", "{w}_{w}", "#{w}",
+    "it's {w}, isn't it?", "can't {w}, won't {w}", "{W} said \"{w}\" or so", "rock'n'roll", "{w}; {w}",
+    "/{w}/{w}.html", "{w}?{w}={n}&{w}={w}", "{n}%", "({w})", "{w} - {w}", "{W}, {W} and {W}",
+    "{n} {w} or less", "1+1={n}", "{w}'{w}", "SELECT * is not a query", "from {w} to {w}",
+    "{W} and {W} = {w}", "{w}={w} or {w}", "O'{W} and {W} = {w}s",
+)
+
+XSS_TEMPLATES = (
+    "<script>alert({n})</script>", "<ScRiPt>document.cookie</sCrIpT>", "<img src=x onerror=alert({n})>",
+    "<body onload=alert('{w}')>", "<svg/onload=alert({n})>", "javascript:alert({n})",
+    "<a href=\"javascript:{w}()\">{w}</a>", "<div onmouseover=\"{w}()\">{w}</div>", "<iframe src=//{w}.com>",
+    "\"><script>{w}({n})</script>", "<input onfocus=alert({n}) autofocus>", "data:text/html,<script>{w}</script>",
+)
+
+PATH_TEMPLATES = (
+    "../../etc/passwd", "../../../{w}/{w}.conf", "..\\..\\windows\\win.ini", "%2e%2e%2f%2e%2e%2fetc/passwd",
+    "....//....//etc/shadow", "/{w}/../../../etc/hosts", "..%2f..%2f{w}.txt", "%252e%252e%252f{w}",
+    "/proc/self/environ", "file:///etc/passwd", "../{w}/../../{w}.ini",
+)
+
+ATTACK_KINDS = (('sql', SQLI_TEMPLATES), ('xss', XSS_TEMPLATES), ('path', PATH_TEMPLATES))
+
+URL_PATHS = ('/search', '/login', '/api/items', '/profile', '/download', '/cart', '/news/{n}', '/static/{w}.js')
+
+
+# ===== КОРПУС =====
+
+def fill(template: str, rng: random.Random) -> str:
+    return template.format(
+        w=rng.choice(WORDS),
+        W=rng.choice(WORDS).capitalize(),
+        n=rng.randint(0, 999),
+        m=rng.randint(0, 999)
+    )
+
+
+def parse_lengths(spec: str) -> Callable[[random.Random], int]:
+    """
+    Распределение длины нагрузки (символов):
+      fixed:N            - ровно N
+      uniform:MIN:MAX    - равномерно от MIN до MAX
+      lognormal:MED:S    - логнормальное с медианой MED и сигмой S (длинный хвост)
+    """
+    kind, _, args = spec.partition(':')
+    try:
+        values = [float(value) for value in args.split(':')] if args else []
+        if kind == 'fixed' and len(values) == 1:
+            return lambda rng: int(values[0])
+        if kind == 'uniform' and len(values) == 2:
+            return lambda rng: rng.randint(int(values[0]), int(values[1]))
+        if kind == 'lognormal' and len(values) == 2:
+            return lambda rng: int(rng.lognormvariate(math.log(values[0]), values[1]))
+    except ValueError:
+        pass
+    raise ValueError(f"неверное распределение длины: {spec} (fixed:N, uniform:MIN:MAX, lognormal:MED:S)")
+
+
+def pad(value: str, length: int, rng: random.Random) -> str:
+    """Дополняет нагрузку обычными словами до length символов (нагрузка - в случайном месте)"""
+    missing = length - len(value)
+    if missing <= 0:
+        return value
+    words = []
+    while sum(len(word) + 1 for word in words) < missing:
+        words.append(rng.choice(WORDS))
+    split = rng.randint(0, len(words))
+    return ' '.join(words[:split] + [value] + words[split:])[:max(length, len(value))]
+
+
+def make_requests(size: int, malicious_ratio: float, lengths: Callable[[random.Random], int],
+                  max_length: int, seed: int = 50) -> List[Dict[str, Any]]:
+    """
+    Запросы в формате analyze_request (method, url, params, sandbox_id,
+    source_ip) и поле kind: benign, sql, xss или path
+    """
+    rng = random.Random(seed)
+    requests = []
+    for index in range(size):
+        if rng.random() < malicious_ratio:
+            kind, templates = rng.choice(ATTACK_KINDS)
+        else:
+            kind, templates = 'benign', BENIGN_TEMPLATES
+        payload = pad(fill(rng.choice(templates), rng), min(max_length, max(1, lengths(rng))), rng)
+        params = {'file' if kind == 'path' else 'q': payload, 'page': str(rng.randint(1, 50))}
+        requests.append({
+            'method': 'GET' if rng.random() < 0.7 else 'POST',
+            'url': fill(rng.choice(URL_PATHS), rng),
+            'params': params,
+            'sandbox_id': f"sandbox_{index % 8:03d}",
+            'source_ip': f"10.0.{index % 32}.{index % 7 + 1}",
+            'kind': kind
+        })
+    return requests
+
+
+def payload_of(request: Dict[str, Any]) -> str:
+    params = request['params']
+    return params.get('q', params.get('file'))
+
+
+# ===== ЗАМЕРЫ =====
+
+# Итераций калибровочного цикла в одном прогоне
+CALIBRATION_ITERATIONS = 200000
+
+
+def _calibration_loop(iterations: int) -> int:
+    """Чистый Python того же рода, что код детекторов: срезы строк, словарь, ветвления"""
+    text = "select name, value from users where id = 1 and note like '%x%'"
+    counts: Dict[str, int] = {}
+    total = 0
+    for index in range(iterations):
+        start = index % 48
+        word = text[start:start + 6]
+        counts[word] = counts.get(word, 0) + 1
+        if word.isalpha():
+            total += len(word)
+    return total + len(counts)
+
+
+def calibrate(runs: int = 7) -> float:
+    """Скорость машины: итераций калибровочного цикла в секунду (лучший из runs прогонов)"""
+    best = float('inf')
+    for _ in range(runs):
+        started = time.perf_counter()
+        _calibration_loop(CALIBRATION_ITERATIONS)
+        best = min(best, time.perf_counter() - started)
+    return CALIBRATION_ITERATIONS / best
+
+
+def normalize(result: Dict[str, float], calibration: float) -> Dict[str, float]:
+    """
+    Добавляет к замеру доли калибровки: relative_throughput - операций на
+    итерацию калибровочного цикла, relative_p99 - p99 в итерациях цикла
+    """
+    result['relative_throughput'] = round(result['throughput'] / calibration, 6)
+    result['relative_p99'] = round(result['p99_us'] * calibration / 1e6, 3)
+    return result
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def measure(setup: Callable[[], Callable[[Any], Any]], items: List[Any], runs: int,
+            min_time: float) -> Dict[str, float]:
+    """
+    Не меньше runs прогонов и не меньше min_time секунд суммарно (быстрые
+    детекторы проходят корпус за миллисекунды, и один прогон - это шум
+    планировщика). setup() возвращает операцию (новый экземпляр на прогон),
+    операция вызывается для каждого элемента items.
+    """
+    best = float('inf')
+    latencies = []
+    completed, elapsed = 0, 0.0
+    while completed < runs or elapsed < min_time:
+        operation = setup()
+        started = time.perf_counter()
+        for item in items:
+            op_started = time.perf_counter()
+            operation(item)
+            latencies.append(time.perf_counter() - op_started)
+        duration = time.perf_counter() - started
+        best = min(best, duration)
+        completed += 1
+        elapsed += duration
+    latencies.sort()
+    return {
+        'throughput': round(len(items) / best, 1),
+        'p50_us': round(percentile(latencies, 0.50) * 1e6, 2),
+        'p99_us': round(percentile(latencies, 0.99) * 1e6, 2),
+        'ops': len(items),
+        'runs': completed
+    }
+
+
+def detector_cases(requests: List[Dict[str, Any]], workdir: str) -> Dict[str, tuple]:
+    """Замеры отдельных детекторов: {имя: (setup, элементы)}"""
+    payloads = [payload_of(request) for request in requests]
+    pack = load_rule_pack(DEFAULT_RULE_PACK)
+    builtin_rules = collect_rules({
+        'SQL_INJECTION': SQLInjectionDetector(), 'XSS': XSSDetector(), 'PATH_TRAVERSAL': PathTraversalDetector()
+    })
+
+    def triage_plan():
+        plan = TriagePlan.for_detectors({
+            'SQL_INJECTION': SQLInjectionDetector(), 'XSS': XSSDetector(), 'PATH_TRAVERSAL': PathTraversalDetector()
+        })
+        return lambda payload: plan.evaluate([('PARAM_q', payload)])
+
+    def pack_detectors():
+        detectors = [PackDetector(detection_type, pack.rules_for(detection_type))
+                     for detection_type in ('SQL_INJECTION', 'XSS', 'PATH_TRAVERSAL')]
+        return lambda payload: [detector.detect(payload) for detector in detectors]
+
+    # Лог доступа песочниц: файлы по 100 строк, в части строк - токен-ловушка
+    verifier = BehavioralSQLiVerifier()
+    log_files = []
+    for start in range(0, len(requests), 100):
+        path = os.path.join(workdir, f"access_{start // 100}.log")
+        with open(path, 'w', encoding='utf-8') as log:
+            for index, request in enumerate(requests[start:start + 100]):
+                leaked = f" {verifier.honeypot_email}" if (start + index) % 97 == 0 else ""
+                log.write(f'{request["source_ip"]} - - "{request["method"]} {request["url"]}?q={payload_of(request)}" '
+                          f'200 {len(payload_of(request))}{leaked}\n')
+        log_files.append(path)
+
+    return {
+        'detector.sql_injection': (lambda: SQLInjectionDetector().detect, payloads),
+        'detector.sql_tokenizer': (lambda: SQLTokenDetector().detect, payloads),
+        'detector.xss': (lambda: XSSDetector().detect, payloads),
+        'detector.path_traversal': (lambda: PathTraversalDetector().detect, payloads),
+        'detector.rule_pack': (pack_detectors, payloads),
+        'detector.stream_scanner': (lambda: StreamScanner(builtin_rules).scan,
+                                    [payload.encode('utf-8') for payload in payloads]),
+        'detector.triage': (triage_plan, payloads),
+        'detector.verifier': (lambda: BehavioralSQLiVerifier().scan_file, log_files),
+    }
+
+
+def analyze_cases(requests: List[Dict[str, Any]], db_requests: List[Dict[str, Any]], workdir: str) -> Dict[str, tuple]:
+    """Замеры CyberRangeDetector.analyze_request: {имя: (setup, элементы)}"""
+    def analyzer(persist: bool, mode: str = 'full'):
+        def setup():
+            # Каждый прогон - новая база, чтобы размер таблиц не рос от прогона к прогону
+            database = os.path.join(workdir, 'detector.db')
+            if os.path.exists(database):
+                os.remove(database)
+            detector = CyberRangeDetector()
+            return lambda request: detector.analyze_request(
+                request['method'], request['url'], request['params'], sandbox_id=request['sandbox_id'],
+                persist=persist, source_ip=request['source_ip'], mode=mode
+            )
+        return setup
+
+    return {
+        'analyze.no_db': (analyzer(False), requests),
+        'analyze.triage': (analyzer(False, 'triage'), requests),
+        'analyze.db': (analyzer(True), db_requests),
+    }
+
+
+def stat_counts(detections: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Приращения статистики запроса (как CyberRangeDetector.count_detections)"""
+    counts = dict.fromkeys(CyberRangeDetector.STAT_KEY_BY_TYPE.values(), 0)
+    counts.update(total_requests=1, detected_attacks=1 if detections else 0)
+    for detection in detections:
+        counts[CyberRangeDetector.STAT_KEY_BY_TYPE[detection['type']]] += 1
+    return counts
+
+
+def db_cases(db_requests: List[Dict[str, Any]], workdir: str, batch_size: int = 50) -> Dict[str, tuple]:
+    """Замеры DatabaseManager: запись по одному и пакетами, затем чтение"""
+    detections = [SQLInjectionDetector().detect(payload_of(request)) + XSSDetector().detect(payload_of(request))
+                  for request in db_requests]
+    for found in detections:
+        for detection in found:
+            detection['location'] = 'PARAM_q'
+    counts = [stat_counts(found) for found in detections]
+    entries = [(None, request['method'], request['url'], request['params'], request['sandbox_id'], found)
+               for request, found in zip(db_requests, detections)]
+    batches = [entries[start:start + batch_size] for start in range(0, len(entries), batch_size)]
+    batch_counts = [counts[start] for start in range(0, len(entries), batch_size)]
+
+    def manager(name: str) -> DatabaseManager:
+        path = os.path.join(workdir, f"{name}.db")
+        if os.path.exists(path):
+            os.remove(path)
+        return DatabaseManager(path)
+
+    def save_request():
+        db = manager('save_request')
+        return lambda request: db.save_request(request['method'], request['url'], request['params'],
+                                               request['sandbox_id'])
+
+    def save_detections():
+        db = manager('save_detections')
+        return lambda item: db.save_detections(db.save_request('GET', '/', {}), item)
+
+    def update_statistics():
+        db = manager('update_statistics')
+        return db.update_statistics
+
+    def save_batch():
+        db = manager('save_batch')
+        return lambda item: db.save_analysis_batch(item[0], item[1])
+
+    # Чтение - из базы, заполненной пакетной записью
+    reads_db = manager('reads')
+    for batch, stats in zip(batches, batch_counts):
+        reads_db.save_analysis_batch(batch, stats)
+    reads = list(range(len(db_requests)))
+
+    return {
+        'db.save_request': (save_request, db_requests),
+        'db.save_detections': (save_detections, detections),
+        'db.update_statistics': (update_statistics, counts),
+        'db.save_analysis_batch': (save_batch, list(zip(batches, batch_counts))),
+        'db.get_recent_detections': (lambda: lambda _: reads_db.get_recent_detections(50), reads),
+        'db.get_daily_stats': (lambda: lambda _: reads_db.get_daily_stats(), reads),
+    }
+
+
+# ===== БАЗОВЫЙ ЗАМЕР =====
+
+# Замеры с записью на диск (fsync SQLite) шумнее и сравниваются с --db-threshold
+DISK_CASES = ('db.', 'analyze.db')
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            threshold: float, db_threshold: float, p99_threshold: float) -> List[str]:
+    """
+    Список регрессий относительно базового замера (пустой - регрессий нет).
+    Сравниваются доли калибровки (см. normalize), а не абсолютные значения
+    """
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        allowed = db_threshold if name.startswith(DISK_CASES) else threshold
+        if result['relative_throughput'] < reference['relative_throughput'] * (1 - allowed):
+            regressions.append(f"{name}: пропускная {result['relative_throughput']:.6f} оп/итерацию "
+                               f"({result['throughput']:.0f} оп/с) < {reference['relative_throughput']:.6f} - {allowed:.0%}")
+        if result['relative_p99'] > reference['relative_p99'] * (1 + p99_threshold):
+            regressions.append(f"{name}: p99 {result['relative_p99']:.1f} итераций ({result['p99_us']:.1f} мкс) "
+                               f"> {reference['relative_p99']:.1f} + {p99_threshold:.0%}")
+    return regressions
+
+
+def delta(value: float, reference: Optional[float]) -> str:
+    if not reference:
+        return "      "
+    return f"{(value - reference) / reference:+6.1%}"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк детектора с проверкой регрессий")
+    parser.add_argument("--size", type=int, default=2000, help="число запросов в корпусе")
+    parser.add_argument("--db-size", type=int, default=300, help="число запросов для замеров с базой")
+    parser.add_argument("--malicious", type=float, default=0.5, help="доля вредоносных запросов")
+    parser.add_argument("--lengths", default="lognormal:48:1.0",
+                        help="распределение длины нагрузки: fixed:N, uniform:MIN:MAX, lognormal:MED:S")
+    parser.add_argument("--max-length", type=int, default=16384, help="максимальная длина нагрузки, символов")
+    parser.add_argument("--seed", type=int, default=50, help="seed генератора корпуса")
+    parser.add_argument("--runs", type=int, default=3, help="минимальное число прогонов каждого замера")
+    parser.add_argument("--min-time", type=float, default=1.0, help="минимальное суммарное время замера, секунды")
+    parser.add_argument("--only", default="", help="только замеры с этим префиксом (detector, analyze, db)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="файл базового замера (JSON)")
+    parser.add_argument("--save-baseline", action="store_true", help="записать результаты как базовый замер")
+    parser.add_argument("--threshold", type=float, default=0.25, help="допустимое падение пропускной способности")
+    parser.add_argument("--db-threshold", type=float, default=0.5,
+                        help="допустимое падение пропускной способности для замеров с записью на диск")
+    parser.add_argument("--p99-threshold", type=float, default=1.0, help="допустимый рост p99 (задержки записи в базу шумные)")
+    args = parser.parse_args()
+
+    try:
+        length_distribution = parse_lengths(args.lengths)
+    except ValueError as e:
+        parser.error(str(e))
+    config = {'size': args.size, 'db_size': args.db_size, 'malicious': args.malicious, 'lengths': args.lengths,
+              'max_length': args.max_length, 'seed': args.seed}
+
+    requests = make_requests(args.size, args.malicious, length_distribution, args.max_length, args.seed)
+    db_requests = requests[:args.db_size]
+    kinds = {kind: sum(1 for request in requests if request['kind'] == kind) for kind in ('benign', 'sql', 'xss', 'path')}
+    lengths = sorted(len(payload_of(request)) for request in requests)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)
+        if (baseline.get('config') != config or 'calibration' not in baseline) and args.save_baseline:
+            baseline = None  # перезаписывается целиком
+        elif baseline.get('config') != config:
+            print(f"❌ Базовый замер {args.baseline} снят с другими параметрами: {baseline.get('config')}")
+            print("   Запустите с теми же параметрами или перезапишите его с --save-baseline")
+            return 1
+        elif 'calibration' not in baseline:
+            print(f"❌ Базовый замер {args.baseline} снят без калибровки: перезапишите его с --save-baseline")
+            return 1
+
+
+    print(f"⏱  БЕНЧМАРК ДЕТЕКТОРА: {len(requests)} запросов "
+          f"({', '.join(f'{kind} {count}' for kind, count in kinds.items())})")
+    print(f"   длина нагрузки: {args.lengths}, p50 {percentile(lengths, 0.5)} / p99 {percentile(lengths, 0.99)} "
+          f"/ макс {lengths[-1]} символов; прогонов: от {args.runs}, от {args.min_time:g} с на замер")
+    print(f"   калибровка: {calibrate():.0f} итераций/с" + (
+        f" (базовый замер: {baseline['calibration']:.0f}; Δ - в долях калибровки)" if baseline else ""))
+    print("=" * 84)
+    print(f"   {'замер':26} {'оп/с':>11} {'Δ':>7} {'p50, мкс':>10} {'p99, мкс':>10} {'Δ p99':>7}")
+
+    results: Dict[str, Dict[str, float]] = {}
+    calibrations: List[float] = []
+    reference = (baseline or {}).get('results', {})
+    previous_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        # CyberRangeDetector создаёт detector.db в текущей папке
+        os.chdir(workdir)
+        try:
+            for builder in (lambda: detector_cases(requests, workdir),
+                            lambda: analyze_cases(requests, db_requests, workdir),
+                            lambda: db_cases(db_requests, workdir)):
+                cases = builder()
+                for name, (setup, items) in cases.items():
+                    if not name.startswith(args.only):
+                        continue
+                    # Калибровка вокруг замера учитывает смену фоновой нагрузки по ходу запуска
+                    before = calibrate()
+                    result = measure(setup, items, args.runs, args.min_time)
+                    calibration = max(before, calibrate())
+                    calibrations.append(calibration)
+                    results[name] = normalize(result, calibration)
+                    previous = reference.get(name, {})
+                    print(f"   {name:26} {result['throughput']:11.0f} "
+                          f"{delta(result['relative_throughput'], previous.get('relative_throughput'))} "
+                          f"{result['p50_us']:10.1f} {result['p99_us']:10.1f} "
+                          f"{delta(result['relative_p99'], previous.get('relative_p99'))}")
+        finally:
+            os.chdir(previous_cwd)
+    print("=" * 84)
+
+    if args.save_baseline:
+        # С --only обновляются только выполненные замеры, остальные сохраняются
+        saved = dict(reference, **results)
+        # Калибровка машины, на которой снят замер (для справки: сравниваются доли)
+        calibration = round(max(calibrations, default=calibrate()), 1)
+        with open(args.baseline, 'w', encoding='utf-8') as baseline_file:
+            json.dump({'config': config, 'calibration': calibration, 'results': saved},
+                      baseline_file, ensure_ascii=False, indent=2)
+            baseline_file.write("\n")
+        print(f"💾 Базовый замер сохранён: {args.baseline}")
+        return 0
+
+    if baseline is None:
+        print(f"   Базового замера нет ({args.baseline}) - сравнение пропущено")
+        return 0
+
+    regressions = compare(results, reference, args.threshold, args.db_threshold, args.p99_threshold)
+    if regressions:
+        print("❌ РЕГРЕССИИ:")
+        for regression in regressions:
+            print(f"   - {regression}")
+        return 1
+    print(f"✅ Регрессий нет (порог пропускной {args.threshold:.0%}, с диском {args.db_threshold:.0%}, "
+          f"p99 {args.p99_threshold:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
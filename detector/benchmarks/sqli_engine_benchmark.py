@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+БЕНЧМАРК ДВИЖКОВ ОБНАРУЖЕНИЯ SQL-ИНЪЕКЦИЙ
+
+Сравнивает движки SQLI_ENGINES (regex и tokenizer) на размеченном
+корпусе значений параметров:
+  - качество     - полнота (доля найденных атак), точность и доля ложных
+                   срабатываний на обычных значениях
+  - пропускная   - значений в секунду на смешанном корпусе и на длинных
+                   значениях (время лексера линейно от длины)
+
+Корпус отложенный: атаки и обычные значения записаны вручную, а не
+сгенерированы по шаблонам опорного корпуса SEED_PAYLOADS лексера, иначе
+полнота измеряла бы совпадение с ним, а не обобщение. Отдельно проверяются
+URL с внедрением в середине строки запроса.
+
+Лексер на чистом Python медленнее регулярного движка (тот выполняется
+в C); бенчмарк показывает цену, а не выигрыш по скорости.
+
+Запуск: python detector/benchmarks/sqli_engine_benchmark.py --repeat 50
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from typing import List, Tuple
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from main import SQLI_ENGINES  # noqa: E402
+from detectors.sql_tokenizer import SEED_PAYLOADS  # noqa: E402
+
+# Отложенный корпус атак: собран вручную из публичных шпаргалок и отчётов
+# сканеров, не из SEED_PAYLOADS лексера и не по его шаблонам (значения,
+# совпавшие с опорным корпусом, исключаются при запуске)
+HELD_OUT_ATTACKS = (
+    "1' AND 1=(SELECT COUNT(*) FROM tablenames); --", "' or 0=0 --", "\" or 0=0 #", "or 0=0 --",
+    "' or 'x'='x", "\") or (\"a\"=\"a", "') or ('a'='a and hi\") or (\"a\"=\"a",
+    "hi' or 1=1 --", "' or a=a--", "admin' or '1'='1'/*", "1' or '1' = '1", "1 or 1 = 1",
+    "' OR ''-'", "' OR '' '", "' OR 1 IN (SELECT @@version)--", "') OR 1=1 LIMIT 1 OFFSET 1--",
+    "1 AND 5651=5651", "1' AND 8417=8417 AND 'Ypqx'='Ypqx", "1) AND 4410=4410 AND (2277=2277",
+    "-3753' OR 6483=6483#", "1' RLIKE (SELECT (CASE WHEN (5032=5032) THEN 1 ELSE 0x28 END))-- qrsT",
+    "' UNION SELECT username, password FROM users--", "1' UNION ALL SELECT NULL,CONCAT(0x71,user(),0x71)-- -",
+    "-1' union select 1,group_concat(table_name),3 from information_schema.tables--+",
+    "0 UNION SELECT banner FROM v$version WHERE rownum=1", "' UNION SELECT NULL FROM DUAL--",
+    "1 UnIoN SeLeCt 1,2,3", "9999 union all select load_file('/etc/passwd')",
+    "'; exec master..xp_cmdshell 'ping 10.10.1.2'--", "1; EXEC sp_configure 'show advanced options',1",
+    "'; TRUNCATE TABLE sessions; --", "1'; CREATE USER hacker IDENTIFIED BY 'p'--",
+    "10; ALTER TABLE users ADD x INT", "'; GRANT ALL ON *.* TO 'x'@'%'--",
+    "1' AND (SELECT 2341 FROM (SELECT(SLEEP(5)))xLvq)-- gnKl", "1) AND SLEEP(5) AND (1=1",
+    "1'; SELECT PG_SLEEP(5)--", "1' WAITFOR DELAY '0:0:10'--", "1 waitfor delay '00:00:05'",
+    "' OR BENCHMARK(5000000,SHA1(1))-- -", "1 AND 1=CAST((SELECT version()) AS int)",
+    "1' AND updatexml(1,concat(0x7e,(SELECT user())),1)-- -",
+    "' AND 1=(SELECT TOP 1 name FROM sysobjects)--", "1 AND ROW(1,1)>(SELECT COUNT(*),1)",
+    "1'/*!50000UNION*/ /*!50000SELECT*/ 1,2-- -", "1/**/UNION/**/SELECT/**/1,2",
+    "' INTO DUMPFILE '/var/www/shell.php'--", "1 ORDER BY 10-- -", "' GROUP BY columnnames HAVING 1=1 --",
+    "1' AND ASCII(SUBSTRING((SELECT password FROM users LIMIT 1),1,1))>64--",
+    "' or username is not null or username = '", "x' AND email IS NULL; --",
+    "1 || 1=1", "' && 1=1 -- ", "'=' 'or' and '=' 'or'",
+    # комментарии вместо пробелов
+    "admin'/**/OR/**/1=1--", "x' UNION/**/SELECT password FROM users--", "1/**/UNION/**/SELECT/**/1",
+    "'/**/or/**/'a'/**/=/**/'a", "9/**/union/**/all/**/select/**/user(),2--",
+)
+
+# Отложенный корпус обычных значений: поисковые запросы, имена, адреса,
+# текст со словами SQL и знаками препинания
+HELD_OUT_BENIGN = (
+    "iphone 15 pro max", "O'Reilly Media", "D'Angelo Russell", "rock 'n' roll hall of fame",
+    "Ben & Jerry's", "salt and pepper", "black or white", "tea or coffee?", "mother-in-law",
+    "select comfort mattress", "union station chicago", "drop shipping for beginners",
+    "order by phone", "delete my account", "how to update windows 11", "create account",
+    "insert coin to continue", "table for two at 7pm", "from russia with love", "where is my order",
+    "1=1 is trivially true", "2 + 2 = 4", "a > b and b > c", "x = y or y = z", "price: $19.99",
+    "50% off -- today only", "#hashtag #summer", "C# vs Java", "/* not a comment */ just text",
+    "john.doe@example.com", "+1 (555) 010-9999", "2024-03-15", "12:30:45", "3.14159",
+    "10 Downing St, London", "ул. Ленина, д. 5, кв. 12", "St. John's, NL",
+    "It's 5 o'clock somewhere", "don't stop me now", "she said \"hello\" and left",
+    "SELECT is a good grocery brand", "He won't, she can't; they didn't", "name; surname",
+    "I'd like 2 or 3 items", "Tom and Jerry = classic", "the sleep(8 hours) challenge",
+    "benchmark results 2024", "version 1.2.3-beta", "user_id", "first.last", "q=shoes&size=42",
+    "{\"a\": 1, \"b\": [2, 3]}", "<b>bold</b>", "path/to/file.txt", "SGVsbG8gV29ybGQ=",
+    "Smith, J. and Jones, K. (2019)", "AT&T", "M&M's", "L'Oréal Paris", "1 or 2 bedrooms",
+)
+
+# Значения строки запроса внутри URL (внедрение в середине строки и после
+# обычных слов) - проверяется analyze_http_request
+HELD_OUT_URLS = (
+    ("/user?id=1; DROP TABLE users--", True),
+    ("/items?id=1 UNION SELECT password FROM users", True),
+    ("/search?q=a b c d e f g h 1 UNION SELECT 1", True),
+    ("/news?cat=5&sort=date&page=2' OR '1'='1", True),
+    ("/p?ref=mail%27%20UNION%20SELECT%20null--", True),
+    ("/shop?q=red shoes size 42' AND SLEEP(5)-- x", True),
+    ("/user?id=42", False),
+    ("/search?q=tom and jerry&sort=price", False),
+    ("/blog/it's-a-kind-of-magic?utm_source=news", False),
+    ("/find?q=select comfort&where=chicago", False),
+)
+
+WORDS = ('admin', 'users', 'id', 'name', 'apple', 'report', 'x', 'test', 'login', 'item', 'data', 'shop',
+         'tom', 'jerry', 'john', 'secret', 'value', 'note', 'order', 'cart')
+
+
+def make_corpus() -> List[Tuple[str, bool]]:
+    """Размеченный корпус: (значение, атака ли) без значений из SEED_PAYLOADS"""
+    seeds = set(SEED_PAYLOADS)
+    corpus = [(value, True) for value in HELD_OUT_ATTACKS if value not in seeds]
+    corpus.extend((value, False) for value in HELD_OUT_BENIGN)
+    return corpus
+
+
+def url_quality(detector) -> dict:
+    """Доля верно размеченных URL из HELD_OUT_URLS и сами ошибки"""
+    errors = [url for url, malicious in HELD_OUT_URLS
+              if bool(detector.analyze_http_request('GET', url, {})) != malicious]
+    return {'accuracy': 1 - len(errors) / len(HELD_OUT_URLS), 'errors': errors}
+
+
+def quality(detector, corpus: List[Tuple[str, bool]]) -> dict:
+    tp = fp = fn = tn = 0
+    missed, false_alarms = [], []
+    for value, malicious in corpus:
+        found = bool(detector.detect(value))
+        if malicious and found:
+            tp += 1
+        elif malicious:
+            fn += 1
+            missed.append(value)
+        elif found:
+            fp += 1
+            false_alarms.append(value)
+        else:
+            tn += 1
+    return {
+        'recall': tp / max(1, tp + fn),
+        'precision': tp / max(1, tp + fp),
+        'fp_rate': fp / max(1, fp + tn),
+        'missed': sorted(set(missed))[:5],
+        'false_alarms': sorted(set(false_alarms))[:5]
+    }
+
+
+def throughput(engine, values: List[str], runs: int) -> float:
+    """
+    Лучшая из runs пропускная способность, значений в секунду. Каждый
+    замер - на новом детекторе, чтобы кеш результатов не переносился
+    между замерами (повторы внутри корпуса кешируются, как в трафике).
+    """
+    best = float('inf')
+    for _ in range(runs):
+        detector = engine()
+        started = time.perf_counter()
+        for value in values:
+            detector.detect(value)
+        best = min(best, time.perf_counter() - started)
+    return len(values) / best
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк движков обнаружения SQL-инъекций")
+    parser.add_argument("--repeat", type=int, default=20, help="сколько раз корпус проходится при замере скорости")
+    parser.add_argument("--runs", type=int, default=3, help="число замеров пропускной способности")
+    parser.add_argument("--long", type=int, default=8192, help="длина длинных значений, символов")
+    args = parser.parse_args()
+
+    corpus = make_corpus()
+    attacks = sum(1 for _, malicious in corpus if malicious)
+    # Повторы значений в замере кешируются, как повторы в трафике
+    values = [value for value, _ in corpus] * args.repeat
+    rng = random.Random(7)
+    long_values = [' '.join(rng.choice(WORDS) for _ in range(args.long // 5))[:args.long] + " and x = 'y" for _ in range(50)]
+
+    print(f"⏱  ДВИЖКИ SQLi: отложенный корпус {len(corpus)} значений ({attacks} атак), {len(HELD_OUT_URLS)} URL")
+    print("=" * 72)
+    for name, engine in SQLI_ENGINES.items():
+        detector = engine()
+        result = quality(detector, corpus)
+        urls = url_quality(detector)
+        mixed = throughput(engine, values, args.runs)
+        long = throughput(engine, long_values, args.runs)
+        print(f"\n   {name}:")
+        print(f"     полнота {result['recall']:6.1%} | точность {result['precision']:6.1%} "
+              f"| ложные срабатывания {result['fp_rate']:6.1%}")
+        print(f"     URL: верно {urls['accuracy']:6.1%}" + (f" | ошибки: {urls['errors']}" if urls['errors'] else ""))
+        print(f"     {mixed:10.0f} значений/с | длинные ({args.long} символов): {long:8.0f} значений/с")
+        if result['missed']:
+            print(f"     пропущено: {result['missed']}")
+        if result['false_alarms']:
+            print(f"     ложные: {result['false_alarms']}")
+    print("=" * 72)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+БЕНЧМАРК ХОЛОДНОГО СТАРТА API ДЕТЕКТОРА
+
+Замеряет в свежих процессах:
+  - import   - время импорта api.server (должно быть дешёвым: без БД и детектора)
+  - startup  - импорт + startup() (создание детектора и базы) + первый анализ
+
+Каждый замер запускается в новом интерпретаторе во временной папке,
+чтобы база данных создавалась с нуля. Возвращает код 1, если медиана
+превышает бюджет.
+
+Запуск: python detector/benchmarks/startup_benchmark.py --runs 7
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+SRC_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+IMPORT_SCRIPT = """
+import time
+started = time.perf_counter()
+import api.server
+print(time.perf_counter() - started)
+"""
+
+STARTUP_SCRIPT = """
+import time
+started = time.perf_counter()
+import api.server as server
+server.startup()
+server.get_detector().analyze_request('GET', '/search', {'q': 'apple'}, sandbox_id='bench')
+print(time.perf_counter() - started)
+server.shutdown()
+"""
+
+
+def measure(script: str, runs: int) -> list:
+    """Запускает скрипт в runs свежих процессах и возвращает замеры (секунды)"""
+    env = dict(os.environ, PYTHONPATH=SRC_PATH)
+    timings = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as workdir:
+            output = subprocess.run(
+                [sys.executable, "-c", script],
+                cwd=workdir, env=env, capture_output=True, text=True, check=True
+            ).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return timings
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк холодного старта API детектора")
+    parser.add_argument("--runs", type=int, default=5, help="число запусков каждого замера")
+    parser.add_argument("--import-budget", type=float, default=0.25, help="бюджет на импорт, секунды")
+    parser.add_argument("--startup-budget", type=float, default=0.5, help="бюджет на старт и первый запрос, секунды")
+    args = parser.parse_args()
+
+    # Прогревочный запуск: собирает .pyc, чтобы мерить холодный старт воркера, а не первую компиляцию
+    measure(IMPORT_SCRIPT, 1)
+
+    failed = False
+    print("⏱  ХОЛОДНЫЙ СТАРТ API ДЕТЕКТОРА")
+    print("=" * 60)
+    for name, script, budget in (
+        ("import", IMPORT_SCRIPT, args.import_budget),
+        ("startup", STARTUP_SCRIPT, args.startup_budget),
+    ):
+        timings = measure(script, args.runs)
+        median = statistics.median(timings)
+        status = "OK" if median <= budget else "ПРЕВЫШЕН БЮДЖЕТ"
+        failed = failed or median > budget
+        print(f"   {name:8} медиана {median * 1000:8.1f} мс | мин {min(timings) * 1000:8.1f} мс "
+              f"| бюджет {budget * 1000:.0f} мс | {status}")
+    print("=" * 60)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
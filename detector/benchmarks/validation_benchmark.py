@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+БЕНЧМАРК ПРОВЕРКИ И СЕРИАЛИЗАЦИИ ПАКЕТНЫХ ЗАПРОСОВ
+
+Сравнивает накладные расходы (без самого детектирования) для пакета
+из --items запросов /api/analyze/batch и такого же числа событий /api/events:
+  - pydantic  - модели LogData / AnalysisRequest / SecurityEvent на каждый
+                элемент и json.dumps ответа (как было в FastAPI версии)
+  - stdlib    - json.loads / json.dumps и проверка без подготовленной схемы
+  - fast      - api.codec: проверка по схеме за один проход и encode_json
+  - compact   - fast + краткие записи результатов (?compact=1)
+
+Результаты анализа для сериализации получаются настоящим детектором
+(без записи в базу) во временной папке. Если pydantic не установлен,
+соответствующая строка пропускается.
+
+Запуск: python detector/benchmarks/validation_benchmark.py --items 10000
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+SRC_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.insert(0, SRC_PATH)
+
+from api.codec import (  # noqa: E402
+    HAS_ORJSON, LOG_DATA_SCHEMA, SECURITY_EVENT_SCHEMA,
+    decode_json, encode_json, validate_list, compact_result
+)
+
+try:
+    from pydantic import BaseModel
+    HAS_PYDANTIC = True
+except ImportError:
+    HAS_PYDANTIC = False
+
+if HAS_PYDANTIC:
+    # Копии моделей из api/server.py (там они создаются только вместе с FastAPI)
+    class LogData(BaseModel):
+        method: str
+        url: str
+        params: Dict[str, Any]
+        headers: Optional[Dict[str, str]] = None
+        sandbox_id: str
+        timestamp: Optional[str] = None
+        source_ip: Optional[str] = None
+
+    class AnalysisRequest(BaseModel):
+        logs: List[LogData]
+
+    class SecurityEvent(BaseModel):
+        timestamp: float
+        event_type: str
+        source_ip: str
+        destination_ip: str
+        description: str
+        payload: str = None
+        user_agent: str = None
+        method: str = "GET"
+        url: str = None
+        sandbox_id: str = None
+
+
+PAYLOADS = ["apple", "admin' OR 1=1--", "<script>alert(1)</script>", "../../etc/passwd", "page=2&sort=asc"]
+
+
+def make_logs(count: int) -> List[Dict[str, Any]]:
+    return [
+        {
+            "method": "GET" if i % 3 else "POST",
+            "url": f"/search/{i % 50}",
+            "params": {"q": PAYLOADS[i % len(PAYLOADS)], "page": str(i % 10)},
+            "headers": {"User-Agent": "sqlmap/1.7"},
+            "sandbox_id": f"sandbox_{i % 8:03d}"
+        }
+        for i in range(count)
+    ]
+
+
+def make_events(count: int) -> List[Dict[str, Any]]:
+    return [
+        {
+            "timestamp": 1700000000.0 + i,
+            "event_type": "http_request",
+            "source_ip": f"10.0.{i % 256}.{i % 7}",
+            "destination_ip": "10.1.0.2",
+            "description": "mirrored request",
+            "payload": PAYLOADS[i % len(PAYLOADS)],
+            "user_agent": "ffuf/2.0"
+        }
+        for i in range(count)
+    ]
+
+
+def stdlib_validate(items: List[Any], schema: Dict[str, tuple], where: str) -> List[Dict[str, Any]]:
+    """Проверка в прежнем виде: словарь схемы разбирается для каждого элемента"""
+    results = []
+    for i, data in enumerate(items):
+        item_where = f"{where}[{i}]"
+        if not isinstance(data, dict):
+            raise ValueError(f"{item_where}: ожидается JSON объект")
+        result = {}
+        for field, (types, required, default) in schema.items():
+            value = data.get(field)
+            if value is None:
+                if required:
+                    raise ValueError(f"{item_where}.{field}: обязательное поле")
+                result[field] = default
+            elif not isinstance(value, types) or isinstance(value, bool):
+                raise ValueError(f"{item_where}.{field}: неверный тип")
+            else:
+                result[field] = value
+        results.append(result)
+    return results
+
+
+def timed(func, runs: int) -> float:
+    """Медиана времени вызова func() в секундах"""
+    func()  # прогрев
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def build_paths(logs_body: bytes, events_body: List[bytes], batch_response: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Возвращает {путь: {этап: функция}}"""
+    compact_response = dict(batch_response, results=[compact_result(r) for r in batch_response["results"]])
+    paths = {}
+
+    if HAS_PYDANTIC:
+        paths["pydantic"] = {
+            "batch validate": lambda: [log.model_dump() for log in AnalysisRequest(**json.loads(logs_body)).logs],
+            "events validate": lambda: [SecurityEvent(**json.loads(body)).model_dump() for body in events_body],
+            "batch serialize": lambda: json.dumps(batch_response, ensure_ascii=False).encode("utf-8"),
+        }
+
+    paths["stdlib"] = {
+        "batch validate": lambda: stdlib_validate(json.loads(logs_body)["logs"], LOG_DATA_SCHEMA, "body.logs"),
+        "events validate": lambda: [stdlib_validate([json.loads(body)], SECURITY_EVENT_SCHEMA, "body")[0] for body in events_body],
+        "batch serialize": lambda: json.dumps(batch_response, ensure_ascii=False).encode("utf-8"),
+    }
+    paths["fast"] = {
+        "batch validate": lambda: validate_list(decode_json(logs_body)["logs"], LOG_DATA_SCHEMA, "body.logs"),
+        "events validate": lambda: [validate_list([decode_json(body)], SECURITY_EVENT_SCHEMA, "body")[0] for body in events_body],
+        "batch serialize": lambda: encode_json(batch_response),
+    }
+    paths["compact"] = {
+        "batch serialize": lambda: encode_json(compact_response),
+    }
+    return paths
+
+
+def analyze_for_benchmark(logs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Прогоняет пакет через детектор (без записи в базу) во временной папке"""
+    from main import CyberRangeDetector
+
+    previous_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            results = CyberRangeDetector().analyze_batch(logs, persist=False)
+        finally:
+            os.chdir(previous_cwd)
+    return {
+        "success": True,
+        "total_requests": len(results),
+        "total_detections": sum(r["summary"]["total_detections"] for r in results),
+        "results": results
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк проверки и сериализации пакетных запросов")
+    parser.add_argument("--items", type=int, default=10000, help="размер пакета")
+    parser.add_argument("--runs", type=int, default=5, help="число замеров каждого этапа")
+    args = parser.parse_args()
+
+    logs = make_logs(args.items)
+    logs_body = json.dumps({"logs": logs}).encode("utf-8")
+    events_body = [json.dumps(event).encode("utf-8") for event in make_events(args.items)]
+    paths = build_paths(logs_body, events_body, analyze_for_benchmark(logs))
+
+    print(f"⏱  ПРОВЕРКА И СЕРИАЛИЗАЦИЯ: {args.items} элементов, orjson: {'да' if HAS_ORJSON else 'нет'}")
+    print("=" * 72)
+    if not HAS_PYDANTIC:
+        print("   pydantic не установлен - сравнение с моделями пропущено")
+
+    stages = ("batch validate", "events validate", "batch serialize")
+    for stage in stages:
+        print(f"\n   {stage}:")
+        baseline = None
+        for name, funcs in paths.items():
+            func = funcs.get(stage)
+            if func is None:
+                continue
+            seconds = timed(func, args.runs)
+            baseline = baseline or seconds
+            print(f"     {name:9} {seconds * 1000:9.1f} мс | {seconds / args.items * 1e6:7.2f} мкс/элемент "
+                  f"| x{baseline / seconds:5.2f}")
+    print("=" * 72)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""
+БЫСТРАЯ ПРОВЕРКА И СЕРИАЛИЗАЦИЯ JSON ДЛЯ ЭНДПОИНТОВ API
+
+Проверка идёт по схемам (поле -> (типы, обязательное, по умолчанию)) за один
+проход по уже декодированному JSON, без создания моделей на каждый элемент.
+Ответы кодируются сразу в байты: через orjson, если он установлен, иначе
+через заранее созданный компактный json.JSONEncoder.
+"""
+
+import json
+from typing import Any, Dict, List
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+
+class RequestValidationError(ValueError):
+    """Ошибка проверки входных данных (ответ 422)"""
+    pass
+
+
+# Схемы входных данных: поле -> (допустимые типы, обязательное, значение по умолчанию)
+LOG_DATA_SCHEMA = {
+    "method": (str, True, None),
+    "url": (str, True, None),
+    "params": (dict, True, None),
+    "headers": (dict, False, None),
+    "sandbox_id": (str, True, None),
+    "timestamp": (str, False, None),
+    "source_ip": (str, False, None)
+}
+
+SECURITY_EVENT_SCHEMA = {
+    "timestamp": ((int, float), True, None),
+    "event_type": (str, True, None),
+    "source_ip": (str, True, None),
+    "destination_ip": (str, True, None),
+    "description": (str, True, None),
+    "payload": (str, False, None),
+    "user_agent": (str, False, None),
+    "method": (str, False, "GET"),
+    "url": (str, False, None),
+    "sandbox_id": (str, False, None)
+}
+
+# Подготовленные схемы: (поле, точные типы, обязательное, по умолчанию)
+_compiled_schemas: Dict[int, tuple] = {}
+
+
+def _compile(schema: Dict[str, tuple]) -> tuple:
+    compiled = _compiled_schemas.get(id(schema))
+    if compiled is None:
+        compiled = tuple(
+            (field, frozenset(types if isinstance(types, tuple) else (types,)), required, default)
+            for field, (types, required, default) in schema.items()
+        )
+        _compiled_schemas[id(schema)] = compiled
+    return compiled
+
+
+class _SchemaError(Exception):
+    """Ошибка в объекте без пути к нему: путь достраивает вызывающий (только при ошибке)"""
+    pass
+
+
+def _check(data: Any, compiled: tuple) -> Dict[str, Any]:
+    """
+    Проверяет один объект. Типы сравниваются точно: json.loads и orjson
+    не создают подклассов (bool не проходит как int)
+    """
+    if type(data) is not dict:
+        raise _SchemaError(": ожидается JSON объект")
+
+    result = {}
+    get = data.get
+    for field, exact_types, required, default in compiled:
+        value = get(field)
+        if value is None:
+            if required:
+                raise _SchemaError(f".{field}: обязательное поле")
+            value = default
+        elif type(value) not in exact_types:
+            raise _SchemaError(f".{field}: неверный тип")
+        result[field] = value
+    return result
+
+
+def validate_payload(data: Any, schema: Dict[str, tuple], where: str = "body") -> Dict[str, Any]:
+    """Проверяет словарь по схеме и возвращает его с подставленными значениями по умолчанию"""
+    try:
+        return _check(data, _compile(schema))
+    except _SchemaError as e:
+        raise RequestValidationError(f"{where}{e}")
+
+
+def validate_list(items: Any, schema: Dict[str, tuple], where: str = "body") -> List[Dict[str, Any]]:
+    """Проверяет список объектов по схеме за один проход"""
+    if type(items) is not list:
+        raise RequestValidationError(f"{where}: ожидается список")
+    compiled = _compile(schema)
+    results = []
+    append = results.append
+    try:
+        for item in items:
+            append(_check(item, compiled))
+    except _SchemaError as e:
+        # Номер ошибочного элемента - число уже проверенных: путь строится только при ошибке
+        raise RequestValidationError(f"{where}[{len(results)}]{e}")
+    return results
+
+
+# ===== СЕРИАЛИЗАЦИЯ =====
+
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), check_circular=False)
+
+
+def decode_json(body: bytes) -> Any:
+    """Декодирует тело запроса (RequestValidationError при некорректном JSON)"""
+    try:
+        if HAS_ORJSON:
+            return orjson.loads(body)
+        return json.loads(body.decode("utf-8"))
+    except (UnicodeDecodeError, ValueError) as e:
+        raise RequestValidationError(f"некорректный JSON: {e}")
+
+
+def encode_json(data: Any) -> bytes:
+    """Кодирует ответ сразу в байты UTF-8"""
+    if HAS_ORJSON:
+        return orjson.dumps(data)
+    return _encoder.encode(data).encode("utf-8")
+
+
+def compact_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Компактная запись результата анализа: без образцов входа и шаблонов правил"""
+    detections = result['detections']
+    return {
+        "request_id": result['request_info']['request_id'],
+        "risk_level": result['summary']['risk_level'],
+        "detections": len(detections),
+        "types": sorted({detection['type'] for detection in detections})
+    }
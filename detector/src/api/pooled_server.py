@@ -0,0 +1,75 @@
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import HTTPServer
+
+# Ответ, который получает клиент, когда все рабочие потоки и очередь заняты
+_OVERLOADED_BODY = b'{"error": "server overloaded"}'
+OVERLOADED_RESPONSE = (
+    b"HTTP/1.1 503 Service Unavailable\r\n"
+    b"Content-Type: application/json\r\n"
+    b"Content-Length: " + str(len(_OVERLOADED_BODY)).encode() + b"\r\n"
+    b"Retry-After: 1\r\n"
+    b"Connection: close\r\n"
+    b"\r\n" + _OVERLOADED_BODY
+)
+
+
+class PooledHTTPServer(HTTPServer):
+    """
+    HTTP сервер с ограниченным пулом рабочих потоков.
+
+    Каждое соединение обслуживается потоком из пула (с поддержкой keep-alive,
+    если обработчик работает по HTTP/1.1). Одновременно принимается не больше
+    max_workers + max_pending соединений; лишние сразу получают 503, чтобы
+    сервер не накапливал бесконечную очередь.
+
+    queue_delay() - сколько ждало в очереди последнее соединение, взятое
+    в работу (источник задержки для контроля нагрузки).
+    """
+
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, server_address, handler_class, max_workers: int = 16, max_pending: int = 64):
+        super().__init__(server_address, handler_class)
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="detector-http")
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._last_wait = 0.0
+        self._last_wait_at = 0.0
+
+    def process_request(self, request, client_address):
+        """Передаёт соединение в пул или отклоняет его при перегрузке"""
+        if not self._slots.acquire(blocking=False):
+            try:
+                request.sendall(OVERLOADED_RESPONSE)
+            except OSError:
+                pass
+            self.shutdown_request(request)
+            return
+        self._pool.submit(self._process_in_worker, request, client_address, time.monotonic())
+
+    def queue_delay(self) -> float:
+        """Ожидание последнего соединения в очереди (устаревает через секунду)"""
+        if time.monotonic() - self._last_wait_at > 1.0:
+            return 0.0
+        return self._last_wait
+
+    def _process_in_worker(self, request, client_address, accepted_at):
+        now = time.monotonic()
+        self._last_wait = now - accepted_at
+        self._last_wait_at = now
+        try:
+            request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=False, cancel_futures=True)
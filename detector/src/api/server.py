@@ -1,12 +1,20 @@
 #!/usr/bin/env python3
 """
 API СЕРВЕР ДЛЯ СИСТЕМЫ ДЕТЕКТИРОВАНИЯ АТАК
+
+Импорт модуля ничего не печатает и не трогает базу данных: детектор
+создаётся при старте приложения (lifespan FastAPI или run_server),
+либо при первом обращении через get_detector().
 """
 
 import sys
 import os
-import json
 import time
+import random
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from datetime import datetime
 from typing import Dict, Any, List, Optional
 
@@ -15,24 +23,19 @@ current_dir = os.path.dirname(__file__)  # папка где находится
 src_path = os.path.abspath(os.path.join(current_dir, '..'))  # папка src
 detector_path = os.path.abspath(os.path.join(current_dir, '..', '..'))  # папка detector
 
-# Добавляем пути в правильном порядке
-sys.path.insert(0, src_path)      # сначала папка src
-sys.path.insert(0, detector_path) # потом папка detector
-
-print("🔧 Настройка путей импорта:")
-print(f"   Текущая папка: {current_dir}")
-print(f"   Папка src: {src_path}")
-print(f"   Папка detector: {detector_path}")
+# Добавляем пути в правильном порядке (только если их ещё нет)
+for import_path in (src_path, detector_path):  # в итоге: detector, затем src
+    if import_path not in sys.path:
+        sys.path.insert(0, import_path)
 
 # ===== ИМПОРТ ВНЕШНИХ БИБЛИОТЕК =====
 try:
-    from fastapi import FastAPI, HTTPException
+    from fastapi import FastAPI, HTTPException, Request, Response
+    from fastapi.responses import JSONResponse
     from pydantic import BaseModel
+    from starlette.concurrency import run_in_threadpool
     HAS_FASTAPI = True
-    print("✅ FastAPI и Pydantic успешно импортированы!")
-except ImportError as e:
-    print(f"⚠️  FastAPI не установлен: {e}")
-    print("   Запускаем в упрощённом режиме...")
+except ImportError:
     HAS_FASTAPI = False
     # Создаем заглушки для типов
     class BaseModel:
@@ -41,13 +44,11 @@ except ImportError as e:
 # ===== ИМПОРТ НАШЕЙ СИСТЕМЫ =====
 try:
     # Пробуем разные пути импорта
-    from main import CyberRangeDetector
-    print("✅ Система детектирования загружена (прямой импорт)!")
+    from main import CyberRangeDetector, EVALUATION_MODES
 except ImportError as e:
     try:
         # Альтернативный путь
-        from src.main import CyberRangeDetector
-        print("✅ Система загружена (альтернативный путь)!")
+        from src.main import CyberRangeDetector, EVALUATION_MODES
     except ImportError as e2:
         print(f"❌ Критическая ошибка импорта: {e2}")
         print("Доступные пути в sys.path:")
@@ -55,22 +56,653 @@ except ImportError as e:
             print(f"   - {path}")
         sys.exit(1)
 
-# ===== ИНИЦИАЛИЗАЦИЯ ДЕТЕКТОРА =====
-detector = CyberRangeDetector()
-print("🎯 Детектор атак инициализирован!")
+from services.logging_service import setup_logging, shutdown_logging, get_logger, get_queue_depth, get_dropped_count
+from services import metrics
+from services.event_store import MemoryEventStore, DatabaseEventStore
+from services.micro_batcher import MicroBatcher
+from services.admission import AdmissionController, OverloadedError
+from services.correlation import CorrelationEngine
+from api.codec import (
+    RequestValidationError, LOG_DATA_SCHEMA, SECURITY_EVENT_SCHEMA,
+    validate_payload, validate_list, decode_json, encode_json, compact_result
+)
+from services.shared_counters import SharedCounters
+from database.db_manager import DEFAULT_DB_PATH
+from services.stats_service import SHARED_KEYS, STAT_KEYS
+from services.sharding import ShardedAnalyzer, ShardUnavailableError
+from services.tracing import RequestTrace
+from services.id_generator import format_id
+
+# ===== РЕЖИМ РАБОТЫ =====
+# При DETECTOR_WORKERS > 1 (или явном DETECTOR_SHARED_STATE) счётчики живут
+# в разделяемой памяти, а события - в базе данных, чтобы все воркеры
+# uvicorn возвращали одинаковые данные.
+WORKERS = int(os.environ.get("DETECTOR_WORKERS", "1"))
+
+# Шардированный анализ: при DETECTOR_SHARDS > 1 запросы распределяются по
+# sandbox_id между процессами-шардами (все запросы песочницы - в одном
+# шарде по порядку). Статистика шардов сводится через разделяемую память.
+# Пул шардов один на хост, поэтому вместе с DETECTOR_WORKERS > 1 не
+# запускается (каждый воркер uvicorn поднял бы свой пул).
+SHARDS = int(os.environ.get("DETECTOR_SHARDS", "0"))
+# Сколько ждать ответа шарда, прежде чем ответить 503 (секунды)
+SHARD_TIMEOUT = float(os.environ.get("DETECTOR_SHARD_TIMEOUT", "30"))
+SHARED_STATE_NAME = os.environ.get(
+    "DETECTOR_SHARED_STATE", "cyber_range_detector" if WORKERS > 1 or SHARDS > 1 else ""
+)
+
+# События /api/events анализируются микропакетами: не больше EVENT_BATCH_SIZE
+# событий, ожидание добора пакета - не дольше EVENT_BATCH_DELAY_MS
+EVENT_BATCH_SIZE = int(os.environ.get("DETECTOR_EVENT_BATCH_SIZE", "256"))
+EVENT_BATCH_DELAY_MS = float(os.environ.get("DETECTOR_EVENT_BATCH_DELAY_MS", "5"))
+
+# Контроль нагрузки: лимиты одновременно обрабатываемых запросов на эндпоинт
+# и на sandbox_id, допустимая задержка очередей; DETECTOR_DEGRADED_MODE=1
+# разрешает под нагрузкой анализировать без записи в базу
+MAX_IN_FLIGHT = int(os.environ.get("DETECTOR_MAX_IN_FLIGHT", "64"))
+MAX_IN_FLIGHT_EVENTS = int(os.environ.get("DETECTOR_MAX_IN_FLIGHT_EVENTS", "1024"))
+MAX_IN_FLIGHT_PER_SANDBOX = int(os.environ.get("DETECTOR_MAX_IN_FLIGHT_PER_SANDBOX", "32"))
+MAX_QUEUE_DELAY_MS = float(os.environ.get("DETECTOR_MAX_QUEUE_DELAY_MS", "500"))
+DEGRADED_MODE = os.environ.get("DETECTOR_DEGRADED_MODE", "0") == "1"
+
+# Корреляция по атакующим: окно (секунды) и порог оповещения "сканер"
+# (обнаружений от одного source_ip за окно)
+CORRELATION_WINDOW = float(os.environ.get("DETECTOR_CORRELATION_WINDOW", "60"))
+SCANNER_THRESHOLD = int(os.environ.get("DETECTOR_SCANNER_THRESHOLD", "20"))
+
+# Трассировка запросов анализа: ?trace=1 или заголовок X-Detector-Trace: 1
+# возвращают разбивку по участкам в ответе. Кроме того, доля
+# DETECTOR_TRACE_SAMPLE_RATE запросов трассируется молча, и те из них, что
+# дольше DETECTOR_SLOW_REQUEST_MS, попадают в журнал медленных запросов
+TRACE_HEADER = "X-Detector-Trace"
+TRACE_SAMPLE_RATE = float(os.environ.get("DETECTOR_TRACE_SAMPLE_RATE", "0"))
+SLOW_REQUEST_MS = float(os.environ.get("DETECTOR_SLOW_REQUEST_MS", "250"))
+
+# Размер порции, которой читается тело в /api/analyze/stream (байты) и
+# число потоков, сканирующих тела одновременно (остальные ждут в очереди)
+STREAM_CHUNK_SIZE = 64 * 1024
+STREAM_WORKERS = int(os.environ.get("DETECTOR_STREAM_WORKERS", "4"))
+
+# ===== ЛОГИРОВАНИЕ =====
+# Сообщения горячего пути идут через очередь с ограничением частоты
+# (очередь и поток вывода запускаются в startup())
+api_log = get_logger("api")
+events_log = get_logger("events")
+analysis_log = get_logger("analysis")
+stats_log = get_logger("stats")
+slow_log = get_logger("slow")
+
+# ===== ДЕТЕКТОР И ХРАНИЛИЩЕ СОБЫТИЙ (ЛЕНИВАЯ ИНИЦИАЛИЗАЦИЯ) =====
+_detector = None
+_event_store = None
+_event_batcher = None
+_sharder = None
+_detector_lock = threading.Lock()
+
+def get_detector() -> CyberRangeDetector:
+    """Возвращает детектор, создавая его (и базу данных) при первом вызове"""
+    global _detector, _event_store
+    if _detector is None:
+        with _detector_lock:
+            if _detector is None:
+                started = time.perf_counter()
+                shared = None
+                if SHARED_STATE_NAME:
+                    shared = SharedCounters(SHARED_STATE_NAME, SHARED_KEYS, baseline_keys=STAT_KEYS,
+                                            lock_dir=os.path.dirname(os.path.abspath(DEFAULT_DB_PATH)))
+                correlator = CorrelationEngine(window=CORRELATION_WINDOW, scanner_threshold=SCANNER_THRESHOLD)
+                detector = CyberRangeDetector(shared_counters=shared, correlator=correlator)
+                _event_store = DatabaseEventStore(detector.db_manager) if shared else MemoryEventStore()
+                _detector = detector
+                api_log.info("Детектор атак инициализирован", extra={
+                    "init_seconds": round(time.perf_counter() - started, 4),
+                    "shared_state": SHARED_STATE_NAME or None
+                })
+    return _detector
+
+def get_sharder() -> Optional[ShardedAnalyzer]:
+    """Возвращает диспетчер шардов (None, если шардированный анализ выключен)"""
+    global _sharder
+    if SHARDS > 1 and _sharder is None:
+        get_detector()  # схема базы создаётся до запуска шардов
+        with _detector_lock:
+            if _sharder is None:
+                sharder = ShardedAnalyzer(
+                    SHARDS, shared_name=SHARED_STATE_NAME,
+                    correlation={"window": CORRELATION_WINDOW, "scanner_threshold": SCANNER_THRESHOLD},
+                    result_timeout=SHARD_TIMEOUT
+                )
+                sharder.start()
+                _sharder = sharder
+    return _sharder
+
+def _analyzer():
+    """Где анализируются запросы: диспетчер шардов или детектор этого процесса"""
+    return get_sharder() or get_detector()
+
+def get_event_store():
+    """Возвращает хранилище событий (память процесса или общая база)"""
+    get_detector()
+    return _event_store
+
+def _record_admission(key: str):
+    """Учитывает решение контроля нагрузки в общей статистике"""
+    if _detector is not None:
+        _detector.stats_service.record_admission(key)
+
+admission = AdmissionController(
+    endpoint_limits={"events": MAX_IN_FLIGHT_EVENTS},
+    default_limit=MAX_IN_FLIGHT,
+    sandbox_limit=MAX_IN_FLIGHT_PER_SANDBOX,
+    max_queue_delay=MAX_QUEUE_DELAY_MS / 1000,
+    degraded_mode=DEGRADED_MODE,
+    on_shed=lambda endpoint, reason: _record_admission("shed_requests"),
+    on_degraded=lambda endpoint: _record_admission("degraded_requests")
+)
+admission.add_delay_probe("event_batcher", lambda: _event_batcher.queue_delay() if _event_batcher is not None else 0.0)
+
+def get_event_batcher() -> MicroBatcher:
+    """Возвращает (и при первом вызове запускает) пакетный обработчик событий"""
+    global _event_batcher
+    if _event_batcher is None:
+        with _detector_lock:
+            if _event_batcher is None:
+                batcher = MicroBatcher(
+                    _process_event_batch,
+                    max_batch=EVENT_BATCH_SIZE,
+                    max_delay=EVENT_BATCH_DELAY_MS / 1000,
+                    name="event-batcher"
+                )
+                batcher.start()
+                _event_batcher = batcher
+    return _event_batcher
+
+def config_error() -> Optional[str]:
+    """Описание несовместимых настроек режима работы (None, если их нет)"""
+    if WORKERS > 1 and SHARDS > 1:
+        return (f"DETECTOR_WORKERS={WORKERS} и DETECTOR_SHARDS={SHARDS} несовместимы: "
+                "пул шардов один на хост, используйте один воркер")
+    return None
+
+def startup():
+    """Запускает логирование и создаёт детектор до приёма запросов"""
+    error = config_error()
+    if error is not None:
+        raise RuntimeError(error)
+    setup_logging()
+    detector = get_detector()
+    get_sharder()
+    get_event_batcher()
+    detector.cardinality.start()
+    if detector.rules_reloader is not None:
+        detector.rules_reloader.start()
+
+def shutdown():
+    """Дообрабатывает принятые события и дописывает оставшиеся записи лога"""
+    if _event_batcher is not None:
+        _event_batcher.stop()
+    if _sharder is not None:
+        _sharder.stop()
+    if _detector is not None:
+        _detector.cardinality.stop()
+        if _detector.rules_reloader is not None:
+            _detector.rules_reloader.stop()
+    shutdown_logging()
+
+# ===== МЕТРИКИ ОЧЕРЕДЕЙ =====
+def _queue_depths():
+    depths = _event_store.depths() if _event_store is not None else {}
+    depths["event_batcher"] = _event_batcher.depth() if _event_batcher is not None else 0
+    depths["log_queue"] = get_queue_depth()
+    return [((name,), value) for name, value in depths.items()]
+
+metrics.REGISTRY.gauge("detector_queue_depth", "Глубина очередей и буферов", _queue_depths, ("queue",))
+metrics.REGISTRY.gauge(
+    "detector_log_dropped_total", "Записи лога, отброшенные при переполнении очереди",
+    get_dropped_count
+)
+
+
+# ===== ОБЩАЯ ЛОГИКА ЭНДПОИНТОВ =====
+# Используется и FastAPI версией, и упрощённым сервером, чтобы набор
+# эндпоинтов и формат ответов в обоих режимах совпадали.
+
+def api_root(mode: str) -> Dict[str, Any]:
+    """Главная страница API"""
+    return {
+        "message": "Cyber Range Detector API работает!",
+        "version": "1.0.0",
+        "mode": mode,
+        "endpoints": {
+            "analyze_single": "POST /api/analyze - анализ одного запроса (?mode=triage - быстрое решение о блокировке, ?mode=first - до первого обнаружения, ?trace=1 - разбивка времени)",
+            "analyze_batch": "POST /api/analyze/batch - анализ нескольких запросов (?compact=1 - краткие результаты, ?mode=triage|first, ?trace=1)",
+            "analyze_stream": "POST /api/analyze/stream - потоковый анализ большого тела (?url=, ?sandbox_id=, ?source_ip=)",
+            "get_rules": "GET /api/rules - текущий набор правил и его версия",
+            "reload_rules": "POST /api/rules/reload - перечитать пакет правил (DETECTOR_RULE_PACK) без перезапуска",
+            "get_stats": "GET /api/stats - получение статистики",
+            "get_recent": "GET /api/attacks/recent - последние атаки",
+            "health": "GET /health - проверка здоровья",
+            "receive_events": "POST /api/events - прием событий от детектора",  # НОВЫЙ
+            "get_events": "GET /api/events - получение событий",  # НОВЫЙ
+            "get_attacks": "GET /api/attacks - атаки из событий",
+            "get_alerts": "GET /api/correlation/alerts - оповещения корреляции (сканеры, комбинированные атаки)",
+            "get_campaigns": "GET /api/campaigns - кампании атакующих (?sandbox_id=, ?source_ip=)",
+            "get_cardinality": "GET /api/cardinality - уникальные атакующие и нагрузки (?sandbox_id=, ?metric=, ?start=, ?end=)",
+            "get_clusters": "GET /api/clusters - кластеры почти одинаковых нагрузок (?type=, ?limit=)",
+            "get_top": "GET /api/top - самые частые IP, URL, нагрузки и песочницы (?dimension=, ?limit=, ?window=)",
+            "metrics": "GET /metrics - метрики в формате Prometheus"
+        }
+    }
+
+def api_health(mode: str) -> Dict[str, Any]:
+    """Проверка здоровья сервиса"""
+    events_count, attacks_count = get_detector().stats_service.event_counts()
+    return {
+        "status": "healthy",
+        "service": "attack-detector",
+        "mode": mode,
+        "workers": WORKERS,
+        "detectors_loaded": True,
+        "events_count": events_count,  # НОВОЕ
+        "attacks_count": attacks_count  # НОВОЕ
+    }
+
+def submit_event(event: Dict[str, Any]):
+    """
+    Ставит событие в очередь микропакетов и возвращает Future с ответом.
+
+    Бросает OverloadedError, если контроль нагрузки не допустил событие.
+    """
+    ticket = admission.acquire("events", event.get("sandbox_id") or event["destination_ip"])
+    events_log.info("Получено событие", extra={"event_type": event["event_type"], "source_ip": event["source_ip"]})
+    try:
+        future = get_event_batcher().submit((event, ticket.degraded))
+    except Exception:
+        admission.release(ticket)
+        raise
+    future.add_done_callback(lambda _: admission.release(ticket))
+    return future
+
+def process_event(event: Dict[str, Any]) -> Dict[str, Any]:
+    """Сохраняет событие от детектора и анализирует его на атаки (с ожиданием ответа)"""
+    return submit_event(event).result()
+
+def _event_request(event: Dict[str, Any]) -> Dict[str, Any]:
+    """Представляет событие как HTTP запрос для CyberRangeDetector"""
+    params = {}
+    if event.get("payload"):
+        params["payload"] = event["payload"]
+    if event.get("user_agent"):
+        params["user_agent"] = event["user_agent"]
+    return {
+        "method": event.get("method") or "GET",
+        "url": event.get("url") or "/",
+        "params": params,
+        "sandbox_id": event.get("sandbox_id") or event["destination_ip"],
+        "source_ip": event["source_ip"]
+    }
+
+def _process_event_batch(items: List[tuple]) -> List[Dict[str, Any]]:
+    """
+    Анализирует пакет событий теми же детекторами, что и /api/analyze.
+
+    items - кортежи (событие, degraded). Анализ, запись в базу и обновление
+    счётчиков выполняются один раз на пакет; пакет не пишется в базу, только
+    если все его события приняты в упрощённом режиме. Возвращает ответы
+    в порядке событий.
+    """
+    detector = get_detector()
+    stats_service = detector.stats_service
+    events = [event for event, _ in items]
+    persist = not all(degraded for _, degraded in items)
+
+    results = _analyzer().analyze_batch([_event_request(event) for event in events], persist=persist)
+
+    received_at = datetime.now().isoformat()
+    event_ids = detector.ids.next_ids(len(events))
+    entries = []
+    responses = []
+    attacks = 0
+
+    for event_id, event, result in zip(event_ids, events, results):
+        event_data = dict(event)
+        event_data["received_at"] = received_at
+        event_data["event_id"] = event_id
+
+        detections = result['detections']
+        is_attack = bool(detections)
+        attack_type = None
+        attack_event = None
+
+        # Если обнаружена атака, сохраняем отдельно
+        if is_attack:
+            attack_type = _primary_attack_type(detections)
+            events_log.info("Обнаружена атака в событии", extra={"attack_type": attack_type, "source_ip": event["source_ip"]})
+            attack_event = {
+                "event_id": detector.ids.next_id(),
+                "timestamp": event["timestamp"],
+                "attack_type": attack_type,
+                "source_ip": event["source_ip"],
+                "destination_ip": event["destination_ip"],
+                "description": event["description"],
+                "payload": event.get("payload"),
+                "detected_at": received_at
+            }
+            attacks += 1
+
+        entries.append((event_data, attack_event))
+        responses.append({
+            "success": True,
+            "message": "Событие получено и проанализировано",
+            "event_id": format_id(event_id),
+            "request_id": result['request_info']['request_id'],
+            "is_attack": is_attack,
+            "attack_type": attack_type,
+            "risk_level": result['summary']['risk_level'],
+            "detections": len(detections),
+            "alerts": result['alerts'],
+            "received_data": {
+                "event_type": event["event_type"],
+                "source_ip": event["source_ip"],
+                "destination_ip": event["destination_ip"],
+                "description": event["description"]
+            }
+        })
+
+    get_event_store().add_many(entries)
+    stats_service.record_events(len(events), attacks)
+    _log_alerts(result['alerts'] for result in results)
+
+    events_log.info("Пакет событий обработан", extra={"batch_size": len(events), "attacks": attacks})
+    return responses
+
+_RISK_ORDER = {'CRITICAL': 4, 'HIGH': 3, 'MEDIUM': 2, 'LOW': 1}
+
+def _primary_attack_type(detections: List[Dict[str, Any]]) -> str:
+    """Тип самой опасной атаки ("sql_injection", "xss", "path_traversal")"""
+    top = max(detections, key=lambda d: _RISK_ORDER.get(d['risk_level'], 0))
+    return top['type'].lower()
+
+def _log_alerts(alert_lists):
+    """Пишет в лог оповещения корреляции (списки оповещений по запросам)"""
+    for alerts in alert_lists:
+        for alert in alerts:
+            analysis_log.warning("Оповещение корреляции", extra={
+                "alert_type": alert["type"],
+                "source_ip": alert["source_ip"],
+                "sandbox_id": alert["sandbox_id"]
+            })
+
+def _with_string_ids(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Копии записей хранилища с event_id строкой (см. format_id)"""
+    return [{**record, "event_id": format_id(record.get("event_id"))} for record in records]
+
+def list_events(limit: int = 10) -> Dict[str, Any]:
+    """Возвращает последние события"""
+    return {
+        "success": True,
+        "total_events": get_detector().stats_service.event_counts()[0],
+        "events": _with_string_ids(get_event_store().recent_events(limit))
+    }
+
+def list_attacks(limit: int = 10) -> Dict[str, Any]:
+    """Возвращает обнаруженные атаки"""
+    return {
+        "success": True,
+        "total_attacks": get_detector().stats_service.event_counts()[1],
+        "attacks": _with_string_ids(get_event_store().recent_attacks(limit))
+    }
+
+def rules_response() -> Dict[str, Any]:
+    """Текущий набор правил и состояние слежения за пакетом"""
+    detector = get_detector()
+    reloader = detector.rules_reloader
+    return {
+        "success": True,
+        "ruleset": detector.engine.summary(),
+        "triage": detector.engine.triage.costs(),
+        "reloader": reloader.status() if reloader is not None else None
+    }
+
+def reload_rules_response() -> Dict[str, Any]:
+    """Перечитывает пакет правил сейчас (ValueError, если пакет не настроен)"""
+    reloader = get_detector().rules_reloader
+    if reloader is None:
+        raise ValueError("пакет правил не настроен (DETECTOR_RULE_PACK)")
+    applied = reloader.check(force=True)
+    sharder = get_sharder()
+    if sharder is not None:
+        sharder.reload_rules()
+    return {**rules_response(), "applied": applied, "error": reloader.last_error}
+
+def _check_mode(mode: str) -> str:
+    """Проверяет режим проверки из параметра ?mode= (ValueError для неизвестного)"""
+    if mode not in EVALUATION_MODES:
+        raise ValueError(f"неизвестный режим проверки: {mode} (доступны: {', '.join(EVALUATION_MODES)})")
+    return mode
+
+def _trace_requested(value: Optional[str]) -> bool:
+    """Значение ?trace= или заголовка X-Detector-Trace включает трассировку"""
+    return value in ("1", "true")
+
+def new_trace(requested: bool, started: Optional[float] = None) -> Optional[RequestTrace]:
+    """
+    Трассировка запроса анализа: запрошенная клиентом или выборочная
+    (доля TRACE_SAMPLE_RATE, только для журнала медленных запросов); иначе None
+    """
+    if requested:
+        return RequestTrace(started)
+    if TRACE_SAMPLE_RATE > 0 and random.random() < TRACE_SAMPLE_RATE:
+        return RequestTrace(started, sampled=True)
+    return None
+
+def _finish_trace(trace: RequestTrace, endpoint: str, response: Dict[str, Any], **fields) -> Dict[str, Any]:
+    """Пишет медленный запрос в журнал и добавляет разбивку в ответ (если её запросили)"""
+    report = trace.report()
+    if report["total_ms"] >= SLOW_REQUEST_MS:
+        slow_log.warning("Медленный запрос", extra={"endpoint": endpoint, "trace": report, **fields})
+    if not trace.sampled:
+        response["trace"] = report
+    return response
+
+def analyze_log(log_data: Dict[str, Any], mode: str = "full", trace: Optional[RequestTrace] = None) -> Dict[str, Any]:
+    """
+    Анализирует один HTTP запрос на наличие атак (mode: full - все
+    обнаружения, first - первое обнаружение, triage - решение о блокировке;
+    trace - см. new_trace)
+    """
+    _check_mode(mode)
+    analysis_log.debug("Анализ запроса", extra={"method": log_data["method"], "url": log_data["url"]})
+
+    with admission.admit("analyze", log_data["sandbox_id"]) as ticket:
+        if trace is not None:
+            trace.add_since_last("admission")
+        result = _analyzer().analyze_request(
+            method=log_data["method"],
+            url=log_data["url"],
+            params=log_data["params"],
+            headers=log_data.get("headers"),
+            sandbox_id=log_data["sandbox_id"],
+            persist=not ticket.degraded,
+            source_ip=log_data.get("source_ip"),
+            mode=mode,
+            trace=trace
+        )
+    _log_alerts([result['alerts']])
+
+    analysis_log.info("Запрос проанализирован", extra={
+        "sandbox_id": log_data["sandbox_id"],
+        "detections": result['summary']['total_detections'],
+        "risk_level": result['summary']['risk_level']
+    })
+
+    response = {
+        "success": True,
+        "data": result,
+        "sandbox_id": log_data["sandbox_id"]
+    }
+    if trace is not None:
+        return _finish_trace(trace, "analyze", response, sandbox_id=log_data["sandbox_id"], url=log_data["url"])
+    return response
+
+def analyze_stream(body, method: str = "POST", url: str = "/", sandbox_id: Optional[str] = None,
+                   source_ip: Optional[str] = None) -> Dict[str, Any]:
+    """Анализирует большое тело запроса потоково (body - порции байтов или файлоподобный объект)"""
+    with admission.admit("analyze_stream", sandbox_id) as ticket:
+        result = get_detector().analyze_stream(
+            method, url, body, sandbox_id=sandbox_id, persist=not ticket.degraded, source_ip=source_ip
+        )
+    _log_alerts([result['alerts']])
 
-# ===== ХРАНИЛИЩЕ СОБЫТИЙ =====
-events_storage = []
-detected_attacks = []
+    analysis_log.info("Тело запроса проанализировано", extra={
+        "sandbox_id": sandbox_id,
+        "body_bytes": result['request_info']['body_bytes'],
+        "detections": result['summary']['total_detections']
+    })
+
+    return {
+        "success": True,
+        "data": result,
+        "sandbox_id": sandbox_id
+    }
+
+def analyze_batch(logs: List[Dict[str, Any]], compact: bool = False, mode: str = "full",
+                  trace: Optional[RequestTrace] = None) -> Dict[str, Any]:
+    """Анализирует несколько HTTP запросов (compact - краткие записи вместо полных результатов)"""
+    _check_mode(mode)
+    analysis_log.debug("Пакетный анализ", extra={"batch_size": len(logs)})
+
+    # Один проход детекторов на запрос и одна транзакция БД на весь пакет
+    # Пакет занимает место у каждой своей песочницы: сканер не обходит
+    # sandbox_limit, упаковывая запросы в пакеты
+    with admission.admit("analyze_batch", sandbox_ids=[log["sandbox_id"] for log in logs]) as ticket:
+        if trace is not None:
+            trace.add_since_last("admission")
+        results = _analyzer().analyze_batch(logs, persist=not ticket.degraded, mode=mode, trace=trace)
+    _log_alerts(result['alerts'] for result in results)
+    total_detections = sum(result['summary']['total_detections'] for result in results)
+
+    analysis_log.info("Пакет проанализирован", extra={"batch_size": len(results), "detections": total_detections})
+
+    if compact:
+        results = [compact_result(result) for result in results]
+
+    response = {
+        "success": True,
+        "total_requests": len(results),
+        "total_detections": total_detections,
+        "results": results
+    }
+    if trace is not None:
+        return _finish_trace(trace, "analyze_batch", response, batch_size=len(results))
+    return response
+
+def stats_response() -> Dict[str, Any]:
+    """Возвращает статистику работы системы"""
+    # Снимок из памяти: опрос дашбордами не нагружает базу
+    snapshot = get_detector().stats_service.snapshot()
+    stats_log.debug("Статистика запрошена", extra={"total_requests": snapshot['database_stats']['total_requests']})
+    sharder = get_sharder()
+    return {
+        "success": True,
+        **snapshot,
+        "admission": admission.snapshot(),
+        "sqli_engine": get_detector().sqli_engine,
+        "sharding": sharder.snapshot() if sharder is not None else None,
+        "correlation": sharder.correlation_snapshot() if sharder is not None else get_detector().correlator.snapshot(),
+        "cardinality": get_detector().cardinality.today()
+    }
+
+def cardinality_response(sandbox_id: Optional[str] = None, metric: Optional[str] = None,
+                         start: Optional[float] = None, end: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Оценки HyperLogLog за [start, end) (unix-время; по умолчанию - с начала
+    суток): по метрике и песочнице, либо сводка по всем песочницам
+    """
+    cardinality = get_detector().cardinality
+    sharder = get_sharder()
+    if sharder is not None:
+        sharder.flush()
+    now = time.time()
+    if start is None:
+        start = datetime.fromtimestamp(now).replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+    if end is None:
+        end = now + 1
+    if metric is None and sandbox_id is None:
+        return {"success": True, **cardinality.summary(start, end)}
+    metrics_to_report = (metric,) if metric else ("attackers", "payloads")
+    return {
+        "success": True,
+        "start": start,
+        "end": end,
+        "sandbox_id": sandbox_id,
+        "estimates": {name: cardinality.estimate(name, start, end, sandbox_id) for name in metrics_to_report}
+    }
+
+def clusters_response(detection_type: Optional[str] = None, limit: int = 50) -> Dict[str, Any]:
+    """Возвращает кластеры нагрузок (один образец на технику атаки), самые частые первыми"""
+    detector = get_detector()
+    detector.flush_clusters()
+    sharder = get_sharder()
+    if sharder is not None:
+        sharder.flush()
+    clusters = detector.db_manager.get_payload_clusters(limit, detection_type)
+    return {"success": True, "total": len(clusters), "clusters": clusters}
+
+def correlation_alerts_response(limit: int = 10) -> Dict[str, Any]:
+    """Возвращает последние оповещения корреляции"""
+    sharder = get_sharder()
+    alerts = sharder.recent_alerts(limit) if sharder is not None else get_detector().correlator.recent_alerts(limit)
+    return {"success": True, "total": len(alerts), "alerts": alerts}
+
+def top_response(dimension: Optional[str] = None, limit: int = 20, window: Optional[float] = None) -> Dict[str, Any]:
+    """Top-K по потоковым скетчам (без запросов к базе); без dimension - по всем измерениям"""
+    sharder = get_sharder()
+    if sharder is not None:
+        if dimension is None:
+            return {"success": True, **sharder.top_snapshot(limit, window)}
+        return {"success": True, "dimension": dimension, "top": sharder.top(dimension, limit, window)}
+    heavy_hitters = get_detector().heavy_hitters
+    if dimension is None:
+        return {"success": True, **heavy_hitters.snapshot(limit, window)}
+    return {"success": True, "dimension": dimension, "top": heavy_hitters.top(dimension, limit, window)}
+
+def campaigns_response(sandbox_id: Optional[str] = None, source_ip: Optional[str] = None, limit: int = 50) -> Dict[str, Any]:
+    """Возвращает активные кампании атакующих (для оценки по песочницам)"""
+    sharder = get_sharder()
+    correlator = sharder if sharder is not None else get_detector().correlator
+    campaigns = correlator.campaigns(sandbox_id=sandbox_id, source_ip=source_ip, limit=limit)
+    return {"success": True, "total": len(campaigns), "campaigns": campaigns}
+
+def recent_attacks_response(limit: int = 10) -> Dict[str, Any]:
+    """Возвращает последние обнаруженные атаки из базы"""
+    recent_attacks = get_detector().get_recent_detections(limit)
+
+    api_log.debug("Запрошены последние атаки", extra={"count": len(recent_attacks)})
+
+    return {
+        "success": True,
+        "limit": limit,
+        "total": len(recent_attacks),
+        "attacks": recent_attacks
+    }
 
 # ===== FASTAPI ВЕРСИЯ =====
 if HAS_FASTAPI:
-    
+
+    @asynccontextmanager
+    async def lifespan(app):
+        """Создаёт детектор при старте приложения, а не при импорте модуля"""
+        startup()
+        yield
+        shutdown()
+
     # Создаём приложение FastAPI
     app = FastAPI(
         title="Cyber Range Detector API",
         description="API для системы детектирования атак",
-        version="1.0.0"
+        version="1.0.0",
+        lifespan=lifespan
     )
 
     # Модели данных для API
@@ -81,6 +713,7 @@ if HAS_FASTAPI:
         headers: Optional[Dict[str, str]] = None
         sandbox_id: str
         timestamp: Optional[str] = None
+        source_ip: Optional[str] = None
 
     class AnalysisRequest(BaseModel):
         logs: List[LogData]
@@ -96,342 +729,491 @@ if HAS_FASTAPI:
         payload: str = None
         user_agent: str = None
         method: str = "GET"
+        url: str = None
+        sandbox_id: str = None
+
+    @app.exception_handler(OverloadedError)
+    async def overloaded_handler(request: Request, exc: OverloadedError):
+        """Отклонённые контролем нагрузки запросы получают 429 с Retry-After"""
+        return JSONResponse(
+            status_code=429,
+            content={"error": str(exc), "reason": exc.reason},
+            headers={"Retry-After": str(exc.retry_after)}
+        )
+
+    @app.exception_handler(ShardUnavailableError)
+    async def shard_unavailable_handler(request: Request, exc: ShardUnavailableError):
+        """Шард упал или не ответил вовремя: 503, запрос можно повторить"""
+        return JSONResponse(status_code=503, content={"error": str(exc)})
+
+    # ===== МЕТРИКИ ЗАПРОСОВ =====
+
+    @app.middleware("http")
+    async def observe_latency(request: Request, call_next):
+        """Записывает время обработки запроса в гистограмму по шаблону пути"""
+        started = time.perf_counter()
+        response = await call_next(request)
+        route = request.scope.get("route")
+        endpoint = route.path if route is not None else "other"
+        metrics.HTTP_REQUEST_SECONDS.labels(request.method, endpoint, str(response.status_code)).observe(
+            time.perf_counter() - started
+        )
+        return response
 
     # ===== ЭНДПОИНТЫ API =====
-    
+    # Эндпоинты, которые ждут базу данных, шарды или контроль нагрузки,
+    # объявлены обычными def: FastAPI выполняет их в пуле потоков, и цикл
+    # событий продолжает принимать запросы.
+
     @app.get("/")
     async def root():
         """Главная страница API"""
-        return {
-            "message": "Cyber Range Detector API работает!",
-            "version": "1.0.0",
-            "mode": "full",
-            "endpoints": {
-                "analyze_single": "POST /api/analyze - анализ одного запроса",
-                "analyze_batch": "POST /api/analyze/batch - анализ нескольких запросов",
-                "get_stats": "GET /api/stats - получение статистики", 
-                "get_recent": "GET /api/attacks/recent - последние атаки",
-                "health": "GET /health - проверка здоровья",
-                "receive_events": "POST /api/events - прием событий от детектора",  # НОВЫЙ
-                "get_events": "GET /api/events - получение событий"  # НОВЫЙ
-            }
-        }
+        return api_root("full")
+
+    @app.get("/metrics")
+    async def get_metrics():
+        """Метрики в текстовом формате Prometheus"""
+        return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
 
     @app.get("/health")
     async def health_check():
         """Проверка здоровья сервиса"""
-        return {
-            "status": "healthy", 
-            "service": "attack-detector",
-            "detectors_loaded": True,
-            "events_count": len(events_storage),  # НОВОЕ
-            "attacks_count": len(detected_attacks)  # НОВОЕ
-        }
+        return api_health("full")
 
     # === НОВЫЕ ENDPOINTS ДЛЯ ПРИЕМА СОБЫТИЙ ===
 
-    @app.post("/api/events")
-    async def receive_event(event: SecurityEvent):
+    # Высоконагруженные эндпоинты (события и пакетный анализ) проверяют сырой
+    # JSON по схемам api.codec и отдают готовые байты; модели Pydantic
+    # используются только для документации OpenAPI.
+    async def _read_validated(request: Request, schema: Dict[str, tuple]) -> Dict[str, Any]:
+        try:
+            return validate_payload(decode_json(await request.body()), schema)
+        except RequestValidationError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+
+    @app.post("/api/events", openapi_extra={"requestBody": {
+        "required": True, "content": {"application/json": {"schema": SecurityEvent.model_json_schema()}}
+    }})
+    async def receive_event(request: Request):
         """Принимает события от детектора и анализирует на атаки"""
+        event = await _read_validated(request, SECURITY_EVENT_SCHEMA)
         try:
-            print(f"📨 Получено событие: {event.event_type} от {event.source_ip}")
-            
-            # Сохраняем событие
-            event_data = event.dict()
-            event_data["received_at"] = datetime.now().isoformat()
-            event_data["event_id"] = f"event_{int(time.time())}_{len(events_storage)}"
-            events_storage.append(event_data)
-            
-            # Анализируем на атаки (упрощенная версия)
-            is_attack = False
-            attack_type = None
-            
-            # Простая логика детектирования
-            if event.payload:
-                payload_lower = event.payload.lower()
-                if any(sql_keyword in payload_lower for sql_keyword in ['select', 'union', 'drop', 'insert', '1=1']):
-                    is_attack = True
-                    attack_type = "sql_injection"
-                    print(f"🚨 Обнаружена SQL injection: {event.payload}")
-                elif any(xss_keyword in payload_lower for xss_keyword in ['<script>', 'javascript:', 'onload=']):
-                    is_attack = True
-                    attack_type = "xss"
-                    print(f"🚨 Обнаружена XSS атака: {event.payload}")
-            
-            # Если обнаружена атака, сохраняем отдельно
-            if is_attack:
-                attack_event = {
-                    "event_id": f"attack_{int(time.time())}_{len(detected_attacks)}",
-                    "timestamp": event.timestamp,
-                    "attack_type": attack_type,
-                    "source_ip": event.source_ip,
-                    "destination_ip": event.destination_ip,
-                    "description": event.description,
-                    "payload": event.payload,
-                    "detected_at": datetime.now().isoformat()
-                }
-                detected_attacks.append(attack_event)
-            
-            # Формируем ответ
-            response = {
-                "success": True,
-                "message": "Событие получено и проанализировано",
-                "event_id": event_data["event_id"],
-                "is_attack": is_attack,
-                "attack_type": attack_type,
-                "received_data": {
-                    "event_type": event.event_type,
-                    "source_ip": event.source_ip,
-                    "destination_ip": event.destination_ip,
-                    "description": event.description
-                }
-            }
-            
-            return response
-            
+            # Ожидание микропакета не занимает цикл событий
+            response = await asyncio.wrap_future(submit_event(event))
+            return Response(content=encode_json(response), media_type="application/json")
+        except (OverloadedError, ShardUnavailableError):
+            raise
         except Exception as e:
-            print(f"❌ Ошибка обработки события: {e}")
+            events_log.exception("Ошибка обработки события")
             raise HTTPException(status_code=500, detail=f"Ошибка обработки события: {str(e)}")
 
     @app.get("/api/events")
-    async def get_events(limit: int = 10):
+    def get_events(limit: int = 10):
         """Возвращает последние события"""
-        return {
-            "success": True,
-            "total_events": len(events_storage),
-            "events": events_storage[-limit:] if events_storage else []
-        }
+        return list_events(limit)
 
     @app.get("/api/attacks")
-    async def get_attacks(limit: int = 10):
+    def get_attacks(limit: int = 10):
         """Возвращает обнаруженные атаки"""
-        return {
-            "success": True,
-            "total_attacks": len(detected_attacks),
-            "attacks": detected_attacks[-limit:] if detected_attacks else []
-        }
+        return list_attacks(limit)
+
+    @app.get("/api/correlation/alerts")
+    def get_correlation_alerts(limit: int = 10):
+        """Возвращает последние оповещения корреляции"""
+        return correlation_alerts_response(limit)
+
+    @app.get("/api/campaigns")
+    def get_campaigns(sandbox_id: Optional[str] = None, source_ip: Optional[str] = None, limit: int = 50):
+        """Возвращает активные кампании атакующих"""
+        return campaigns_response(sandbox_id, source_ip, limit)
+
+    @app.get("/api/cardinality")
+    def get_cardinality(sandbox_id: Optional[str] = None, metric: Optional[str] = None,
+                        start: Optional[float] = None, end: Optional[float] = None):
+        """Уникальные атакующие и различные нагрузки за диапазон времени"""
+        try:
+            return cardinality_response(sandbox_id, metric, start, end)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    @app.get("/api/clusters")
+    def get_clusters(type: Optional[str] = None, limit: int = 50):
+        """Возвращает кластеры почти одинаковых нагрузок"""
+        return clusters_response(type, limit)
+
+    @app.get("/api/rules")
+    def get_rules():
+        """Текущий набор правил (версия, число правил, источник)"""
+        return rules_response()
+
+    @app.post("/api/rules/reload")
+    async def reload_rules():
+        """Перечитывает пакет правил без перезапуска"""
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, reload_rules_response)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    @app.get("/api/top")
+    def get_top(dimension: Optional[str] = None, limit: int = 20, window: Optional[float] = None):
+        """Самые частые IP, URL, отпечатки нагрузок и песочницы за окно"""
+        try:
+            return top_response(dimension, limit, window)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
     # === СУЩЕСТВУЮЩИЕ ENDPOINTS ===
 
     @app.post("/api/analyze")
-    async def analyze_single_request(log_data: LogData):
+    def analyze_single_request(log_data: LogData, request: Request, mode: str = "full", trace: str = "0"):
         """
-        Анализирует один HTTP запрос на наличие атак
+        Анализирует один HTTP запрос на наличие атак (в пуле потоков
+        FastAPI: ожидание контроля нагрузки и шардов не блокирует цикл событий)
         """
         try:
-            print(f"🔍 Анализ запроса: {log_data.method} {log_data.url}")
-            
-            result = detector.analyze_request(
-                method=log_data.method,
-                url=log_data.url,
-                params=log_data.params,
-                headers=log_data.headers,
-                sandbox_id=log_data.sandbox_id
-            )
-            
-            print(f"   Результат: {result['summary']['total_detections']} угроз")
-            
-            return {
-                "success": True,
-                "data": result,
-                "sandbox_id": log_data.sandbox_id
-            }
-            
+            request_trace = new_trace(_trace_requested(trace) or _trace_requested(request.headers.get(TRACE_HEADER)))
+            return analyze_log(log_data.dict(), mode, request_trace)
+        except (OverloadedError, ShardUnavailableError):
+            raise
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         except Exception as e:
-            print(f"❌ Ошибка анализа: {e}")
+            analysis_log.exception("Ошибка анализа")
             raise HTTPException(status_code=500, detail=f"Ошибка анализа: {str(e)}")
 
-    @app.post("/api/analyze/batch")
-    async def analyze_batch_requests(request: AnalysisRequest):
+    @app.post("/api/analyze/batch", openapi_extra={"requestBody": {
+        "required": True, "content": {"application/json": {"schema": {
+            "type": "object", "required": ["logs"],
+            "properties": {"logs": {"type": "array", "items": LogData.model_json_schema()}}
+        }}}
+    }})
+    async def analyze_batch_requests(request: Request, compact: bool = False, mode: str = "full", trace: str = "0"):
         """
         Анализирует несколько HTTP запросов одновременно
         """
+        request_trace = new_trace(_trace_requested(trace) or _trace_requested(request.headers.get(TRACE_HEADER)))
         try:
-            print(f"🔍 Пакетный анализ: {len(request.logs)} запросов")
-            
-            results = []
-            total_detections = 0
-            
-            for i, log_data in enumerate(request.logs):
-                result = detector.analyze_request(
-                    method=log_data.method,
-                    url=log_data.url,
-                    params=log_data.params,
-                    headers=log_data.headers,
-                    sandbox_id=log_data.sandbox_id
-                )
-                results.append(result)
-                total_detections += result['summary']['total_detections']
-                
-                if i % 10 == 0:  # Логируем каждые 10 запросов
-                    print(f"   Обработано: {i+1}/{len(request.logs)}")
-            
-            print(f"   Итого: {total_detections} угроз в {len(results)} запросах")
-            
-            return {
-                "success": True,
-                "total_requests": len(results),
-                "total_detections": total_detections,
-                "results": results
-            }
-            
+            body = decode_json(await request.body())
+            logs = validate_list(body.get("logs") if type(body) is dict else None, LOG_DATA_SCHEMA, "body.logs")
+        except RequestValidationError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        try:
+            if request_trace is not None:
+                request_trace.add_since_last("decode")
+            result = await run_in_threadpool(analyze_batch, logs, compact, mode, request_trace)
+            return Response(content=encode_json(result), media_type="application/json")
+        except (OverloadedError, ShardUnavailableError):
+            raise
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            analysis_log.exception("Ошибка пакетного анализа")
+            raise HTTPException(status_code=500, detail=f"Ошибка анализа: {str(e)}")
+
+    # Сканеры потоковых тел работают в отдельном ограниченном пуле: ожидая
+    # порции тела, они не занимают общий пул потоков цикла событий
+    _stream_executor = ThreadPoolExecutor(max_workers=STREAM_WORKERS, thread_name_prefix="stream")
+
+    @app.post("/api/analyze/stream")
+    async def analyze_stream_request(request: Request, method: str = "POST", url: str = "/",
+                                     sandbox_id: Optional[str] = None, source_ip: Optional[str] = None):
+        """
+        Анализирует сырое тело запроса (загрузки файлов) потоково, с
+        байтовыми смещениями обнаружений
+        """
+        # Порции тела читаются в цикле событий и передаются сканеру через
+        # ограниченную asyncio-очередь: тело не буферизуется целиком, а
+        # запись в очередь не занимает потоков
+        chunks = asyncio.Queue(maxsize=4)
+        loop = asyncio.get_running_loop()
+
+        def body_chunks():
+            while True:
+                chunk = asyncio.run_coroutine_threadsafe(chunks.get(), loop).result()
+                if chunk is None:
+                    return
+                yield chunk
+
+        future = loop.run_in_executor(
+            _stream_executor, analyze_stream, body_chunks(), method, url, sandbox_id, source_ip
+        )
+
+        async def put(chunk) -> bool:
+            # Если анализ завершился раньше (например, отклонён), очередь не читают
+            putting = asyncio.ensure_future(chunks.put(chunk))
+            await asyncio.wait((putting, future), return_when=asyncio.FIRST_COMPLETED)
+            if not putting.done():
+                putting.cancel()
+                return False
+            return True
+
+        try:
+            async for chunk in request.stream():
+                if chunk and not await put(chunk):
+                    break
+        finally:
+            if not future.done():
+                await put(None)
+        try:
+            return Response(content=encode_json(await future), media_type="application/json")
+        except (OverloadedError, ShardUnavailableError):
+            raise
         except Exception as e:
-            print(f"❌ Ошибка пакетного анализа: {e}")
+            analysis_log.exception("Ошибка потокового анализа")
             raise HTTPException(status_code=500, detail=f"Ошибка анализа: {str(e)}")
 
     @app.get("/api/stats")
-    async def get_statistics():
+    def get_statistics():
         """Возвращает статистику работы системы"""
         try:
-            memory_stats = detector.get_stats()
-            db_stats = detector.get_database_stats()
-            
-            stats = {
-                "success": True,
-                "memory_stats": memory_stats,
-                "database_stats": db_stats,
-                "summary": {
-                    "total_requests": db_stats['total_requests'],
-                    "total_attacks": db_stats['detected_attacks'],
-                    "attack_ratio": f"{(db_stats['detected_attacks'] / db_stats['total_requests'] * 100):.1f}%" if db_stats['total_requests'] > 0 else "0%",
-                    "detectors": {
-                        "sql_injection": db_stats['sql_injections'],
-                        "xss": db_stats['xss_attacks'], 
-                        "path_traversal": db_stats['path_traversals']
-                    }
-                },
-                "events_stats": {  # НОВАЯ СТАТИСТИКА
-                    "total_events": len(events_storage),
-                    "detected_attacks": len(detected_attacks),
-                    "events_attack_ratio": f"{(len(detected_attacks) / len(events_storage) * 100):.1f}%" if events_storage else "0%"
-                }
-            }
-            
-            print(f"📊 Статистика запрошена: {db_stats['total_requests']} запросов, {len(events_storage)} событий")
-            return stats
-            
+            return stats_response()
+        except ShardUnavailableError:
+            raise
         except Exception as e:
-            print(f"❌ Ошибка получения статистики: {e}")
+            stats_log.exception("Ошибка получения статистики")
             raise HTTPException(status_code=500, detail=f"Ошибка получения статистики: {str(e)}")
 
     @app.get("/api/attacks/recent")
-    async def get_recent_attacks(limit: int = 10):
+    def get_recent_attacks(limit: int = 10):
         """Возвращает последние обнаруженные атаки"""
         try:
-            recent_attacks = detector.get_recent_detections(limit)
-            
-            print(f"🕒 Запрошены последние {len(recent_attacks)} атак")
-            
-            return {
-                "success": True,
-                "limit": limit,
-                "total": len(recent_attacks),
-                "attacks": recent_attacks
-            }
-            
+            return recent_attacks_response(limit)
+        except ShardUnavailableError:
+            raise
         except Exception as e:
-            print(f"❌ Ошибка получения атак: {e}")
+            api_log.exception("Ошибка получения атак")
             raise HTTPException(status_code=500, detail=f"Ошибка получения атак: {str(e)}")
 
 # ===== УПРОЩЁННАЯ ВЕРСИЯ (БЕЗ FASTAPI) =====
 else:
-    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from http.server import BaseHTTPRequestHandler
     import urllib.parse
-    
+    from api.pooled_server import PooledHTTPServer
+
     class APIHandler(BaseHTTPRequestHandler):
-        
-        def _send_json_response(self, code, data):
-            """Отправляет JSON ответ"""
+        """
+        Обработчик упрощённого сервера.
+
+        Работает по HTTP/1.1 с keep-alive: соединение остаётся открытым,
+        пока клиент не пришлёт Connection: close или не простоит timeout секунд.
+        Если тело запроса не прочитано до конца (неизвестный путь, ошибка
+        проверки, тело у GET), соединение закрывается после ответа: иначе
+        остаток тела был бы разобран как следующий запрос.
+        """
+
+        protocol_version = "HTTP/1.1"
+        # Таймаут простоя keep-alive соединения (секунды)
+        timeout = 5
+        # Максимальный размер тела запроса (байты)
+        max_body_size = 16 * 1024 * 1024
+        # Максимальный размер потокового тела (/api/analyze/stream, байты)
+        max_stream_size = 1024 * 1024 * 1024
+
+        def _start_request(self):
+            """Запоминает время начала обработки запроса и объявленный размер тела"""
+            self._started = time.perf_counter()
+            self._endpoint = 'other'
+            # Сколько байт тела ещё не прочитано из соединения
+            self._body_unread = 0
+            if 'Transfer-Encoding' in self.headers:
+                self.close_connection = True  # chunked-тела не поддерживаются
+            content_length = self.headers.get('Content-Length')
+            if content_length is not None:
+                try:
+                    self._body_unread = int(content_length)
+                except ValueError:
+                    self.close_connection = True
+                if self._body_unread < 0:
+                    self._body_unread = 0
+                    self.close_connection = True
+
+        def _send_response(self, code, body, content_type, headers=None):
+            """Отправляет ответ и записывает время обработки"""
+            if self._body_unread > 0:
+                self.close_connection = True
             self.send_response(code)
-            self.send_header('Content-type', 'application/json')
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            if self.close_connection:
+                self.send_header('Connection', 'close')
             self.end_headers()
-            self.wfile.write(json.dumps(data, ensure_ascii=False).encode('utf-8'))
-        
+            self.wfile.write(body)
+            metrics.HTTP_REQUEST_SECONDS.labels(self.command, self._endpoint, str(code)).observe(
+                time.perf_counter() - self._started
+            )
+
+        def _send_json_response(self, code, data, headers=None):
+            """Отправляет JSON ответ"""
+            self._send_response(code, encode_json(data), 'application/json', headers)
+
+        def _read_json_body(self):
+            """Читает и декодирует JSON тело запроса"""
+            content_length = self.headers.get('Content-Length')
+            if content_length is None:
+                self.close_connection = True
+                raise RequestValidationError("требуется заголовок Content-Length")
+            length = self._body_unread
+            if length > self.max_body_size:
+                raise RequestValidationError("слишком большое тело запроса")
+            body = self.rfile.read(length)
+            self._body_unread -= len(body)
+            return decode_json(body)
+
         def _parse_query_params(self, path):
             """Парсит параметры запроса из URL"""
             if '?' in path:
                 query_string = path.split('?', 1)[1]
                 return dict(urllib.parse.parse_qsl(query_string))
             return {}
-        
-        def do_GET(self):
-            """Обрабатывает GET запросы"""
+
+        @staticmethod
+        def _number_param(query, name, kind, default=None):
+            """Числовой параметр запроса; неверное значение - 422, как проверка параметров FastAPI"""
+            value = query.get(name)
+            if value is None or value == '':
+                return default
+            try:
+                return kind(value)
+            except ValueError:
+                raise RequestValidationError(f"query.{name}: ожидается число")
+
+        def _limit_param(self, default=10):
+            return self._number_param(self._parse_query_params(self.path), 'limit', int, default)
+
+        def _get_top(self):
+            query = self._parse_query_params(self.path)
+            self._send_json_response(200, top_response(
+                query.get('dimension'), self._limit_param(20), self._number_param(query, 'window', float)
+            ))
+
+        def _get_cardinality(self):
+            query = self._parse_query_params(self.path)
+            self._send_json_response(200, cardinality_response(
+                query.get('sandbox_id'), query.get('metric'),
+                self._number_param(query, 'start', float), self._number_param(query, 'end', float)
+            ))
+
+        def _get_campaigns(self):
+            query = self._parse_query_params(self.path)
+            self._send_json_response(200, campaigns_response(
+                query.get('sandbox_id'), query.get('source_ip'), self._limit_param(50)
+            ))
+
+        def _dispatch(self, routes):
+            """Вызывает обработчик маршрута и отправляет ответ"""
+            self._start_request()
             path = self.path.split('?')[0]  # Убираем параметры
-            
-            if path == '/health':
-                self._send_json_response(200, {
-                    "status": "healthy", 
-                    "service": "attack-detector",
-                    "mode": "simple"
-                })
-            
-            elif path == '/':
-                self._send_json_response(200, {
-                    "message": "Cyber Range Detector API работает!",
-                    "version": "1.0.0", 
-                    "mode": "simple",
-                    "endpoints": ["/health", "/api/stats", "POST /api/analyze"]
-                })
-            
-            elif path == '/api/stats':
-                try:
-                    memory_stats = detector.get_stats()
-                    db_stats = detector.get_database_stats()
-                    self._send_json_response(200, {
-                        "success": True,
-                        "memory_stats": memory_stats,
-                        "database_stats": db_stats
-                    })
-                except Exception as e:
-                    self._send_json_response(500, {"error": str(e)})
-            
-            elif path == '/api/attacks/recent':
-                try:
-                    params = self._parse_query_params(self.path)
-                    limit = int(params.get('limit', 10))
-                    recent_attacks = detector.get_recent_detections(limit)
-                    self._send_json_response(200, {
-                        "success": True,
-                        "attacks": recent_attacks
-                    })
-                except Exception as e:
-                    self._send_json_response(500, {"error": str(e)})
-            
-            else:
+            handler = routes.get(path)
+            if handler is None:
                 self._send_json_response(404, {"error": f"Endpoint {path} not found"})
-        
+                return
+
+            self._endpoint = path
+            try:
+                handler(self)
+            except OverloadedError as e:
+                self._send_json_response(429, {"error": str(e), "reason": e.reason},
+                                         {"Retry-After": str(e.retry_after)})
+            except ShardUnavailableError as e:
+                self._send_json_response(503, {"error": str(e)})
+            except RequestValidationError as e:
+                self._send_json_response(422, {"error": str(e)})
+            except ValueError as e:
+                self._send_json_response(400, {"error": str(e)})
+            except Exception as e:
+                api_log.exception("Ошибка обработки запроса", extra={"path": path})
+                self._send_json_response(500, {"error": str(e)})
+
+        # === GET ===
+
+        def _get_metrics(self):
+            self._send_response(200, metrics.REGISTRY.render().encode('utf-8'), metrics.CONTENT_TYPE)
+
+        GET_ROUTES = {
+            '/': lambda self: self._send_json_response(200, api_root("simple")),
+            '/health': lambda self: self._send_json_response(200, api_health("simple")),
+            '/metrics': _get_metrics,
+            '/api/stats': lambda self: self._send_json_response(200, stats_response()),
+            '/api/events': lambda self: self._send_json_response(200, list_events(self._limit_param())),
+            '/api/attacks': lambda self: self._send_json_response(200, list_attacks(self._limit_param())),
+            '/api/attacks/recent': lambda self: self._send_json_response(200, recent_attacks_response(self._limit_param())),
+            '/api/correlation/alerts': lambda self: self._send_json_response(200, correlation_alerts_response(self._limit_param())),
+            '/api/campaigns': _get_campaigns,
+            '/api/top': _get_top,
+            '/api/cardinality': _get_cardinality,
+            '/api/rules': lambda self: self._send_json_response(200, rules_response()),
+            '/api/clusters': lambda self: self._send_json_response(200, clusters_response(
+                self._parse_query_params(self.path).get('type'), self._limit_param(50)
+            ))
+        }
+
+        # === POST ===
+
+        def _post_event(self):
+            event = validate_payload(self._read_json_body(), SECURITY_EVENT_SCHEMA)
+            self._send_json_response(200, process_event(event))
+
+        def _new_trace(self, query):
+            """Трассировка запроса анализа от начала обработки (см. new_trace)"""
+            requested = _trace_requested(query.get('trace')) or _trace_requested(self.headers.get(TRACE_HEADER))
+            return new_trace(requested, self._started)
+
+        def _post_analyze(self):
+            query = self._parse_query_params(self.path)
+            trace = self._new_trace(query)
+            log_data = validate_payload(self._read_json_body(), LOG_DATA_SCHEMA)
+            if trace is not None:
+                trace.add_since_last('decode')
+            self._send_json_response(200, analyze_log(log_data, query.get('mode', 'full'), trace))
+
+        def _post_analyze_stream(self):
+            if self.headers.get('Content-Length') is None:
+                self.close_connection = True
+                raise RequestValidationError("требуется заголовок Content-Length")
+            if self._body_unread > self.max_stream_size:
+                raise RequestValidationError("слишком большое тело запроса")
+
+            def body_chunks():
+                while self._body_unread > 0:
+                    chunk = self.rfile.read(min(self._body_unread, STREAM_CHUNK_SIZE))
+                    if not chunk:
+                        break
+                    self._body_unread -= len(chunk)
+                    yield chunk
+
+            query = self._parse_query_params(self.path)
+            result = analyze_stream(body_chunks(), query.get('method', 'POST'), query.get('url', '/'),
+                                    query.get('sandbox_id'), query.get('source_ip'))
+            self._send_json_response(200, result)
+
+        def _post_analyze_batch(self):
+            query = self._parse_query_params(self.path)
+            trace = self._new_trace(query)
+            body = self._read_json_body()
+            logs = validate_list(body.get("logs") if type(body) is dict else None, LOG_DATA_SCHEMA, "body.logs")
+            if trace is not None:
+                trace.add_since_last('decode')
+            compact = query.get('compact') in ('1', 'true')
+            self._send_json_response(200, analyze_batch(logs, compact, query.get('mode', 'full'), trace))
+
+        POST_ROUTES = {
+            '/api/events': _post_event,
+            '/api/analyze': _post_analyze,
+            '/api/analyze/batch': _post_analyze_batch,
+            '/api/analyze/stream': _post_analyze_stream,
+            '/api/rules/reload': lambda self: self._send_json_response(200, reload_rules_response())
+        }
+
+        def do_GET(self):
+            """Обрабатывает GET запросы"""
+            self._dispatch(self.GET_ROUTES)
+
         def do_POST(self):
             """Обрабатывает POST запросы"""
-            path = self.path
-            
-            if path == '/api/analyze':
-                content_length = int(self.headers['Content-Length'])
-                post_data = self.rfile.read(content_length)
-                
-                try:
-                    data = json.loads(post_data.decode('utf-8'))
-                    print(f"🔍 Анализ запроса: {data.get('method')} {data.get('url')}")
-                    
-                    result = detector.analyze_request(
-                        method=data['method'],
-                        url=data['url'],
-                        params=data['params'],
-                        headers=data.get('headers', {}),
-                        sandbox_id=data.get('sandbox_id', 'unknown')
-                    )
-                    
-                    self._send_json_response(200, {
-                        "success": True,
-                        "data": result
-                    })
-                    
-                except Exception as e:
-                    print(f"❌ Ошибка анализа: {e}")
-                    self._send_json_response(400, {"error": str(e)})
-            
-            else:
-                self._send_json_response(404, {"error": f"Endpoint {path} not found"})
-        
+            self._dispatch(self.POST_ROUTES)
+
         def log_message(self, format, *args):
             """Отключает стандартное логирование"""
             pass
@@ -452,9 +1234,22 @@ def run_server():
         print("📍 Статистика: http://localhost:8001/api/stats")
         print("📍 События: http://localhost:8001/api/events")  # НОВОЕ
         print("📍 Атаки: http://localhost:8001/api/attacks")   # НОВОЕ
+        if config_error() is not None:
+            print(f"❌ {config_error()}")
+            sys.exit(1)
+        if SHARDS > 1:
+            print(f"📍 Шардов анализа: {SHARDS} (по sandbox_id)")
+        if TRACE_SAMPLE_RATE > 0:
+            print(f"📍 Журнал медленных запросов: выборка {TRACE_SAMPLE_RATE:.0%}, порог {SLOW_REQUEST_MS:g} мс")
         print("="*50)
-        uvicorn.run(app, host="0.0.0.0", port=8001, log_level="info")
+        if WORKERS > 1:
+            # Несколько процессов: приложение передаётся строкой импорта
+            print(f"📍 Воркеров: {WORKERS} (общие счётчики: {SHARED_STATE_NAME})")
+            uvicorn.run("api.server:app", host="0.0.0.0", port=8001, log_level="info", workers=WORKERS)
+        else:
+            uvicorn.run(app, host="0.0.0.0", port=8001, log_level="info")
     else:
+        workers = int(os.environ.get("DETECTOR_HTTP_WORKERS", "16"))
         print("\n" + "="*50)
         print("🚀 ЗАПУСК УПРОЩЁННОГО HTTP СЕРВЕРА")
         print("="*50)
@@ -462,12 +1257,23 @@ def run_server():
         print("📍 Здоровье: http://localhost:8001/health")
         print("📍 Статистика: http://localhost:8001/api/stats")
         print("📍 Анализ: POST http://localhost:8001/api/analyze")
+        print("📍 События: http://localhost:8001/api/events")
+        print(f"📍 Рабочих потоков: {workers}")
+        if SHARDS > 1:
+            print(f"📍 Шардов анализа: {SHARDS} (по sandbox_id)")
+        if TRACE_SAMPLE_RATE > 0:
+            print(f"📍 Журнал медленных запросов: выборка {TRACE_SAMPLE_RATE:.0%}, порог {SLOW_REQUEST_MS:g} мс")
         print("="*50)
-        server = HTTPServer(('0.0.0.0', 8001), APIHandler)
+        startup()
+        server = PooledHTTPServer(('0.0.0.0', 8001), APIHandler, max_workers=workers)
+        admission.add_delay_probe("http_pool", server.queue_delay)
         try:
             server.serve_forever()
         except KeyboardInterrupt:
             print("\n🛑 Сервер остановлен")
+        finally:
+            server.server_close()
+            shutdown()
 
 if __name__ == "__main__":
-    run_server()
\ No newline at end of file
+    run_server()
@@ -1,12 +1,15 @@
 import sqlite3
 import json
-from datetime import datetime
-from typing import Dict, Any, List
+from datetime import date, datetime
+from typing import Dict, Any, Callable, List, Optional
+
+# База данных по умолчанию (относительно текущего каталога)
+DEFAULT_DB_PATH = "detector.db"
 
 class DatabaseManager:
     """Менеджер базы данных для сохранения результатов"""
     
-    def __init__(self, db_path: str = "detector.db"):
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
         self.db_path = db_path
         self._init_database()
     
@@ -39,10 +42,34 @@ class DatabaseManager:
                 pattern TEXT,
                 input_sample TEXT,
                 confidence TEXT,
+                cluster_id TEXT,
+                rule_id TEXT,
+                ruleset_version TEXT,
                 FOREIGN KEY (request_id) REFERENCES requests (id)
             )
         ''')
         
+        # Базы, созданные до кластеризации нагрузок и пакетов правил
+        cursor.execute('PRAGMA table_info(detections)')
+        columns = {row[1] for row in cursor.fetchall()}
+        for column in ('cluster_id', 'rule_id', 'ruleset_version'):
+            if column not in columns:
+                cursor.execute(f'ALTER TABLE detections ADD COLUMN {column} TEXT')
+        
+        # Кластеры почти одинаковых нагрузок: один образец на кластер
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS payload_clusters (
+                cluster_id TEXT PRIMARY KEY,
+                detection_type TEXT NOT NULL,
+                shape TEXT,
+                representative_sample TEXT,
+                signature BLOB,
+                hit_count INTEGER DEFAULT 0,
+                first_seen DATETIME DEFAULT CURRENT_TIMESTAMP,
+                last_seen DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
         # Таблица для статистики
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS statistics (
@@ -56,18 +83,49 @@ class DatabaseManager:
             )
         ''')
         
+        # Таблица для событий от детектора (общая для всех воркеров API)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                event_id INTEGER NOT NULL,
+                timestamp REAL,
+                event_type TEXT,
+                source_ip TEXT,
+                destination_ip TEXT,
+                description TEXT,
+                payload TEXT,
+                user_agent TEXT,
+                method TEXT,
+                received_at TEXT,
+                attack_id INTEGER,
+                attack_type TEXT,
+                detected_at TEXT
+            )
+        ''')
+        
+        # Часовые скетчи HyperLogLog (уникальные атакующие и нагрузки по песочницам)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS cardinality_sketches (
+                sandbox_id TEXT NOT NULL,
+                bucket_start INTEGER NOT NULL,
+                metric TEXT NOT NULL,
+                registers BLOB NOT NULL,
+                PRIMARY KEY (sandbox_id, bucket_start, metric)
+            )
+        ''')
+        
         conn.commit()
         conn.close()
     
-    def save_request(self, method: str, url: str, params: Dict[str, Any], sandbox_id: str = None) -> int:
-        """Сохраняет запрос в базу данных и возвращает ID"""
+    def save_request(self, method: str, url: str, params: Dict[str, Any], sandbox_id: str = None, request_id: int = None) -> int:
+        """Сохраняет запрос в базу данных и возвращает ID (если request_id не задан - автоинкремент)"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
         cursor.execute('''
-            INSERT INTO requests (method, url, params, sandbox_id)
-            VALUES (?, ?, ?, ?)
-        ''', (method, url, json.dumps(params), sandbox_id))
+            INSERT INTO requests (id, method, url, params, sandbox_id)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (request_id, method, url, json.dumps(params), sandbox_id))
         
         request_id = cursor.lastrowid
         conn.commit()
@@ -80,31 +138,121 @@ class DatabaseManager:
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
-        for detection in detections:
-            cursor.execute('''
-                INSERT INTO detections 
-                (request_id, detection_type, detection_subtype, risk_level, location, pattern, input_sample, confidence)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                request_id,
-                detection['type'],
-                detection.get('subtype', 'DIRECT'),
-                detection['risk_level'],
-                detection['location'],
-                detection.get('pattern', ''),
-                detection.get('input_sample', ''),
-                detection.get('confidence', 'MEDIUM')
-            ))
+        self._insert_detections(cursor, [(request_id, detection) for detection in detections])
+        
+        conn.commit()
+        conn.close()
+    
+    @staticmethod
+    def _detection_row(request_id: int, detection: Dict[str, Any]) -> tuple:
+        """
+        Значения строки таблицы detections.
+        
+        У детекций с cluster_id образец не хранится: он один на кластер
+        в payload_clusters.
+        """
+        cluster_id = detection.get('cluster_id')
+        return (
+            request_id,
+            detection['type'],
+            detection.get('subtype', 'DIRECT'),
+            detection['risk_level'],
+            detection['location'],
+            detection.get('pattern', ''),
+            '' if cluster_id else detection.get('input_sample', ''),
+            detection.get('confidence', 'MEDIUM'),
+            cluster_id,
+            detection.get('rule_id'),
+            detection.get('ruleset_version')
+        )
+    
+    def _insert_detections(self, cursor, pairs: List[tuple]):
+        """
+        Вставляет детекции (пары (request_id, detection)) в текущей транзакции
+        и увеличивает счётчики их кластеров. Кластер, которого ещё нет в базе
+        (например, созданный процессом повторного анализа), создаётся с
+        образцом первой детекции.
+        """
+        if not pairs:
+            return
+        cursor.executemany('''
+            INSERT INTO detections 
+            (request_id, detection_type, detection_subtype, risk_level, location, pattern, input_sample, confidence,
+             cluster_id, rule_id, ruleset_version)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [self._detection_row(request_id, detection) for request_id, detection in pairs])
+        
+        hits = {}
+        for _, detection in pairs:
+            cluster_id = detection.get('cluster_id')
+            if cluster_id:
+                entry = hits.get(cluster_id)
+                if entry is None:
+                    hits[cluster_id] = [detection['type'], detection.get('input_sample', ''), 1]
+                else:
+                    entry[2] += 1
+        if hits:
+            cursor.executemany('''
+                INSERT INTO payload_clusters (cluster_id, detection_type, representative_sample, hit_count)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(cluster_id) DO UPDATE SET
+                    hit_count = hit_count + excluded.hit_count,
+                    last_seen = CURRENT_TIMESTAMP
+            ''', [(cluster_id, attack_type, sample, count) for cluster_id, (attack_type, sample, count) in hits.items()])
+    
+    def save_payload_clusters(self, clusters: List[Dict[str, Any]]):
+        """Сохраняет новые кластеры (форма, образец, подпись MinHash); существующие не перезаписываются"""
+        if not clusters:
+            return
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.executemany('''
+            INSERT INTO payload_clusters (cluster_id, detection_type, shape, representative_sample, signature)
+            VALUES (:cluster_id, :detection_type, :shape, :representative_sample, :signature)
+            ON CONFLICT(cluster_id) DO UPDATE SET
+                shape = COALESCE(shape, excluded.shape),
+                signature = COALESCE(signature, excluded.signature)
+        ''', clusters)
         
         conn.commit()
         conn.close()
     
-    def update_statistics(self, stats: Dict[str, int]):
-        """Обновляет дневную статистику"""
+    def get_payload_clusters(self, limit: int = 50, detection_type: str = None,
+                             with_signatures: bool = False) -> List[Dict[str, Any]]:
+        """Кластеры нагрузок, самые частые первыми"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
-        today = datetime.now().date()
+        keys = ['cluster_id', 'detection_type', 'shape', 'representative_sample', 'hit_count', 'first_seen', 'last_seen']
+        if with_signatures:
+            keys.append('signature')
+        query = f"SELECT {', '.join(keys)} FROM payload_clusters"
+        args = []
+        if detection_type is not None:
+            query += ' WHERE detection_type = ?'
+            args.append(detection_type)
+        query += ' ORDER BY hit_count DESC LIMIT ?'
+        args.append(limit)
+        cursor.execute(query, args)
+        results = [dict(zip(keys, row)) for row in cursor.fetchall()]
+        
+        conn.close()
+        return results
+    
+    def update_statistics(self, stats: Dict[str, int], day: Optional[date] = None):
+        """Обновляет дневную статистику (day - за другой день, по умолчанию сегодня)"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        self._apply_statistics(cursor, stats, day)
+        
+        conn.commit()
+        conn.close()
+    
+    def _apply_statistics(self, cursor, stats: Dict[str, int], day: Optional[date] = None):
+        """Прибавляет приращения к дневной статистике в текущей транзакции"""
+        today = day or datetime.now().date()
         
         # Проверяем есть ли запись на сегодня
         cursor.execute('SELECT id FROM statistics WHERE date = ?', (today,))
@@ -142,9 +290,95 @@ class DatabaseManager:
                 stats['xss_attacks'],
                 stats['path_traversals']
             ))
+    
+    def save_analysis_batch(self, entries: List[tuple], stats: Optional[Dict[str, int]]) -> List[int]:
+        """
+        Сохраняет пакет проанализированных запросов одной транзакцией.
+        
+        entries - кортежи (request_id, method, url, params, sandbox_id, detections)
+        и необязательно время запроса в UTC ('YYYY-MM-DD HH:MM:SS', как
+        CURRENT_TIMESTAMP; для архивных логов), request_id может быть None
+        (автоинкремент);
+        stats - суммарные приращения дневной статистики за пакет
+        (None - статистику не менять, например при повторном анализе архива).
+        Возвращает ID запросов в порядке entries.
+        """
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        request_ids = []
+        detection_pairs = []
+        for entry in entries:
+            request_id, method, url, params, sandbox_id, detections = entry[:6]
+            timestamp = entry[6] if len(entry) > 6 else None
+            cursor.execute('''
+                INSERT INTO requests (id, method, url, params, sandbox_id, timestamp)
+                VALUES (?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+            ''', (request_id, method, url, json.dumps(params), sandbox_id, timestamp))
+            request_id = cursor.lastrowid
+            request_ids.append(request_id)
+            detection_pairs.extend((request_id, detection) for detection in detections)
+        
+        self._insert_detections(cursor, detection_pairs)
+        
+        if stats is not None:
+            self._apply_statistics(cursor, stats)
         
         conn.commit()
         conn.close()
+        
+        return request_ids
+    
+    def merge_sketches(self, rows: List[tuple], merge: Callable[[bytes, bytes], bytes]):
+        """
+        Сливает скетчи с сохранёнными одной транзакцией.
+        
+        rows - кортежи (sandbox_id, bucket_start, metric, registers);
+        merge(сохранённые, новые) возвращает объединённые регистры.
+        Транзакция берёт блокировку записи сразу (BEGIN IMMEDIATE), поэтому
+        одновременные сохранения разных воркеров не теряют друг друга.
+        """
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        cursor = conn.cursor()
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            for sandbox_id, bucket_start, metric, registers in rows:
+                cursor.execute('''
+                    SELECT registers FROM cardinality_sketches
+                    WHERE sandbox_id = ? AND bucket_start = ? AND metric = ?
+                ''', (sandbox_id, bucket_start, metric))
+                existing = cursor.fetchone()
+                if existing is not None and len(existing[0]) == len(registers):
+                    registers = merge(existing[0], registers)
+                cursor.execute('''
+                    INSERT OR REPLACE INTO cardinality_sketches (sandbox_id, bucket_start, metric, registers)
+                    VALUES (?, ?, ?, ?)
+                ''', (sandbox_id, bucket_start, metric, registers))
+            cursor.execute('COMMIT')
+        except Exception:
+            cursor.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+    
+    def get_sketches(self, metric: str, start: int, end: float, sandbox_id: str = None) -> List[tuple]:
+        """Скетчи метрики с началом часа в [start, end): кортежи (sandbox_id, registers)"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        query = '''
+            SELECT sandbox_id, registers FROM cardinality_sketches
+            WHERE metric = ? AND bucket_start >= ? AND bucket_start < ?
+        '''
+        args = [metric, start, end]
+        if sandbox_id is not None:
+            query += ' AND sandbox_id = ?'
+            args.append(sandbox_id)
+        cursor.execute(query, args)
+        rows = cursor.fetchall()
+        conn.close()
+        
+        return rows
     
     def get_daily_stats(self) -> Dict[str, Any]:
         """Возвращает статистику за сегодня"""
@@ -179,6 +413,90 @@ class DatabaseManager:
                 'path_traversals': 0
             }
     
+    def save_event(self, event_data: Dict[str, Any], attack_event: Dict[str, Any] = None):
+        """Сохраняет событие от детектора (и атаку, если она обнаружена)"""
+        self.save_events([(event_data, attack_event)])
+    
+    def save_events(self, entries: List[tuple]):
+        """Сохраняет пакет событий (кортежи (event_data, attack_event)) одной транзакцией"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.executemany('''
+            INSERT INTO events
+            (id, event_id, timestamp, event_type, source_ip, destination_ip, description,
+             payload, user_agent, method, received_at, attack_id, attack_type, detected_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [self._event_row(event_data, attack_event) for event_data, attack_event in entries])
+        
+        conn.commit()
+        conn.close()
+    
+    @staticmethod
+    def _event_row(event_data: Dict[str, Any], attack_event: Dict[str, Any] = None) -> tuple:
+        """Значения строки таблицы events (ID события - ключ строки)"""
+        attack_event = attack_event or {}
+        event_id = event_data['event_id']
+        return (
+            event_id if isinstance(event_id, int) else None,
+            event_id,
+            event_data.get('timestamp'),
+            event_data.get('event_type'),
+            event_data.get('source_ip'),
+            event_data.get('destination_ip'),
+            event_data.get('description'),
+            event_data.get('payload'),
+            event_data.get('user_agent'),
+            event_data.get('method'),
+            event_data.get('received_at'),
+            attack_event.get('event_id'),
+            attack_event.get('attack_type'),
+            attack_event.get('detected_at')
+        )
+    
+    def get_recent_events(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Возвращает последние события (в порядке поступления)"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT timestamp, event_type, source_ip, destination_ip, description,
+                   payload, user_agent, method, received_at, event_id
+            FROM events
+            ORDER BY id DESC
+            LIMIT ?
+        ''', (limit,))
+        
+        keys = ('timestamp', 'event_type', 'source_ip', 'destination_ip', 'description',
+                'payload', 'user_agent', 'method', 'received_at', 'event_id')
+        results = [dict(zip(keys, row)) for row in cursor.fetchall()]
+        
+        conn.close()
+        results.reverse()
+        return results
+    
+    def get_recent_event_attacks(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Возвращает последние атаки, обнаруженные в событиях (в порядке поступления)"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT attack_id, timestamp, attack_type, source_ip, destination_ip,
+                   description, payload, detected_at
+            FROM events
+            WHERE attack_id IS NOT NULL
+            ORDER BY id DESC
+            LIMIT ?
+        ''', (limit,))
+        
+        keys = ('event_id', 'timestamp', 'attack_type', 'source_ip', 'destination_ip',
+                'description', 'payload', 'detected_at')
+        results = [dict(zip(keys, row)) for row in cursor.fetchall()]
+        
+        conn.close()
+        results.reverse()
+        return results
+    
     def get_recent_detections(self, limit: int = 10) -> List[Dict[str, Any]]:
         """Возвращает последние обнаруженные атаки"""
         conn = sqlite3.connect(self.db_path)
@@ -186,9 +504,12 @@ class DatabaseManager:
         
         cursor.execute('''
             SELECT r.method, r.url, r.timestamp, r.sandbox_id,
-                   d.detection_type, d.detection_subtype, d.risk_level, d.location
+                   d.detection_type, d.detection_subtype, d.risk_level, d.location,
+                   d.cluster_id, COALESCE(NULLIF(d.input_sample, ''), c.representative_sample),
+                   d.rule_id, d.ruleset_version
             FROM detections d
             JOIN requests r ON d.request_id = r.id
+            LEFT JOIN payload_clusters c ON d.cluster_id = c.cluster_id
             ORDER BY r.timestamp DESC
             LIMIT ?
         ''', (limit,))
@@ -203,7 +524,11 @@ class DatabaseManager:
                 'type': row[4],
                 'subtype': row[5],
                 'risk_level': row[6],
-                'location': row[7]
+                'location': row[7],
+                'cluster_id': row[8],
+                'input_sample': row[9],
+                'rule_id': row[10],
+                'ruleset_version': row[11]
             })
         
         conn.close()
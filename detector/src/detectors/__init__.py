@@ -1,5 +1,10 @@
 from .sql_injection import SQLInjectionDetector
+from .sql_tokenizer import SQLTokenDetector
 from .xss_detector import XSSDetector
 from .path_traversal import PathTraversalDetector
+from .stream_scanner import StreamScanner
+from .rule_pack import PackDetector, RulePack, RulePackError, load_rule_pack
+from .triage import TriagePlan
 
-__all__ = ['SQLInjectionDetector', 'XSSDetector', 'PathTraversalDetector']
\ No newline at end of file
+__all__ = ['SQLInjectionDetector', 'SQLTokenDetector', 'XSSDetector', 'PathTraversalDetector', 'StreamScanner',
+           'PackDetector', 'RulePack', 'RulePackError', 'load_rule_pack', 'TriagePlan']
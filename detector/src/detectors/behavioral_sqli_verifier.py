@@ -1,26 +1,299 @@
+import json
+import logging
 import os
 import re
+import threading
+from typing import Dict, Any, Iterable, List, Optional
+
+try:
+    import mmap
+    HAS_MMAP = True
+except ImportError:
+    HAS_MMAP = False
+
+# Размер блока при буферизованном чтении новых данных
+READ_BLOCK_SIZE = 1024 * 1024
+# Начиная с какого объёма новых данных читать через mmap
+MMAP_THRESHOLD = 16 * 1024 * 1024
+# Сколько символов строки лога возвращать в совпадении
+MAX_LINE_SAMPLE = 1000
+
+logger = logging.getLogger("detector.verifier")
+
+
+def build_trie_pattern(tokens: Iterable[bytes]) -> bytes:
+    """
+    Строит регулярное выражение-префиксное дерево для набора строк.
+
+    Общие префиксы токенов проверяются один раз, поэтому поиск всех
+    токенов - один проход по данным, и стоимость почти не зависит от
+    числа токенов (в отличие от перебора "a|b|c" или K отдельных проходов).
+    """
+    trie: Dict[int, dict] = {}
+    for token in tokens:
+        node = trie
+        for byte in token:
+            node = node.setdefault(byte, {})
+        node[None] = {}  # конец токена
+
+    def emit(node: dict) -> bytes:
+        is_end = None in node
+        branches = [re.escape(bytes([byte])) + emit(child) for byte, child in sorted(
+            (item for item in node.items() if item[0] is not None), key=lambda item: item[0]
+        )]
+        if not branches:
+            return b''
+        body = branches[0] if len(branches) == 1 else b'(?:' + b'|'.join(branches) + b')'
+        if is_end:
+            # Более длинный токен важнее его префикса
+            return b'(?:' + body + b')?'
+        return body
+
+    # Пустой набор не должен совпадать ни с чем
+    return emit(trie) or b'(?!)'
+
 
 class BehavioralSQLiVerifier:
-    def __init__(self):
+    """
+    Проверяет, что SQL-инъекция действительно сработала: ищет в логах
+    токены-ловушки, которые есть только в базах данных песочниц.
+
+    У каждой песочницы свой токен (регистрируется в SandboxService бэкенда
+    и загружается через load_tokens), поэтому утечку можно отнести к
+    конкретной песочнице. Все токены собраны в одно выражение, и общий
+    лог всех песочниц проверяется за один проход.
+    """
+
+    def __init__(self, checkpoint_path: Optional[str] = None, tokens: Optional[Dict[str, str]] = None):
         # Это наша "ловушка" — секретный email в БД уязвимого приложения
+        # (общий токен без привязки к песочнице, sandbox_id = None)
         self.honeypot_email = "honeypot_cyberrange_12345@test.com"
-        self.pattern = re.compile(re.escape(self.honeypot_email), re.IGNORECASE)
 
-    def verify_from_access_log(self, log_file_path: str) -> bool:
+        # Индекс токенов: токен в нижнем регистре -> sandbox_id
+        self._tokens: Dict[str, Optional[str]] = {self.honeypot_email.lower(): None}
+        self._tokens_lock = threading.Lock()
+        self._bytes_pattern = None
+        if tokens:
+            self.load_tokens(tokens)
+
+        # Контрольные точки инкрементального режима: путь -> {device, inode, offset}
+        self.checkpoint_path = checkpoint_path
+        self.checkpoints: Dict[str, Dict[str, int]] = self._load_checkpoints()
+
+    # ===== ТОКЕНЫ ПЕСОЧНИЦ =====
+
+    def register_token(self, sandbox_id: str, token: str):
+        """
+        Добавляет (или заменяет) токен песочницы, например полученный из
+        GET /sandboxes/{sandbox_id}/honeypot-token бэкенда (с X-Service-Token)
+        """
+        with self._tokens_lock:
+            tokens = {key: owner for key, owner in self._tokens.items() if owner != sandbox_id}
+            tokens[token.lower()] = sandbox_id
+            self._set_tokens(tokens)
+
+    def unregister_sandbox(self, sandbox_id: str):
+        """Удаляет токены песочницы"""
+        with self._tokens_lock:
+            self._set_tokens({key: owner for key, owner in self._tokens.items() if owner != sandbox_id})
+
+    def load_tokens(self, tokens: Dict[str, str]):
+        """
+        Заменяет токены песочниц набором sandbox_id -> токен
+        (например, собранным при создании песочниц). Общий токен сохраняется.
+        """
+        index = {self.honeypot_email.lower(): None}
+        index.update({token.lower(): sandbox_id for sandbox_id, token in tokens.items()})
+        with self._tokens_lock:
+            self._set_tokens(index)
+
+    def tokens(self) -> Dict[str, Optional[str]]:
+        """Текущий индекс: токен -> sandbox_id"""
+        return dict(self._tokens)
+
+    def _set_tokens(self, tokens: Dict[str, Optional[str]]):
+        """Подменяет индекс; выражение пересобирается при следующем поиске"""
+        self._tokens = tokens
+        self._bytes_pattern = None
+
+    def _pattern(self):
+        """Одно выражение для всех токенов (собирается лениво, после изменения набора)"""
+        pattern = self._bytes_pattern
+        if pattern is None:
+            tokens = self._tokens
+            pattern = re.compile(build_trie_pattern(token.encode('utf-8') for token in tokens), re.IGNORECASE)
+            self._bytes_pattern = pattern
+        return pattern
+
+    # ===== ПРОВЕРКА =====
+
+    def verify_from_access_log(self, log_file_path: str, incremental: bool = False) -> bool:
         """
-        Читает файл логов и ищет нашу ловушку.
+        Читает файл логов и ищет наши ловушки.
         Если нашёл — значит, SQL-инъекция сработала.
+
+        incremental=True - проверяются только строки, дописанные после
+        прошлой проверки (см. scan_new).
+        """
+        if incremental:
+            return bool(self.scan_new(log_file_path))
+        return bool(self.scan_file(log_file_path))
+
+    def verify_sandboxes(self, log_file_path: str, incremental: bool = True) -> Dict[Optional[str], List[Dict[str, Any]]]:
+        """Один проход по логу: sandbox_id -> совпадения токенов этой песочницы"""
+        matches = self.scan_new(log_file_path) if incremental else self.scan_file(log_file_path)
+        leaks: Dict[Optional[str], List[Dict[str, Any]]] = {}
+        for match in matches:
+            leaks.setdefault(match['sandbox_id'], []).append(match)
+        return leaks
+
+    def scan_file(self, log_file_path: str) -> List[Dict[str, Any]]:
+        """Проверяет весь файл, не трогая контрольные точки"""
+        try:
+            with open(log_file_path, 'rb') as f:
+                end = os.fstat(f.fileno()).st_size
+                matches, consumed = self._scan_buffered(f, 0, end)
+                if consumed < end:
+                    # Последняя строка без перевода строки тоже проверяется
+                    f.seek(consumed)
+                    tail = f.read(end - consumed)
+                    matches.extend(self._find(tail, consumed, 0, len(tail)))
+        except FileNotFoundError:
+            return []
+        except OSError as e:
+            logger.warning("Ошибка чтения лога", extra={"path": log_file_path, "error": str(e)})
+            return []
+        for match in matches:
+            match['path'] = log_file_path
+        return matches
+
+    # ===== ИНКРЕМЕНТАЛЬНЫЙ РЕЖИМ =====
+
+    def scan_new(self, log_file_path: str) -> List[Dict[str, Any]]:
         """
-        if not os.path.exists(log_file_path):
-            return False
+        Проверяет только новые данные лога и возвращает совпадения.
 
+        Для каждого файла запоминаются устройство, inode и смещение после
+        последней полной строки. Если inode сменился (ротация) или файл
+        стал короче смещения (усечение), чтение начинается с начала файла.
+        Незавершённая последняя строка не учитывается до появления перевода
+        строки. Стоимость вызова пропорциональна объёму новых данных.
+
+        Совпадение: {'path', 'sandbox_id', 'token', 'offset' (байт начала
+        совпадения), 'line_offset' (байт начала строки), 'match', 'line'}.
+        """
         try:
-            with open(log_file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                for line in f:
-                    if self.pattern.search(line):
-                        return True
-        except Exception as e:
-            print(f"⚠️ Ошибка чтения лога {log_file_path}: {e}")
-            return False
-        return False
\ No newline at end of file
+            f = open(log_file_path, 'rb')
+        except FileNotFoundError:
+            return []
+        except OSError as e:
+            logger.warning("Ошибка чтения лога", extra={"path": log_file_path, "error": str(e)})
+            return []
+
+        with f:
+            stat = os.fstat(f.fileno())
+            checkpoint = self.checkpoints.get(log_file_path)
+            start = 0
+            if checkpoint is not None:
+                same_file = checkpoint['device'] == stat.st_dev and checkpoint['inode'] == stat.st_ino
+                if same_file and checkpoint['offset'] <= stat.st_size:
+                    start = checkpoint['offset']
+                elif same_file:
+                    logger.info("Лог усечён, проверка с начала", extra={"path": log_file_path})
+                else:
+                    logger.info("Лог ротирован, проверка нового файла", extra={"path": log_file_path})
+
+            end = stat.st_size
+            if end <= start:
+                matches, consumed = [], start
+            elif HAS_MMAP and end - start >= MMAP_THRESHOLD:
+                matches, consumed = self._scan_mmap(f, start, end)
+            else:
+                matches, consumed = self._scan_buffered(f, start, end)
+
+        for match in matches:
+            match['path'] = log_file_path
+
+        self.checkpoints[log_file_path] = {'device': stat.st_dev, 'inode': stat.st_ino, 'offset': consumed}
+        self._save_checkpoints()
+        return matches
+
+    def reset(self, log_file_path: Optional[str] = None):
+        """Забывает контрольную точку файла (или всех файлов)"""
+        if log_file_path is None:
+            self.checkpoints.clear()
+        else:
+            self.checkpoints.pop(log_file_path, None)
+        self._save_checkpoints()
+
+    def _find(self, data, base: int, pos: int, endpos: int) -> List[Dict[str, Any]]:
+        """Ищет ловушки в data[pos:endpos]; base - смещение data в файле"""
+        matches = []
+        tokens = self._tokens
+        for found in self._pattern().finditer(data, pos, endpos):
+            line_start = data.rfind(b'\n', pos, found.start()) + 1 or pos
+            line_end = data.find(b'\n', found.end(), endpos)
+            if line_end == -1:
+                line_end = endpos
+            line = bytes(data[line_start:line_end]).decode('utf-8', errors='replace').rstrip('\r')
+            token = found.group().decode('utf-8', errors='replace').lower()
+            matches.append({
+                'sandbox_id': tokens.get(token),
+                'token': token,
+                'offset': base + found.start(),
+                'line_offset': base + line_start,
+                'match': found.group().decode('utf-8', errors='replace'),
+                'line': line[:MAX_LINE_SAMPLE]
+            })
+        return matches
+
+    def _scan_buffered(self, f, start: int, end: int):
+        """Читает [start, end) большими блоками; возвращает (совпадения, смещение после последней строки)"""
+        f.seek(start)
+        matches = []
+        buffer = b''
+        buffer_offset = start
+        remaining = end - start
+        while remaining > 0:
+            block = f.read(min(READ_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            buffer += block
+            last_newline = buffer.rfind(b'\n')
+            if last_newline == -1:
+                continue
+            complete = last_newline + 1
+            matches.extend(self._find(buffer, buffer_offset, 0, complete))
+            buffer = buffer[complete:]
+            buffer_offset += complete
+        return matches, buffer_offset
+
+    def _scan_mmap(self, f, start: int, end: int):
+        """То же через mmap: без копирования больших объёмов в память процесса"""
+        with mmap.mmap(f.fileno(), end, access=mmap.ACCESS_READ) as mapped:
+            last_newline = mapped.rfind(b'\n', start, end)
+            if last_newline == -1:
+                return [], start
+            return self._find(mapped, 0, start, last_newline + 1), last_newline + 1
+
+    # ===== СОХРАНЕНИЕ КОНТРОЛЬНЫХ ТОЧЕК =====
+
+    def _load_checkpoints(self) -> Dict[str, Dict[str, int]]:
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return {}
+        try:
+            with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Не удалось прочитать контрольные точки", extra={"path": self.checkpoint_path, "error": str(e)})
+            return {}
+
+    def _save_checkpoints(self):
+        """Атомарно записывает контрольные точки (если задан checkpoint_path)"""
+        if not self.checkpoint_path:
+            return
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.checkpoints, f)
+        os.replace(tmp_path, self.checkpoint_path)
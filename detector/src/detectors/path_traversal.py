@@ -1,4 +1,5 @@
 import re
+import time
 from typing import Dict, Any, List
 
 class PathTraversalDetector:
@@ -14,13 +15,31 @@ class PathTraversalDetector:
             r"windows/win\.ini",
             r"\.\.%00"
         ]
+        
+        # Скомпилированные правила (компилируются лениво, при первой проверке)
+        self._compiled = {}
+        
+        # Необязательный наблюдатель: observer(detector, rule, seconds, matched)
+        self.rule_observer = None
+    
+    def _search(self, pattern: str, text: str):
+        """Проверяет одно правило, сообщая наблюдателю время проверки"""
+        compiled = self._compiled.get(pattern)
+        if compiled is None:
+            compiled = self._compiled[pattern] = re.compile(pattern, re.IGNORECASE)
+        if self.rule_observer is None:
+            return compiled.search(text)
+        started = time.perf_counter()
+        match = compiled.search(text)
+        self.rule_observer('path_traversal', pattern, time.perf_counter() - started, match is not None)
+        return match
     
     def detect(self, text: str) -> List[Dict[str, Any]]:
         """Обнаруживает Path Traversal в тексте"""
         detections = []
         
         for pattern in self.patterns:
-            if re.search(pattern, text, re.IGNORECASE):
+            if self._search(pattern, text):
                 detection = {
                     'type': 'PATH_TRAVERSAL',
                     'pattern': pattern,
@@ -0,0 +1,287 @@
+import hashlib
+import json
+import os
+import re
+import time
+from typing import Dict, Any, List, Optional
+
+from detectors.stream_scanner import StreamRule
+
+try:
+    import yaml
+    HAS_YAML = True
+except ImportError:
+    HAS_YAML = False
+
+# Типы атак, для которых пакет может содержать правила
+RULE_TYPES = ('SQL_INJECTION', 'XSS', 'PATH_TRAVERSAL')
+SEVERITIES = ('LOW', 'MEDIUM', 'HIGH', 'CRITICAL')
+
+
+class RulePackError(ValueError):
+    """Пакет правил не прошёл разбор, проверку или собственные тесты"""
+
+
+class RulePack:
+    """
+    Версионированный пакет правил обнаружения (JSON или YAML).
+
+    Формат:
+        name: имя пакета
+        version: версия (попадает в каждую детекцию как ruleset_version)
+        rules:
+          - id: уникальный идентификатор правила
+            type: SQL_INJECTION | XSS | PATH_TRAVERSAL
+            subtype: подтип (необязательно; из правил одного подтипа
+                     срабатывает первое совпавшее)
+            pattern: регулярное выражение (без учёта регистра)
+            severity: LOW | MEDIUM | HIGH | CRITICAL
+            confidence: LOW | MEDIUM | HIGH (по умолчанию HIGH)
+            enabled: false - правило пропускается
+            tests:
+              match: [строки, на которых правило обязано сработать]
+              no_match: [строки, на которых срабатывать нельзя]
+
+    Все правила компилируются и проверяются своими тестами при загрузке:
+    пакет с ошибкой целиком отклоняется.
+    """
+
+    def __init__(self, name: str, version: str, rules: List[StreamRule], digest: str,
+                 source: Optional[str] = None):
+        self.name = name
+        self.version = version
+        self.rules = rules
+        self.digest = digest
+        self.source = source
+        self.loaded_at = time.time()
+
+    def rules_for(self, detection_type: str) -> List[StreamRule]:
+        return [rule for rule in self.rules if rule.detection_type == detection_type]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'version': self.version,
+            'source': self.source,
+            'digest': self.digest,
+            'loaded_at': self.loaded_at,
+            'rules': {detection_type: len(self.rules_for(detection_type)) for detection_type in RULE_TYPES}
+        }
+
+
+def load_rule_pack(path: str) -> RulePack:
+    """Читает, компилирует и проверяет пакет правил из файла (.json, .yaml, .yml)"""
+    with open(path, 'rb') as f:
+        raw = f.read()
+    return parse_rule_pack(raw, yaml_format=path.endswith(('.yaml', '.yml')), source=os.path.abspath(path))
+
+
+def parse_rule_pack(raw: bytes, yaml_format: bool = False, source: Optional[str] = None) -> RulePack:
+    """Разбирает пакет правил из байтов (RulePackError при любой ошибке)"""
+    try:
+        if yaml_format:
+            if not HAS_YAML:
+                raise RulePackError("для пакетов YAML нужен PyYAML (pip install pyyaml)")
+            data = yaml.safe_load(raw)
+        else:
+            data = json.loads(raw)
+    except RulePackError:
+        raise
+    except Exception as e:  # ValueError (JSON) или yaml.YAMLError
+        raise RulePackError(f"пакет правил не разобран: {e}")
+
+    if not isinstance(data, dict):
+        raise RulePackError("пакет правил должен быть объектом")
+    version = data.get('version')
+    if not isinstance(version, (str, int, float)) or not str(version):
+        raise RulePackError("не указана версия пакета (version)")
+    entries = data.get('rules')
+    if not isinstance(entries, list) or not entries:
+        raise RulePackError("пакет не содержит правил (rules)")
+
+    errors = []
+    rules = []
+    seen_ids = set()
+    for index, entry in enumerate(entries):
+        where = f"rules[{index}]"
+        if not isinstance(entry, dict):
+            errors.append(f"{where}: правило должно быть объектом")
+            continue
+        rule_id = entry.get('id')
+        if not isinstance(rule_id, str) or not rule_id:
+            errors.append(f"{where}: не указан id")
+            continue
+        where = f"{where} ({rule_id})"
+        if rule_id in seen_ids:
+            errors.append(f"{where}: повторяющийся id")
+            continue
+        seen_ids.add(rule_id)
+        if entry.get('enabled', True) is False:
+            continue
+
+        rule = _compile_rule(entry, rule_id, where, errors)
+        if rule is not None:
+            rules.append(rule)
+
+    if errors:
+        raise RulePackError("; ".join(errors))
+    if not rules:
+        raise RulePackError("в пакете нет включённых правил")
+
+    return RulePack(
+        name=str(data.get('name') or 'rules'),
+        version=str(version),
+        rules=rules,
+        digest=hashlib.blake2b(raw, digest_size=8).hexdigest(),
+        source=source
+    )
+
+
+def _compile_rule(entry: Dict[str, Any], rule_id: str, where: str, errors: List[str]) -> Optional[StreamRule]:
+    detection_type = entry.get('type')
+    if detection_type not in RULE_TYPES:
+        errors.append(f"{where}: type должен быть одним из {', '.join(RULE_TYPES)}")
+        return None
+    severity = entry.get('severity', 'HIGH')
+    if severity not in SEVERITIES:
+        errors.append(f"{where}: severity должен быть одним из {', '.join(SEVERITIES)}")
+        return None
+    confidence = entry.get('confidence', 'HIGH')
+    if confidence not in ('LOW', 'MEDIUM', 'HIGH'):
+        errors.append(f"{where}: confidence должен быть LOW, MEDIUM или HIGH")
+        return None
+    subtype = entry.get('subtype')
+    if subtype is not None and not isinstance(subtype, str):
+        errors.append(f"{where}: subtype должен быть строкой")
+        return None
+    pattern = entry.get('pattern')
+    if not isinstance(pattern, str) or not pattern:
+        errors.append(f"{where}: не указан pattern")
+        return None
+
+    try:
+        rule = StreamRule(detection_type, subtype.upper() if subtype else None, pattern, severity, confidence,
+                          rule_id=rule_id)
+    except re.error as e:
+        errors.append(f"{where}: некорректное выражение: {e}")
+        return None
+    if rule.compiled.search(''):
+        errors.append(f"{where}: выражение совпадает с пустой строкой")
+        return None
+
+    tests = entry.get('tests') or {}
+    if not isinstance(tests, dict):
+        errors.append(f"{where}: tests должен быть объектом с match и no_match")
+        return None
+    for kind, expected in (('match', True), ('no_match', False)):
+        for sample in tests.get(kind) or []:
+            if not isinstance(sample, str):
+                errors.append(f"{where}: тесты {kind} должны быть строками")
+            elif bool(rule.compiled.search(sample)) != expected:
+                problem = "тест не сработал" if expected else "ложное срабатывание"
+                errors.append(f"{where}: {problem} на {sample!r}")
+    return rule
+
+
+class PackDetector:
+    """
+    Детектор одного типа атак по правилам пакета.
+
+    Интерфейс совпадает со встроенными детекторами (detect,
+    analyze_http_request, rule_observer). Из правил одного подтипа
+    срабатывает первое совпавшее (как у SQLInjectionDetector и
+    XSSDetector), правила без подтипа проверяются каждое (как у
+    PathTraversalDetector).
+    """
+
+    def __init__(self, detection_type: str, rules: List[StreamRule]):
+        self.detection_type = detection_type
+        self.detector_name = detection_type.lower()
+        self.rules = rules
+        groups: Dict[str, List[StreamRule]] = {}
+        self._groups: List[List[StreamRule]] = []
+        for rule in rules:
+            if rule.subtype is None:
+                self._groups.append([rule])
+            elif rule.subtype in groups:
+                groups[rule.subtype].append(rule)
+            else:
+                groups[rule.subtype] = [rule]
+                self._groups.append(groups[rule.subtype])
+
+        # Необязательный наблюдатель: observer(detector, rule, seconds, matched)
+        self.rule_observer = None
+
+    def _search(self, rule: StreamRule, text: str):
+        if self.rule_observer is None:
+            return rule.compiled.search(text)
+        started = time.perf_counter()
+        match = rule.compiled.search(text)
+        self.rule_observer(self.detector_name, rule.pattern, time.perf_counter() - started, match is not None)
+        return match
+
+    def detect(self, text: str) -> List[Dict[str, Any]]:
+        """Обнаруживает атаки своего типа в тексте"""
+        detections = []
+        for group in self._groups:
+            for rule in group:
+                if self._search(rule, text):
+                    detection = {'type': self.detection_type}
+                    if rule.subtype is not None:
+                        detection['subtype'] = rule.subtype
+                    detection.update({
+                        'pattern': rule.pattern,
+                        'input_sample': text[:100],
+                        'risk_level': rule.risk_level,
+                        'confidence': rule.confidence,
+                        'rule_id': rule.rule_id
+                    })
+                    detections.append(detection)
+                    break
+        return detections
+
+    def analyze_http_request(self, method: str, url: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Анализирует URL и строковые параметры запроса"""
+        all_detections = []
+
+        for detection in self.detect(url):
+            detection['location'] = 'URL'
+            all_detections.append(detection)
+
+        for param_name, param_value in params.items():
+            if isinstance(param_value, str):
+                for detection in self.detect(param_value):
+                    detection['location'] = f'PARAM_{param_name}'
+                    all_detections.append(detection)
+
+        return all_detections
+
+
+class RuleEngine:
+    """
+    Набор детекторов одной версии правил. Детектор держит ссылку на
+    текущий набор и при перезагрузке правил заменяет её целиком: запрос
+    в обработке дорабатывает на старом наборе, следующие - на новом.
+    """
+
+    __slots__ = ('version', 'sql_detector', 'xss_detector', 'path_traversal_detector', 'stream_scanner', 'triage',
+                 'pack')
+
+    def __init__(self, version: str, sql_detector, xss_detector, path_traversal_detector, stream_scanner,
+                 triage=None, pack: Optional[RulePack] = None):
+        self.version = version
+        self.sql_detector = sql_detector
+        self.xss_detector = xss_detector
+        self.path_traversal_detector = path_traversal_detector
+        self.stream_scanner = stream_scanner
+        self.triage = triage
+        self.pack = pack
+
+    def detectors(self) -> tuple:
+        return (self.sql_detector, self.xss_detector, self.path_traversal_detector, self.stream_scanner, self.triage)
+
+    def summary(self) -> Dict[str, Any]:
+        if self.pack is not None:
+            return self.pack.summary()
+        return {'name': 'builtin', 'version': self.version, 'source': None, 'digest': None, 'loaded_at': None,
+                'rules': {}}
@@ -1,4 +1,5 @@
 import re
+import time
 from typing import Dict, Any, Tuple, List
 
 class SQLInjectionDetector:
@@ -37,6 +38,24 @@ class SQLInjectionDetector:
             'error_based': 'MEDIUM',
             'boolean_based': 'LOW'
         }
+        
+        # Скомпилированные правила (компилируются лениво, при первой проверке)
+        self._compiled = {}
+        
+        # Необязательный наблюдатель: observer(detector, rule, seconds, matched)
+        self.rule_observer = None
+    
+    def _search(self, pattern: str, text: str):
+        """Проверяет одно правило, сообщая наблюдателю время проверки"""
+        compiled = self._compiled.get(pattern)
+        if compiled is None:
+            compiled = self._compiled[pattern] = re.compile(pattern, re.IGNORECASE)
+        if self.rule_observer is None:
+            return compiled.search(text)
+        started = time.perf_counter()
+        match = compiled.search(text)
+        self.rule_observer('sql_injection', pattern, time.perf_counter() - started, match is not None)
+        return match
     
     def detect(self, text: str) -> List[Dict[str, Any]]:
         """Обнаруживает SQL-инъекции в тексте"""
@@ -44,7 +63,7 @@ class SQLInjectionDetector:
         
         for attack_type, patterns in self.patterns.items():
             for pattern in patterns:
-                if re.search(pattern, text, re.IGNORECASE):
+                if self._search(pattern, text):
                     detection = {
                         'type': 'SQL_INJECTION',
                         'subtype': attack_type.upper(),
@@ -0,0 +1,434 @@
+import time
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import parse_qsl, unquote
+
+# ===== ТИПЫ ТОКЕНОВ =====
+# s - строка, 1 - число, n - имя, f - функция, v - переменная, k - ключевое
+# слово, E - начало оператора (SELECT, DROP...), U - UNION, & - логический
+# оператор, o - прочий оператор, c - комментарий, X - исполняемый
+# комментарий MySQL (/*! ... */), ( ) , ; - сами символы
+
+STATEMENTS = frozenset((
+    'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'DROP', 'CREATE', 'ALTER', 'TRUNCATE', 'EXEC', 'EXECUTE',
+    'DECLARE', 'SHUTDOWN', 'GRANT', 'REVOKE', 'MERGE', 'CALL', 'HANDLER', 'LOAD'
+))
+KEYWORDS = frozenset((
+    'FROM', 'WHERE', 'INTO', 'VALUES', 'TABLE', 'DATABASE', 'SET', 'LIMIT', 'OFFSET', 'ORDER', 'GROUP', 'BY',
+    'HAVING', 'ALL', 'DISTINCT', 'WAITFOR', 'DELAY', 'TIME', 'CASE', 'WHEN', 'THEN', 'ELSE', 'END', 'AS', 'ON',
+    'JOIN', 'PROCEDURE', 'OUTFILE', 'DUMPFILE', 'TOP', 'ASC', 'DESC', 'COLLATE', 'ESCAPE'
+))
+LOGIC = frozenset(('AND', 'OR', 'XOR'))
+OPERATOR_WORDS = frozenset(('LIKE', 'RLIKE', 'REGEXP', 'IS', 'IN', 'BETWEEN', 'DIV', 'MOD', 'NOT', 'SOUNDS'))
+VALUE_WORDS = frozenset(('NULL', 'TRUE', 'FALSE'))
+# Функции времени (слепые инъекции по задержке)
+TIME_FUNCTIONS = frozenset(('SLEEP', 'BENCHMARK', 'PG_SLEEP', 'DBMS_LOCK.SLEEP'))
+
+_OPERATORS_2 = frozenset(('<=', '>=', '<>', '!=', '==', ':=', '<<', '>>'))
+_LOGIC_SYMBOLS = frozenset(('||', '&&'))
+_OPERATOR_CHARS = frozenset('=<>+-*/%^|&~!')
+_UNARY = frozenset('+-~!')
+_WORD_CHARS = frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_$.')
+_DIGITS = frozenset('0123456789')
+
+# Сколько токенов (после свёртки) входит в отпечаток
+FINGERPRINT_LENGTH = 5
+# Сколько значимых токенов значения разбирается (окно отпечатка скользит по всем)
+MAX_TOKENS = 2048
+# Сколько последних результатов проверки хранится в кеше
+RESULT_CACHE_SIZE = 4096
+
+# Опорный корпус атак: отпечатки этих строк во всех контекстах и составляют
+# множество вредоносных отпечатков (как в libinjection, отпечаток не зависит
+# от конкретных имён, чисел и строк, поэтому покрывает их варианты)
+SEED_PAYLOADS = (
+    # булевы
+    "x' OR 1=1--", "x' OR '1'='1", "x' OR 'a'='a'--", "x' OR 1=1#", "x' OR 1=1/*", "x' OR 1--",
+    "x' OR x=x--", "x' OR 1=1 LIMIT 1--", "x') OR ('1'='1", "x') OR 1=1--", "x')) OR 1=1--",
+    "x' AND 1=2--", "x' AND 'a'='b", "1 OR 1=1", "1 OR 1=1--", "1) OR (1=1", "1 AND 1=2",
+    "x' OR 1 LIKE 1--", "x' OR 2>1--", "x' OR TRUE--", "x' OR NOT 0--", "x' || 1=1--",
+    "x' OR x IS NOT NULL--", "x')) OR ((1=1", "1' OR '1'='1'--", "x'='x", "x' OR ''='", "x\" OR \"1\"=\"1", "x\" OR 1=1--",
+    "admin'--", "admin'#", "admin'/*", "1 OR x LIKE x",
+    # UNION
+    "x' UNION SELECT 1--", "x' UNION SELECT 1,2,3--", "x' UNION ALL SELECT NULL,NULL--",
+    "x' UNION SELECT x,x FROM x--", "x' UNION SELECT x FROM x WHERE 1=1--", "1 UNION SELECT 1,2",
+    "1 UNION ALL SELECT x FROM x", "x') UNION SELECT 1--", "-1 UNION SELECT x,x FROM x",
+    "x' UNION SELECT @@version--", "x' UNION SELECT version()--", "1 UNION SELECT NULL--",
+    # стековые
+    "x'; DROP TABLE x--", "x'; DELETE FROM x--", "x'; INSERT INTO x VALUES(1)--", "x'; UPDATE x SET x=1--",
+    "1; DROP TABLE x", "1; DROP TABLE x--", "x'; EXEC x--", "x'; SHUTDOWN--", "1; SELECT 1", "x'; SELECT 1--",
+    "x'; WAITFOR DELAY '0:0:5'--", "1; WAITFOR DELAY '0:0:5'",
+    # по времени и по ошибкам
+    "x' AND SLEEP(5)--", "x' OR SLEEP(5)--", "1 AND SLEEP(5)", "1 OR SLEEP(5)", "x' AND BENCHMARK(1,x(1))--",
+    "1 AND BENCHMARK(1,x(1))", "x' AND (SELECT 1 FROM x)--", "1 AND (SELECT 1 FROM x)",
+    "x' AND EXTRACTVALUE(1,CONCAT(1,version()))--", "x' AND 1=CONVERT(int,@@version)--",
+    "1 AND 1=CONVERT(int,@@version)", "x' AND pg_sleep(5)--", "x';SELECT pg_sleep(5)--",
+    "x' OR IF(1=1,SLEEP(5),0)--", "1 OR IF(1=1,SLEEP(5),0)",
+    # исполняемые комментарии и прочее
+    "x'/*!UNION*/ SELECT 1--", "1/*!UNION*/SELECT 1", "x' INTO OUTFILE 'x'--", "x' PROCEDURE ANALYSE()--",
+    "x' ORDER BY 1--", "1 ORDER BY 1--", "x' GROUP BY x HAVING 1=1--",
+    # комментарии вместо пробелов (сворачиваются, см. fold)
+    "x'/**/OR/**/1=1--", "x' UNION/**/SELECT x FROM x--", "1/**/UNION/**/SELECT/**/1",
+)
+
+
+class Token:
+    __slots__ = ('type', 'value')
+
+    def __init__(self, token_type: str, value: str):
+        self.type = token_type
+        self.value = value
+
+
+def tokenize(text: str, quote_context: Optional[str] = None, limit: int = MAX_TOKENS) -> List[Token]:
+    """
+    Разбирает текст как фрагмент SQL за один проход (линейное время).
+
+    quote_context - если текст подставляется внутрь строки в кавычках
+    (' или "), всё до первой такой кавычки - одна строка. Разбор
+    останавливается после limit значимых токенов.
+    """
+    tokens: List[Token] = []
+    length = len(text)
+    position = 0
+
+    if quote_context is not None:
+        end = text.find(quote_context)
+        if end == -1:
+            return [Token('s', text)]
+        tokens.append(Token('s', text[:end]))
+        position = end + 1
+
+    while position < length and len(tokens) < limit:
+        char = text[position]
+
+        if char.isspace():
+            position += 1
+            continue
+
+        # Строки в кавычках (удвоенная кавычка и \ экранируют)
+        if char == "'" or char == '"':
+            end = position + 1
+            while True:
+                end = text.find(char, end)
+                if end == -1:
+                    end = length
+                    break
+                if text[end - 1] == '\\' or (end + 1 < length and text[end + 1] == char):
+                    end += 2 if text[end - 1] != '\\' else 1
+                    continue
+                break
+            tokens.append(Token('s', text[position + 1:end]))
+            position = end + 1
+            continue
+
+        # Комментарии
+        if char == '#' or (char == '-' and text.startswith('--', position)):
+            end = text.find('\n', position)
+            end = length if end == -1 else end
+            tokens.append(Token('c', text[position:end]))
+            position = end
+            continue
+        if char == '/' and text.startswith('/*', position):
+            end = text.find('*/', position + 2)
+            end = length if end == -1 else end + 2
+            comment = text[position:end]
+            if comment.startswith('/*!'):
+                # Исполняемый комментарий MySQL: содержимое выполняется как код
+                tokens.append(Token('X', comment))
+            else:
+                tokens.append(Token('c', comment))
+            position = end
+            continue
+
+        # Числа (включая 0x.., десятичные и экспоненту)
+        if char in _DIGITS or (char == '.' and position + 1 < length and text[position + 1] in _DIGITS):
+            end = position + 1
+            if char == '0' and end < length and text[end] in 'xX':
+                end += 1
+                while end < length and text[end] in '0123456789abcdefABCDEF':
+                    end += 1
+            else:
+                while end < length and (text[end] in _DIGITS or text[end] in '.eE'):
+                    end += 1
+            tokens.append(Token('1', text[position:end]))
+            position = end
+            continue
+
+        # Переменные @x, @@x
+        if char == '@':
+            end = position + 1
+            while end < length and (text[end] == '@' or text[end] in _WORD_CHARS):
+                end += 1
+            tokens.append(Token('v', text[position:end]))
+            position = end
+            continue
+
+        # Слова
+        if char in _WORD_CHARS or char == '`' or char == '[':
+            if char == '`' or char == '[':
+                closing = '`' if char == '`' else ']'
+                end = text.find(closing, position + 1)
+                end = length if end == -1 else end + 1
+                tokens.append(Token('n', text[position:end]))
+                position = end
+                continue
+            end = position + 1
+            while end < length and text[end] in _WORD_CHARS:
+                end += 1
+            word = text[position:end]
+            tokens.append(Token(_word_type(word, text, end), word))
+            position = end
+            continue
+
+        # Операторы
+        pair = text[position:position + 2]
+        if pair in _LOGIC_SYMBOLS:
+            tokens.append(Token('&', pair))
+            position += 2
+            continue
+        if pair in _OPERATORS_2:
+            tokens.append(Token('o', pair))
+            position += 2
+            continue
+        if char in _OPERATOR_CHARS:
+            tokens.append(Token('o', char))
+            position += 1
+            continue
+        if char in '(),;':
+            tokens.append(Token(char, char))
+            position += 1
+            continue
+
+        # Прочие символы в SQL не значимы
+        position += 1
+
+    return tokens
+
+
+def _word_type(word: str, text: str, end: int) -> str:
+    upper = word.upper()
+    if upper in LOGIC:
+        return '&'
+    if upper == 'UNION':
+        return 'U'
+    if upper in STATEMENTS:
+        return 'E'
+    if upper in KEYWORDS:
+        return 'k'
+    if upper in OPERATOR_WORDS:
+        return 'o'
+    if upper in VALUE_WORDS:
+        return '1'
+    # Имя перед скобкой - вызов функции
+    length = len(text)
+    while end < length and text[end].isspace():
+        end += 1
+    if end < length and text[end] == '(':
+        return 'f'
+    return 'n'
+
+
+def fold(tokens: List[Token]) -> List[Token]:
+    """
+    Свёртка токенов: убирает унарные операторы и комментарии между
+    токенами (как libinjection: /**/ вместо пробела не разбивает отпечаток;
+    остаётся только комментарий в конце), склеивает соседние строки,
+    сворачивает арифметику над числами.
+    """
+    folded: List[Token] = []
+    comment: Optional[Token] = None
+    for token in tokens:
+        if token.type == 'c':
+            comment = token
+            continue
+        comment = None
+        previous = folded[-1] if folded else None
+        if (token.type in ('1', 'n', 's', 'v', 'f', '(') and previous is not None and previous.type == 'o'
+                and previous.value in _UNARY and (len(folded) == 1 or folded[-2].type in ('o', '&', '(', ',', 'k', 'E'))):
+            folded.pop()  # унарный минус/плюс/отрицание
+            previous = folded[-1] if folded else None
+        if previous is not None:
+            if token.type == previous.type == 's':
+                continue
+            if previous.type == 'U' and token.type == 'k' and token.value.upper() in ('ALL', 'DISTINCT'):
+                continue  # UNION ALL -> UNION
+            if (token.type == '1' and len(folded) >= 2 and previous.type == 'o' and previous.value in '+-*/%'
+                    and folded[-2].type == '1'):
+                folded.pop()  # 1+1 -> 1
+                continue
+        folded.append(token)
+    if comment is not None:
+        folded.append(comment)
+    return folded
+
+
+def fingerprint(text: str, quote_context: Optional[str] = None) -> Tuple[str, List[Token]]:
+    """Типы всех свёрнутых токенов (отпечатки - окна по FINGERPRINT_LENGTH из них) и сами токены"""
+    tokens = fold(tokenize(text, quote_context))
+    return ''.join(token.type for token in tokens), tokens
+
+
+def windows(types: str) -> List[str]:
+    """
+    Окна отпечатка по строке типов: до FINGERPRINT_LENGTH токенов с каждой
+    позиции (у конца значения окна короче), поэтому внедрение находится в
+    любом месте значения, а не только в начале
+    """
+    return [types[start:start + FINGERPRINT_LENGTH] for start in range(len(types))]
+
+
+def http_values(url: str, params: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """
+    Проверяемые значения запроса: (location, значение). URL делится на
+    путь и отдельные значения строки запроса; строковый параметр, похожий
+    на тело формы (a=1&b=2), проверяется целиком и по значениям
+    """
+    path, _, query = url.partition('?')
+    values = [('URL', unquote(path))]
+    values.extend(('URL', value) for _, value in parse_qsl(query, keep_blank_values=True) if value)
+    for param_name, param_value in params.items():
+        if isinstance(param_value, str):
+            location = f'PARAM_{param_name}'
+            values.append((location, param_value))
+            if '=' in param_value:
+                values.extend(
+                    (location, value) for _, value in parse_qsl(param_value, keep_blank_values=True)
+                    if value and value != param_value
+                )
+    return values
+
+
+def _seed_fingerprints() -> frozenset:
+    fingerprints = set()
+    for payload in SEED_PAYLOADS:
+        for context in (None, "'", '"'):
+            if context is not None and context not in payload:
+                continue
+            types, _ = fingerprint(payload, context)
+            fp = types[:FINGERPRINT_LENGTH]
+            if _is_candidate(fp):
+                fingerprints.add(fp)
+    return frozenset(fingerprints)
+
+
+def _is_candidate(fp: str) -> bool:
+    """Отпечаток похож на внедрённый SQL (а не на обычную строку или число)"""
+    if len(fp) < 2:
+        return False
+    # Одна строка, слово или число с комментарием - не повод
+    return any(marker in fp for marker in ('&', 'U', 'E', ';', 'X', 'f', 'k')) or fp.startswith('sc') or (fp[0] == 's' and 'o' in fp)
+
+
+class SQLTokenDetector:
+    """
+    Детектор SQL-инъекций на основе лексера (в стиле libinjection).
+
+    Вход разбирается как SQL за один линейный проход без регулярных
+    выражений и бэктрекинга; каждое окно из пяти подряд идущих токенов
+    сверяется с множеством вредоносных отпечатков. Вход проверяется в трёх
+    контекстах: как есть, внутри строки в ' и в ". Обычный текст вроде
+    "O'Brien and co = partners" даёт отпечаток обычной строки и не
+    срабатывает. В HTTP запросе проверяются отдельные значения строки
+    запроса и тела формы, а не URL целиком.
+
+    Лексер на чистом Python медленнее регулярного движка (тот выполняется
+    в C); его преимущества - время, линейное на любом входе, и отпечатки
+    вместо списка шаблонов, а не скорость.
+
+    Интерфейс совпадает с SQLInjectionDetector (detect, analyze_http_request,
+    rule_observer), поэтому движок выбирается настройкой развёртывания
+    (DETECTOR_SQLI_ENGINE=tokenizer).
+    """
+
+    # Имя "правила" для наблюдателя: весь лексер учитывается как одно правило
+    rule_name = 'tokenizer'
+
+    RISK_LEVELS = {
+        'UNION_BASED': 'HIGH',
+        'STACKED_QUERIES': 'CRITICAL',
+        'TIME_BASED': 'HIGH',
+        'ERROR_BASED': 'MEDIUM',
+        'BOOLEAN_BASED': 'LOW'
+    }
+
+    def __init__(self, extra_fingerprints: Optional[List[str]] = None):
+        self.fingerprints = _seed_fingerprints() | frozenset(extra_fingerprints or ())
+        # Необязательный наблюдатель: observer(detector, rule, seconds, matched)
+        self.rule_observer = None
+        # Значения параметров часто повторяются: результат берётся из кеша
+        self._cache: Dict[str, Optional[Tuple[str, List[Token]]]] = {}
+
+    def check(self, text: str) -> Optional[Tuple[str, List[Token]]]:
+        """Отпечаток и токены, если текст - SQL-инъекция хотя бы в одном контексте"""
+        cache = self._cache
+        if text in cache:
+            return cache[text]
+        found = self._check(text)
+        if len(cache) >= RESULT_CACHE_SIZE:
+            cache.clear()
+        cache[text] = found
+        return found
+
+    def _check(self, text: str) -> Optional[Tuple[str, List[Token]]]:
+        fingerprints = self.fingerprints
+        for context in (None, "'", '"'):
+            if context is not None and context not in text:
+                continue
+            types, tokens = fingerprint(text, context)
+            # Помимо известных отпечатков: исполняемый комментарий, а также
+            # UNION SELECT и ; с новым оператором сразу после строки/числа
+            for fp in windows(types):
+                if fp in fingerprints or 'X' in fp or (fp[0] in 's1' and ('UE' in fp or ';E' in fp)):
+                    return fp, tokens
+        return None
+
+    def detect(self, text: str) -> List[Dict[str, Any]]:
+        """Обнаруживает SQL-инъекции в тексте"""
+        if self.rule_observer is None:
+            found = self.check(text)
+        else:
+            started = time.perf_counter()
+            found = self.check(text)
+            self.rule_observer('sql_injection', self.rule_name, time.perf_counter() - started, found is not None)
+        if found is None:
+            return []
+
+        fp, tokens = found
+        subtype = self._subtype(fp, tokens)
+        return [{
+            'type': 'SQL_INJECTION',
+            'subtype': subtype,
+            'pattern': f'fingerprint:{fp}',
+            'input_sample': text[:100],  # первые 100 символов
+            'risk_level': self.RISK_LEVELS[subtype],
+            'confidence': 'HIGH'
+        }]
+
+    @staticmethod
+    def _subtype(fp: str, tokens: List[Token]) -> str:
+        types = ''.join(token.type for token in tokens)
+        if ';E' in types or ';k' in types:
+            return 'STACKED_QUERIES'
+        if 'U' in types:
+            return 'UNION_BASED'
+        if any(token.type == 'f' and token.value.upper() in TIME_FUNCTIONS for token in tokens) or 'WAITFOR' in (
+                token.value.upper() for token in tokens if token.type == 'k'):
+            return 'TIME_BASED'
+        if '&' in types:
+            return 'BOOLEAN_BASED'
+        return 'ERROR_BASED'
+
+    def analyze_http_request(self, method: str, url: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Анализирует HTTP запрос на SQL-инъекции (не больше одного обнаружения на location)"""
+        all_detections = []
+        detected = set()
+
+        for location, value in http_values(url, params):
+            if location in detected:
+                continue
+            for detection in self.detect(value):
+                detection['location'] = location
+                all_detections.append(detection)
+                detected.add(location)
+
+        return all_detections
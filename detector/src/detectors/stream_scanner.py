@@ -0,0 +1,254 @@
+import codecs
+import re
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+# Размер порции, которой читается и проверяется тело (символы после декодирования)
+DEFAULT_CHUNK_SIZE = 64 * 1024
+# Наибольшее перекрытие: для правил без ограничения длины (.*, \s+)
+# совпадение, пересекающее границу порций, ищется в этих пределах
+DEFAULT_MAX_OVERLAP = 4096
+# Сколько обнаружений сообщается для одного потока
+DEFAULT_MAX_DETECTIONS = 100
+
+# Символы, которые re.IGNORECASE сопоставляет с ASCII-буквами, хотя их
+# lower() другой: для предфильтра по обязательным подстрокам
+_FOLD_TABLE = str.maketrans({'İ': 'i', 'ı': 'i', 'ſ': 's'})
+
+
+def fold_case(text: str) -> str:
+    """Текст в нижнем регистре для сверки с StreamRule.literal"""
+    return text.lower() if text.isascii() else text.translate(_FOLD_TABLE).lower()
+
+
+class StreamRule:
+    """Правило потоковой проверки: скомпилированный шаблон и поля детекции"""
+
+    __slots__ = ('detection_type', 'subtype', 'pattern', 'risk_level', 'confidence', 'compiled', 'max_width',
+                 'literal', 'rule_id')
+
+    def __init__(self, detection_type: str, subtype: Optional[str], pattern: str,
+                 risk_level: str, confidence: str, rule_id: Optional[str] = None):
+        self.rule_id = rule_id
+        self.detection_type = detection_type
+        self.subtype = subtype
+        self.pattern = pattern
+        self.risk_level = risk_level
+        self.confidence = confidence
+        self.compiled = re.compile(pattern, re.IGNORECASE)
+        parsed = sre_parse.parse(pattern, re.IGNORECASE)
+        # Наибольшая длина совпадения (None - не ограничена)
+        max_width = parsed.getwidth()[1]
+        self.max_width = max_width if max_width < sre_parse.MAXREPEAT else None
+        # Самая длинная обязательная подстрока (в нижнем регистре): окно без
+        # неё не проверяется регулярным выражением
+        self.literal = _required_literal(parsed)
+
+
+def _required_literal(parsed) -> Optional[str]:
+    """Самая длинная последовательность литералов верхнего уровня шаблона"""
+    best, run = '', []
+    for opcode, argument in list(parsed) + [(None, None)]:
+        if opcode is sre_parse.LITERAL and argument < 128:
+            run.append(chr(argument).lower())
+            continue
+        if len(run) > len(best):
+            best = ''.join(run)
+        run = []
+    return best or None
+
+
+def collect_rules(detectors: Dict[str, Any]) -> List[StreamRule]:
+    """
+    Правила регулярных детекторов: {тип атаки: детектор}. Шаблоны со
+    словарём подтипов (SQL-инъекции, XSS) дают subtype и risk_levels,
+    плоский список (Path Traversal) - риск HIGH без подтипа.
+    """
+    rules = []
+    for detection_type, detector in detectors.items():
+        patterns = getattr(detector, 'patterns', None)
+        if isinstance(patterns, dict):
+            risk_levels = getattr(detector, 'risk_levels', {})
+            for subtype, subtype_patterns in patterns.items():
+                for pattern in subtype_patterns:
+                    rules.append(StreamRule(detection_type, subtype.upper(), pattern,
+                                            risk_levels.get(subtype, 'HIGH'), 'HIGH'))
+        elif patterns:
+            for pattern in patterns:
+                rules.append(StreamRule(detection_type, None, pattern, 'HIGH', 'MEDIUM'))
+    return rules
+
+
+class StreamScanner:
+    """
+    Потоковая проверка больших тел запросов и загружаемых файлов.
+
+    Тело читается порциями байтов, декодируется инкрементально (кодек
+    сохраняет незавершённые многобайтовые символы до следующей порции) и
+    проверяется окнами: окно - хвост предыдущего окна (перекрытие) плюс
+    новые chunk_size символов. Перекрытие равно длине самого длинного
+    правила, а для правил без ограничения длины - max_overlap, поэтому
+    совпадение на границе порций не теряется. Память - O(chunk_size +
+    overlap) независимо от размера тела.
+
+    Каждое совпадение сообщается с байтовым смещением в исходном потоке.
+    Недопустимые байты декодируются через surrogateescape: один байт -
+    один символ, поэтому смещения точны и для повреждённых данных.
+    """
+
+    def __init__(self, rules: List[StreamRule], chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 max_overlap: int = DEFAULT_MAX_OVERLAP, encoding: str = 'utf-8',
+                 max_detections: int = DEFAULT_MAX_DETECTIONS):
+        self.rules = rules
+        self.chunk_size = chunk_size
+        self.encoding = codecs.lookup(encoding).name
+        self.max_detections = max_detections
+        widths = [rule.max_width if rule.max_width is not None else max_overlap for rule in rules]
+        self.overlap = min(max(widths, default=0), max_overlap)
+        # Необязательный наблюдатель: observer(detector, rule, seconds, matched)
+        self.rule_observer = None
+
+    def session(self, location: str = 'BODY') -> 'StreamScan':
+        """Новая инкрементальная проверка одного потока"""
+        return StreamScan(self, location)
+
+    def scan(self, source, location: str = 'BODY') -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Проверяет весь поток: байты, файлоподобный объект (read) или
+        итерируемый набор порций байтов. Возвращает (обнаружения, прочитано байтов).
+        """
+        scan = self.session(location)
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            scan.feed(source)
+        elif hasattr(source, 'read'):
+            while True:
+                chunk = source.read(self.chunk_size)
+                if not chunk:
+                    break
+                scan.feed(chunk)
+        else:
+            for chunk in source:
+                scan.feed(chunk)
+        return scan.close(), scan.bytes_read
+
+
+class StreamScan:
+    """Состояние проверки одного потока (см. StreamScanner.session)"""
+
+    def __init__(self, scanner: StreamScanner, location: str):
+        self.scanner = scanner
+        self.location = location
+        self.bytes_read = 0
+        self.truncated = 0  # совпадения сверх max_detections
+        self.detections: List[Dict[str, Any]] = []
+        self._decoder = codecs.getincrementaldecoder(scanner.encoding)(errors='surrogateescape')
+        self._pending: List[str] = []
+        self._pending_chars = 0
+        # Хвост предыдущего окна и позиция его начала (символы и байты потока)
+        self._carry = ''
+        self._carry_char = 0
+        self._carry_byte = 0
+        # Правило -> конец последнего сообщённого совпадения (символы потока):
+        # совпадения из перекрытия не сообщаются повторно
+        self._last_end: Dict[int, int] = {}
+
+    def feed(self, data: bytes) -> List[Dict[str, Any]]:
+        """Добавляет порцию байтов; возвращает новые обнаружения"""
+        self.bytes_read += len(data)
+        new = []
+        chunk_size = self.scanner.chunk_size
+        for start in range(0, len(data), chunk_size):
+            text = self._decoder.decode(data[start:start + chunk_size])
+            if text:
+                self._pending.append(text)
+                self._pending_chars += len(text)
+            if self._pending_chars >= chunk_size:
+                new.extend(self._scan_pending())
+        return new
+
+    def close(self) -> List[Dict[str, Any]]:
+        """Завершает поток (проверяет остаток) и возвращает все обнаружения"""
+        text = self._decoder.decode(b'', final=True)
+        if text:
+            self._pending.append(text)
+            self._pending_chars += len(text)
+        if self._pending_chars:
+            self._scan_pending()
+        return self.detections
+
+    def _byte_length(self, text: str) -> int:
+        if text.isascii():
+            return len(text)
+        return len(text.encode(self.scanner.encoding, 'surrogateescape'))
+
+    def _scan_pending(self) -> List[Dict[str, Any]]:
+        scanner = self.scanner
+        window = self._carry + ''.join(self._pending)
+        self._pending = []
+        self._pending_chars = 0
+        window_char = self._carry_char
+        window_byte = self._carry_byte
+        observer = scanner.rule_observer
+
+        # Предфильтр: строка в нижнем регистре один раз на окно
+        lowered = fold_case(window)
+
+        new = []
+        for index, rule in enumerate(scanner.rules):
+            if rule.literal is not None and rule.literal not in lowered:
+                continue
+            last_end = self._last_end.get(index, 0) - window_char
+            started = time.perf_counter() if observer is not None else 0.0
+            matched = False
+            for match in rule.compiled.finditer(window):
+                match_start, match_end = match.span()
+                if match_start < last_end:
+                    continue  # уже сообщено в предыдущем окне
+                matched = True
+                last_end = max(match_end, match_start + 1)
+                if len(self.detections) >= scanner.max_detections:
+                    self.truncated += 1
+                    continue
+                detection = self._detection(rule, window, match_start, match_end, window_byte)
+                self.detections.append(detection)
+                new.append(detection)
+            if last_end > 0:
+                self._last_end[index] = window_char + last_end
+            if observer is not None:
+                observer(rule.detection_type.lower(), rule.pattern, time.perf_counter() - started, matched)
+
+        # Хвост окна переходит в следующее как перекрытие
+        keep = min(scanner.overlap, len(window))
+        consumed = window[:len(window) - keep]
+        self._carry = window[len(window) - keep:]
+        self._carry_char = window_char + len(consumed)
+        self._carry_byte = window_byte + self._byte_length(consumed)
+        return new
+
+    def _detection(self, rule: StreamRule, window: str, start: int, end: int, window_byte: int) -> Dict[str, Any]:
+        encoding = self.scanner.encoding
+        offset = window_byte + self._byte_length(window[:start])
+        # Образец - первые 100 символов совпадения; недопустимые байты -> U+FFFD
+        sample = window[start:min(end, start + 100)]
+        if not sample.isascii():
+            sample = sample.encode(encoding, 'surrogateescape').decode(encoding, 'replace')
+        detection = {'type': rule.detection_type}
+        if rule.subtype is not None:
+            detection['subtype'] = rule.subtype
+        detection.update({
+            'pattern': rule.pattern,
+            'input_sample': sample,
+            'risk_level': rule.risk_level,
+            'confidence': rule.confidence,
+            'location': self.location,
+            'offset': offset,
+            'length': self._byte_length(window[start:end])
+        })
+        if rule.rule_id is not None:
+            detection['rule_id'] = rule.rule_id
+        return detection
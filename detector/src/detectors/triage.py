@@ -0,0 +1,196 @@
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+from detectors.stream_scanner import StreamRule, collect_rules, fold_case
+
+# Уровни риска, при которых запрос блокируется: только их проверяет триаж
+BLOCKING_LEVELS = ('CRITICAL', 'HIGH')
+# Порядок правил пересчитывается по замерам не чаще раза в столько секунд
+DEFAULT_REFRESH_INTERVAL = 10.0
+# Априорная доля срабатываний: не даёт правилам без срабатываний
+# получить бесконечный приоритет и сглаживает редкие срабатывания
+HIT_RATE_PRIOR = 0.01
+
+_SEVERITY_RANK = {'CRITICAL': 0, 'HIGH': 1, 'MEDIUM': 2, 'LOW': 3}
+
+
+class _Check:
+    """Одна проверка плана: правило (rule) или целый детектор без правил (detector)"""
+
+    __slots__ = ('rule', 'detector', 'detection_type', 'labels', 'severity', 'priority')
+
+    def __init__(self, detection_type: str, labels: Tuple[str, str], severity: str,
+                 rule: Optional[StreamRule] = None, detector=None):
+        self.rule = rule
+        self.detector = detector
+        self.detection_type = detection_type
+        self.labels = labels  # (детектор, правило) - как у наблюдателя правил
+        self.severity = severity
+        self.priority = 0.0
+
+
+def _static_cost(rule: StreamRule) -> float:
+    """Оценка стоимости правила без замеров (микросекунды): по длине и виду шаблона"""
+    cost = 0.5 + len(rule.pattern) / 32
+    if rule.max_width is None:
+        cost *= 3  # .*, \s+ - возможен бэктрекинг по всей строке
+    if rule.literal is None:
+        cost *= 2  # без обязательной подстроки предфильтр не отсеивает правило
+    return cost
+
+
+class TriagePlan:
+    """
+    Быстрое решение "блокировать или нет" для inline-прокси.
+
+    Проверяются только правила с риском CRITICAL и HIGH (правила MEDIUM и
+    LOW не влияют на решение о блокировке) и только до первого
+    срабатывания. Порядок - по ожидаемой стоимости решения: средняя
+    длительность правила (cost_source, замеры наблюдателя правил), делённая
+    на долю его срабатываний, так что дешёвые и часто срабатывающие
+    правила идут первыми. Пока замеров мало, стоимость оценивается по
+    шаблону. Правило с обязательной подстрокой (StreamRule.literal) не
+    запускается для полей, где её нет.
+
+    Детекторы без правил (лексер SQL-инъекций) проверяются целиком, как
+    одно правило со своей измеренной стоимостью.
+
+    evaluate(all_levels=True) - режим первого срабатывания: те же порядок и
+    остановка, но по правилам всех уровней риска.
+
+    profile() замеряет все правила всех уровней риска (для трассировки запроса).
+    """
+
+    def __init__(self, rules: List[StreamRule], opaque: List[Tuple[str, Any]] = (),
+                 refresh_interval: float = DEFAULT_REFRESH_INTERVAL):
+        self.all_checks = [
+            _Check(rule.detection_type, (rule.detection_type.lower(), rule.pattern), rule.risk_level, rule=rule)
+            for rule in rules
+        ]
+        for detection_type, detector in opaque:
+            self.all_checks.append(_Check(detection_type, (detection_type.lower(), detector.rule_name), 'HIGH',
+                                          detector=detector))
+        self.checks = [check for check in self.all_checks if check.severity in BLOCKING_LEVELS]
+        self.refresh_interval = refresh_interval
+        # Необязательный источник замеров: cost_source(детектор, правило) ->
+        # (средние секунды, доля срабатываний) или None, если замеров мало
+        self.cost_source = None
+        # Необязательный наблюдатель: observer(detector, rule, seconds, matched)
+        self.rule_observer = None
+        self._order: List[_Check] = []
+        self._all_order: List[_Check] = []
+        self._ordered_at = None
+
+    @classmethod
+    def for_detectors(cls, detectors: Dict[str, Any], **kwargs) -> 'TriagePlan':
+        """План для {тип атаки: детектор}: правила регулярных детекторов и пакетов, прочие - целиком"""
+        rules, opaque = [], []
+        for detection_type, detector in detectors.items():
+            pack_rules = getattr(detector, 'rules', None)
+            if pack_rules is not None:
+                rules.extend(pack_rules)
+            elif getattr(detector, 'patterns', None):
+                rules.extend(collect_rules({detection_type: detector}))
+            else:
+                opaque.append((detection_type, detector))
+        return cls(rules, opaque, **kwargs)
+
+    # ===== ПОРЯДОК ПРОВЕРОК =====
+
+    def order(self, all_levels: bool = False) -> List[_Check]:
+        """
+        Проверки в порядке приоритета (пересчитывается не чаще
+        refresh_interval); all_levels - правила всех уровней риска
+        """
+        now = time.monotonic()
+        if self._ordered_at is None or now - self._ordered_at >= self.refresh_interval:
+            for check in self.all_checks:
+                check.priority = self._priority(check)
+            key = lambda check: (check.priority, _SEVERITY_RANK[check.severity])  # noqa: E731
+            self._order = sorted(self.checks, key=key)
+            self._all_order = sorted(self.all_checks, key=key)
+            self._ordered_at = now
+        return self._all_order if all_levels else self._order
+
+    def _priority(self, check: _Check) -> float:
+        measured = self.cost_source(*check.labels) if self.cost_source is not None else None
+        if measured is not None:
+            seconds, hit_rate = measured
+            return seconds * 1e6 / (hit_rate + HIT_RATE_PRIOR)
+        cost = _static_cost(check.rule) if check.rule is not None else 5.0
+        return cost / HIT_RATE_PRIOR
+
+    def costs(self) -> List[Dict[str, Any]]:
+        """Текущий порядок проверок с приоритетами (для диагностики)"""
+        return [
+            {'detector': check.labels[0], 'rule': check.labels[1], 'risk_level': check.severity,
+             'priority': round(check.priority, 3)}
+            for check in self.order()
+        ]
+
+    # ===== ПРОВЕРКА =====
+
+    def evaluate(self, fields: List[Tuple[str, str]], all_levels: bool = False) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Проверяет поля (location, текст) до первого срабатывания CRITICAL/HIGH
+        (all_levels=True - до первого срабатывания любого уровня риска).
+
+        Возвращает ([обнаружение] или [], число выполненных проверок).
+        """
+        folded = [fold_case(text) for _, text in fields]
+        evaluated = 0
+        for check in self.order(all_levels):
+            rule = check.rule
+            # Детектор без правил сообщает наблюдателю о себе сам
+            observer = self.rule_observer if rule is not None else None
+            for (location, text), lowered in zip(fields, folded):
+                if rule is not None and rule.literal is not None and rule.literal not in lowered:
+                    continue
+                evaluated += 1
+                started = time.perf_counter() if observer is not None else 0.0
+                detection = self._run(check, text, all_levels)
+                if observer is not None:
+                    observer(check.labels[0], check.labels[1], time.perf_counter() - started, detection is not None)
+                if detection is not None:
+                    detection['location'] = location
+                    return [detection], evaluated
+        return [], evaluated
+
+    def profile(self, fields: List[Tuple[str, str]]) -> List[Tuple[str, str, float, bool]]:
+        """
+        Время каждого правила на полях запроса: [(детектор, правило, секунды,
+        сработало)] по всем полям, без предфильтра и остановки на совпадении
+        """
+        timings = []
+        for check in self.all_checks:
+            matched = False
+            started = time.perf_counter()
+            for _, text in fields:
+                if check.rule is not None:
+                    matched = check.rule.compiled.search(text) is not None or matched
+                else:
+                    matched = bool(check.detector.detect(text)) or matched
+            timings.append((check.labels[0], check.labels[1], time.perf_counter() - started, matched))
+        return timings
+
+    def _run(self, check: _Check, text: str, all_levels: bool = False) -> Optional[Dict[str, Any]]:
+        rule = check.rule
+        if rule is None:
+            for detection in check.detector.detect(text):
+                if all_levels or detection['risk_level'] in BLOCKING_LEVELS:
+                    return detection
+            return None
+        if not rule.compiled.search(text):
+            return None
+        detection = {'type': rule.detection_type}
+        if rule.subtype is not None:
+            detection['subtype'] = rule.subtype
+        detection.update({
+            'pattern': rule.pattern,
+            'input_sample': text[:100],
+            'risk_level': rule.risk_level,
+            'confidence': rule.confidence
+        })
+        if rule.rule_id is not None:
+            detection['rule_id'] = rule.rule_id
+        return detection
@@ -1,4 +1,5 @@
 import re
+import time
 from typing import Dict, Any, List
 
 class XSSDetector:
@@ -37,6 +38,24 @@ class XSSDetector:
             'javascript_protocol': 'MEDIUM',
             'svg_injection': 'HIGH'
         }
+        
+        # Скомпилированные правила (компилируются лениво, при первой проверке)
+        self._compiled = {}
+        
+        # Необязательный наблюдатель: observer(detector, rule, seconds, matched)
+        self.rule_observer = None
+    
+    def _search(self, pattern: str, text: str):
+        """Проверяет одно правило, сообщая наблюдателю время проверки"""
+        compiled = self._compiled.get(pattern)
+        if compiled is None:
+            compiled = self._compiled[pattern] = re.compile(pattern, re.IGNORECASE)
+        if self.rule_observer is None:
+            return compiled.search(text)
+        started = time.perf_counter()
+        match = compiled.search(text)
+        self.rule_observer('xss', pattern, time.perf_counter() - started, match is not None)
+        return match
     
     def detect(self, text: str) -> List[Dict[str, Any]]:
         """Обнаруживает XSS в тексте"""
@@ -44,7 +63,7 @@ class XSSDetector:
         
         for attack_type, patterns in self.patterns.items():
             for pattern in patterns:
-                if re.search(pattern, text, re.IGNORECASE):
+                if self._search(pattern, text):
                     detection = {
                         'type': 'XSS',
                         'subtype': attack_type.upper(),
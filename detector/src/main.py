@@ -5,102 +5,497 @@
 
 # ПРАВИЛЬНЫЕ ИМПОРТЫ
 from detectors.sql_injection import SQLInjectionDetector
+from detectors.sql_tokenizer import SQLTokenDetector
 from detectors.xss_detector import XSSDetector
 from detectors.path_traversal import PathTraversalDetector
-from database.db_manager import DatabaseManager
+from detectors.stream_scanner import StreamScanner, collect_rules
+from detectors.rule_pack import RulePack, PackDetector, RuleEngine, load_rule_pack
+from detectors.triage import TriagePlan
+from database.db_manager import DatabaseManager, DEFAULT_DB_PATH
+from services.stats_service import StatsService, STAT_KEYS
+from services.id_generator import SnowflakeIdGenerator, format_id, resolve_worker_id
+from services.correlation import CorrelationEngine
+from services.heavy_hitters import HeavyHitters
+from services.cardinality import CardinalityTracker
+from services.payload_clusters import PayloadClusterer
+from services.anomaly import AnomalyBaselines
+from services.rule_reloader import RuleReloader
+from services.tracing import RequestTrace
+from services import metrics
 
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import json
+import os
+import time
+
+# Движки обнаружения SQL-инъекций: регулярные выражения или лексер с
+# отпечатками токенов (выбирается DETECTOR_SQLI_ENGINE для развёртывания)
+SQLI_ENGINES = {
+    'regex': SQLInjectionDetector,
+    'tokenizer': SQLTokenDetector
+}
+
+# Режимы проверки запроса: full - все детекторы по всем полям, все
+# обнаружения (разбор и оценка); first - правила всех уровней риска до
+# первого срабатывания (есть ли атака); triage - только правила
+# CRITICAL/HIGH до первого срабатывания (решение о блокировке для inline-прокси)
+EVALUATION_MODES = ('full', 'first', 'triage')
 
 class CyberRangeDetector:
     """Основной класс системы детектирования"""
     
-    def __init__(self):
-        self.sql_detector = SQLInjectionDetector()
-        self.xss_detector = XSSDetector()
-        self.path_traversal_detector = PathTraversalDetector()
-        self.db_manager = DatabaseManager()
+    # Соответствие типа атаки счётчику статистики
+    STAT_KEY_BY_TYPE = {
+        'SQL_INJECTION': 'sql_injections',
+        'XSS': 'xss_attacks',
+        'PATH_TRAVERSAL': 'path_traversals'
+    }
+    
+    def __init__(self, shared_counters=None, correlator=None, heavy_hitters=None,
+                 sqli_engine: Optional[str] = None, rule_pack: Optional[str] = None,
+                 db_path: Optional[str] = DEFAULT_DB_PATH):
+        self.sqli_engine = sqli_engine or os.environ.get("DETECTOR_SQLI_ENGINE", "regex")
+        if self.sqli_engine not in SQLI_ENGINES:
+            raise ValueError(f"Неизвестный движок SQLi: {self.sqli_engine} (доступны: {', '.join(SQLI_ENGINES)})")
         
-        self.stats = {
-            'total_requests': 0,
-            'detected_attacks': 0,
-            'sql_injections': 0,
-            'xss_attacks': 0,
-            'path_traversals': 0
-        }
+        # Правила: встроенные или из пакета DETECTOR_RULE_PACK (JSON/YAML).
+        # Все детекторы одной версии правил собраны в self.engine, при
+        # изменении пакета набор заменяется целиком (см. apply_rule_pack)
+        rule_pack = rule_pack or os.environ.get("DETECTOR_RULE_PACK", "")
+        pack = load_rule_pack(rule_pack) if rule_pack else None
+        self.engine = self._build_engine(pack)
+        # Слежение за файлом пакета (поток запускает API сервер)
+        self.rules_reloader = RuleReloader(rule_pack, self.apply_rule_pack, current=pack) if rule_pack else None
+        
+        # db_path=None - без базы данных (повторный анализ без записи):
+        # доступны только detect и анализ с persist=False
+        self.db_manager = DatabaseManager(db_path) if db_path is not None else None
+        
+        # Инкрементальный снимок статистики (память + сверка с БД);
+        # при shared_counters счётчики общие для всех процессов-воркеров
+        self.stats_service = StatsService(self.db_manager, shared=shared_counters)
+        
+        # Идентификаторы запросов, событий и атак: упорядочены по времени
+        # и не пересекаются между воркерами без какой-либо координации
+        self.ids = SnowflakeIdGenerator(resolve_worker_id(shared_counters))
+        
+        # Корреляция обнаружений по source_ip в скользящем окне (сканеры,
+        # комбинированные атаки, кампании по песочницам)
+        self.correlator = correlator if correlator is not None else CorrelationEngine()
+        
+        # Потоковые top-K по IP, URL, отпечаткам нагрузок и песочницам (/api/top)
+        self.heavy_hitters = heavy_hitters if heavy_hitters is not None else HeavyHitters()
+        
+        # Уникальные атакующие и нагрузки по песочницам (HyperLogLog по часам,
+        # сохраняются в базу рядом с дневной статистикой)
+        self.cardinality = CardinalityTracker(self.db_manager)
+        
+        # Кластеры почти одинаковых нагрузок: детекции получают cluster_id,
+        # образец хранится один на кластер (индекс восстанавливается из базы)
+        self.clusterer = PayloadClusterer()
+        if self.db_manager is not None:
+            self.clusterer.load(self.db_manager.get_payload_clusters(self.clusterer.max_clusters, with_signatures=True))
+        
+        # Базовые профили значений параметров по (sandbox_id, путь, параметр):
+        # оценка аномальности для запросов, не похожих на обычные
+        self.baselines = AnomalyBaselines()
+    
+    # ===== ПРАВИЛА =====
+    
+    def _build_engine(self, pack: Optional[RulePack]) -> RuleEngine:
+        """Детекторы и потоковый сканер одной версии правил (встроенных или из пакета)"""
+        if pack is None:
+            sql_detector = SQLI_ENGINES[self.sqli_engine]()
+            xss_detector = XSSDetector()
+            path_traversal_detector = PathTraversalDetector()
+            # Потоковая проверка теми же регулярными правилами (для движка
+            # tokenizer SQL-правила берутся из регулярного детектора)
+            stream_rules = collect_rules({
+                'SQL_INJECTION': sql_detector if hasattr(sql_detector, 'patterns') else SQLInjectionDetector(),
+                'XSS': xss_detector,
+                'PATH_TRAVERSAL': path_traversal_detector
+            })
+            version = 'builtin'
+        else:
+            if self.sqli_engine == 'regex':
+                sql_detector = PackDetector('SQL_INJECTION', pack.rules_for('SQL_INJECTION'))
+            else:
+                sql_detector = SQLI_ENGINES[self.sqli_engine]()
+            xss_detector = PackDetector('XSS', pack.rules_for('XSS'))
+            path_traversal_detector = PackDetector('PATH_TRAVERSAL', pack.rules_for('PATH_TRAVERSAL'))
+            stream_rules = pack.rules
+            version = pack.version
+        
+        # Триаж: правила CRITICAL/HIGH в порядке измеренной стоимости
+        triage = TriagePlan.for_detectors({
+            'SQL_INJECTION': sql_detector,
+            'XSS': xss_detector,
+            'PATH_TRAVERSAL': path_traversal_detector
+        })
+        triage.cost_source = metrics.rule_cost
+        
+        engine = RuleEngine(version, sql_detector, xss_detector, path_traversal_detector,
+                            StreamScanner(stream_rules), triage, pack)
+        # Время и срабатывания каждого правила попадают в /metrics
+        for rule_detector in engine.detectors():
+            rule_detector.rule_observer = metrics.observe_rule
+        return engine
+    
+    def apply_rule_pack(self, pack: RulePack):
+        """
+        Атомарно заменяет набор правил: новый набор собирается заранее,
+        затем подменяется одна ссылка. Запросы в обработке дорабатывают на
+        прежнем наборе, статистика и кеши не сбрасываются.
+        """
+        self.engine = self._build_engine(pack)
+    
+    @property
+    def sql_detector(self):
+        return self.engine.sql_detector
+    
+    @property
+    def xss_detector(self):
+        return self.engine.xss_detector
+    
+    @property
+    def path_traversal_detector(self):
+        return self.engine.path_traversal_detector
+    
+    @property
+    def stream_scanner(self):
+        return self.engine.stream_scanner
+    
+    # ===== АНАЛИЗ =====
+    
+    def analyze_request(self, method: str, url: str, params: Dict[str, Any], headers: Dict[str, str] = None, sandbox_id: str = None, persist: bool = True, source_ip: str = None, mode: str = 'full', trace: Optional[RequestTrace] = None) -> Dict[str, Any]:
+        """
+        Анализирует HTTP запрос на различные атаки.
+        
+        persist=False (упрощённый режим под нагрузкой): результат не пишется
+        в базу, учитывается только статистика в памяти.
+        source_ip - адрес атакующего для корреляции; оповещения, которые
+        вызвал этот запрос, попадают в поле alerts результата.
+        mode - режим проверки (EVALUATION_MODES): full - все обнаружения,
+        first - первое обнаружение любого уровня риска, triage - первое
+        обнаружение CRITICAL/HIGH и решение BLOCK/ALLOW.
+        trace - трассировка запроса (RequestTrace): участки по этапам,
+        детекторам и операциям с базой.
+        """
+        all_detections = self.detect(method, url, params, mode, trace)
+        counts = self.count_detections(all_detections)
+        alerts = self.correlator.observe(source_ip, sandbox_id, all_detections, url)
+        if trace is not None:
+            trace.add_since_last('correlation')
+        # Базовые профили учатся только на полностью проверенных запросах
+        anomaly = self.baselines.score(sandbox_id, url.split('?', 1)[0], params,
+                                       learn=mode == 'full' and not all_detections)
+        if trace is not None:
+            trace.add_since_last('anomaly')
+        self.heavy_hitters.observe(source_ip, sandbox_id, url, all_detections)
+        self.cardinality.observe(source_ip, sandbox_id, all_detections)
+        if trace is not None:
+            trace.add_since_last('sketches')
+        
+        if not persist:
+            self.stats_service.record_request(counts, persisted=False)
+            if trace is not None:
+                trace.add_since_last('stats')
+            return self._build_result(method, url, params, self.ids.next_id(), all_detections, persisted=False,
+                                      alerts=alerts, anomaly=anomaly, mode=mode)
+        
+        # Сохраняем запрос и обнаружения в базу данных
+        self.flush_clusters()
+        started = time.perf_counter()
+        if trace is not None:
+            trace.add('db.save_clusters', trace.last, started)
+        request_id = self.db_manager.save_request(method, url, params, sandbox_id, request_id=self.ids.next_id())
+        now = time.perf_counter()
+        metrics.DB_WRITE_SECONDS.labels('save_request').observe(now - started)
+        if trace is not None:
+            trace.add('db.save_request', started, now)
+        if all_detections:
+            started = now
+            self.db_manager.save_detections(request_id, all_detections)
+            now = time.perf_counter()
+            metrics.DB_WRITE_SECONDS.labels('save_detections').observe(now - started)
+            if trace is not None:
+                trace.add('db.save_detections', started, now)
+        
+        # Обновляем статистику в базе и в памяти (сверка не вклинится между ними)
+        with self.stats_service.persisting():
+            started = time.perf_counter()
+            self.db_manager.update_statistics(counts)
+            now = time.perf_counter()
+            metrics.DB_WRITE_SECONDS.labels('update_statistics').observe(now - started)
+            if trace is not None:
+                trace.add('db.update_statistics', started, now)
+            self.stats_service.record_request(counts)
+        if trace is not None:
+            trace.add_since_last('stats')
+        
+        return self._build_result(method, url, params, request_id, all_detections, alerts=alerts, anomaly=anomaly,
+                                  mode=mode)
     
-    def analyze_request(self, method: str, url: str, params: Dict[str, Any], headers: Dict[str, str] = None, sandbox_id: str = None) -> Dict[str, Any]:
-        """Анализирует HTTP запрос на различные атаки"""
-        self.stats['total_requests'] += 1
+    def analyze_batch(self, requests: List[Dict[str, Any]], persist: bool = True, mode: str = 'full',
+                      trace: Optional[RequestTrace] = None) -> List[Dict[str, Any]]:
+        """
+        Анализирует пакет запросов (словари с полями analyze_request).
         
+        Детектирование выполняется для каждого запроса, а запись в базу -
+        одной транзакцией на весь пакет, статистика обновляется один раз.
+        persist=False, mode и trace - как в analyze_request (участки
+        детекторов суммируются по всему пакету).
+        """
+        analyzed = []
+        total_counts = dict.fromkeys(STAT_KEYS, 0)
+        for request in requests:
+            detections = self.detect(request['method'], request['url'], request['params'], mode, trace)
+            analyzed.append((request, detections))
+            for key, value in self.count_detections(detections).items():
+                total_counts[key] += value
+        
+        if not analyzed:
+            return []
+        
+        request_ids = self.ids.next_ids(len(analyzed))
+        
+        # Оповещения корреляции относятся к запросу, после которого сработали
+        alerts_by_request = [
+            self.correlator.observe(request.get('source_ip'), request.get('sandbox_id'), detections, request['url'])
+            for request, detections in analyzed
+        ]
+        if trace is not None:
+            trace.add_since_last('correlation')
+        anomalies = [
+            self.baselines.score(request.get('sandbox_id'), request['url'].split('?', 1)[0], request['params'],
+                                 learn=mode == 'full' and not detections)
+            for request, detections in analyzed
+        ]
+        if trace is not None:
+            trace.add_since_last('anomaly')
+        for request, detections in analyzed:
+            self.heavy_hitters.observe(request.get('source_ip'), request.get('sandbox_id'), request['url'], detections)
+            self.cardinality.observe(request.get('source_ip'), request.get('sandbox_id'), detections)
+        if trace is not None:
+            trace.add_since_last('sketches')
+        
+        if persist:
+            self.flush_clusters()
+            started = time.perf_counter()
+            if trace is not None:
+                trace.add('db.save_clusters', trace.last, started)
+            with self.stats_service.persisting():
+                self.db_manager.save_analysis_batch([
+                    (request_id, request['method'], request['url'], request['params'], request.get('sandbox_id'),
+                     detections)
+                    for request_id, (request, detections) in zip(request_ids, analyzed)
+                ], total_counts)
+                now = time.perf_counter()
+                metrics.DB_WRITE_SECONDS.labels('save_batch').observe(now - started)
+                if trace is not None:
+                    trace.add('db.save_batch', started, now)
+                self.stats_service.record_request(total_counts)
+        else:
+            self.stats_service.record_request(total_counts, persisted=False)
+        if trace is not None:
+            trace.add_since_last('stats')
+        
+        return [
+            self._build_result(request['method'], request['url'], request['params'], request_id, detections,
+                               persisted=persist, alerts=alerts, anomaly=anomaly, mode=mode)
+            for (request, detections), request_id, alerts, anomaly in zip(analyzed, request_ids, alerts_by_request, anomalies)
+        ]
+    
+    def analyze_stream(self, method: str, url: str, body, sandbox_id: str = None, persist: bool = True,
+                       source_ip: str = None) -> Dict[str, Any]:
+        """
+        Анализирует тело запроса без буферизации целиком: body - байты,
+        файлоподобный объект или итерируемый набор порций байтов.
+        
+        URL проверяется как в analyze_request, тело - потоковым сканером:
+        обнаружения в теле имеют location BODY, offset и length (байты).
+        """
+        engine = self.engine
+        started = time.perf_counter()
+        body_detections, body_bytes = engine.stream_scanner.scan(body)
+        metrics.DETECTOR_MATCH_SECONDS.labels('stream').observe(time.perf_counter() - started)
+        for detection in body_detections:
+            detection['ruleset_version'] = engine.version
+        self.clusterer.assign(body_detections)
+        all_detections = self.detect(method, url, {}) + body_detections
+        
+        counts = self.count_detections(all_detections)
+        alerts = self.correlator.observe(source_ip, sandbox_id, all_detections, url)
+        self.heavy_hitters.observe(source_ip, sandbox_id, url, all_detections)
+        self.cardinality.observe(source_ip, sandbox_id, all_detections)
+        
+        request_id = self.ids.next_id()
+        if persist:
+            self.flush_clusters()
+            started = time.perf_counter()
+            with self.stats_service.persisting():
+                self.db_manager.save_analysis_batch(
+                    [(request_id, method, url, {'body_bytes': body_bytes}, sandbox_id, all_detections)], counts
+                )
+                metrics.DB_WRITE_SECONDS.labels('save_stream').observe(time.perf_counter() - started)
+                self.stats_service.record_request(counts)
+        else:
+            self.stats_service.record_request(counts, persisted=False)
+        
+        result = self._build_result(method, url, {}, request_id, all_detections, persisted=persist, alerts=alerts)
+        result['request_info']['body_bytes'] = body_bytes
+        return result
+    
+    def detect(self, method: str, url: str, params: Dict[str, Any], mode: str = 'full',
+               trace: Optional[RequestTrace] = None) -> List[Dict[str, Any]]:
+        """Прогоняет URL и параметры через все детекторы (без сохранения и статистики)"""
+        if mode not in EVALUATION_MODES:
+            raise ValueError(f"Неизвестный режим проверки: {mode} (доступны: {', '.join(EVALUATION_MODES)})")
         all_detections = []
+        # Текущий набор правил читается один раз: весь запрос проверяется одной версией
+        engine = self.engine
+        
+        if mode != 'full':
+            # triage и first: план триажа до первого срабатывания (first - по всем уровням риска)
+            started = time.perf_counter()
+            all_detections, _ = engine.triage.evaluate(self._fields(url, params), all_levels=mode == 'first')
+            now = time.perf_counter()
+            metrics.DETECTOR_MATCH_SECONDS.labels(mode).observe(now - started)
+            if trace is not None:
+                trace.add(f'detector.{mode}', started, now)
+                self._profile_rules(engine, url, params, trace)
+            for detection in all_detections:
+                detection['ruleset_version'] = engine.version
+            self.clusterer.assign(all_detections)
+            if trace is not None:
+                trace.add_since_last('clusters')
+            return all_detections
         
         # Анализ SQL-инъекций
-        sql_detections = self.sql_detector.analyze_http_request(method, url, params)
+        started = time.perf_counter()
+        sql_detections = engine.sql_detector.analyze_http_request(method, url, params)
         all_detections.extend(sql_detections)
         
+        now = time.perf_counter()
+        metrics.DETECTOR_MATCH_SECONDS.labels('sql_injection').observe(now - started)
+        if trace is not None:
+            trace.add('detector.sql_injection', started, now)
+        
         # Анализ XSS
+        started = now
         for param_name, param_value in params.items():
             if isinstance(param_value, str):
-                xss_detections = self.xss_detector.detect(param_value)
+                xss_detections = engine.xss_detector.detect(param_value)
                 for detection in xss_detections:
                     detection['location'] = f'PARAM_{param_name}'
                     all_detections.append(detection)
         
         # Анализ URL на XSS
-        xss_url_detections = self.xss_detector.detect(url)
+        xss_url_detections = engine.xss_detector.detect(url)
         for detection in xss_url_detections:
             detection['location'] = 'URL'
             all_detections.append(detection)
         
+        now = time.perf_counter()
+        metrics.DETECTOR_MATCH_SECONDS.labels('xss').observe(now - started)
+        if trace is not None:
+            trace.add('detector.xss', started, now)
+        
         # Анализ Path Traversal
+        started = now
         for param_name, param_value in params.items():
             if isinstance(param_value, str):
-                path_detections = self.path_traversal_detector.detect(param_value)
+                path_detections = engine.path_traversal_detector.detect(param_value)
                 for detection in path_detections:
                     detection['location'] = f'PARAM_{param_name}'
                     all_detections.append(detection)
         
-        path_url_detections = self.path_traversal_detector.detect(url)
+        path_url_detections = engine.path_traversal_detector.detect(url)
         for detection in path_url_detections:
             detection['location'] = 'URL'
             all_detections.append(detection)
         
-        # Сохраняем запрос и обнаружения в базу данных
-        request_id = self.db_manager.save_request(method, url, params, sandbox_id)
-        if all_detections:
-            self.db_manager.save_detections(request_id, all_detections)
+        now = time.perf_counter()
+        metrics.DETECTOR_MATCH_SECONDS.labels('path_traversal').observe(now - started)
+        if trace is not None:
+            trace.add('detector.path_traversal', started, now)
+            self._profile_rules(engine, url, params, trace)
         
-        # Обновляем статистику в базе
-        self.db_manager.update_statistics({
-            'total_requests': 1,
-            'detected_attacks': 1 if all_detections else 0,
-            'sql_injections': len([d for d in all_detections if d['type'] == 'SQL_INJECTION']),
-            'xss_attacks': len([d for d in all_detections if d['type'] == 'XSS']),
-            'path_traversals': len([d for d in all_detections if d['type'] == 'PATH_TRAVERSAL'])
-        })
-        
-        # Обновляем статистику в памяти
-        if all_detections:
-            self.stats['detected_attacks'] += 1
-            self.stats['sql_injections'] += len([d for d in all_detections if d['type'] == 'SQL_INJECTION'])
-            self.stats['xss_attacks'] += len([d for d in all_detections if d['type'] == 'XSS'])
-            self.stats['path_traversals'] += len([d for d in all_detections if d['type'] == 'PATH_TRAVERSAL'])
+        for detection in all_detections:
+            detection['ruleset_version'] = engine.version
+        self.clusterer.assign(all_detections)
+        if trace is not None:
+            trace.add_since_last('clusters')
         
-        return {
+        return all_detections
+    
+    @staticmethod
+    def _fields(url: str, params: Dict[str, Any]) -> List[tuple]:
+        """Проверяемые поля запроса: (location, текст) для URL и строковых параметров"""
+        fields = [('URL', url)]
+        fields.extend(
+            (f'PARAM_{param_name}', param_value)
+            for param_name, param_value in params.items() if isinstance(param_value, str)
+        )
+        return fields
+    
+    def _profile_rules(self, engine: RuleEngine, url: str, params: Dict[str, Any], trace: RequestTrace):
+        """
+        Трассировка: время каждого правила на полях запроса (повторная
+        проверка). Только в запрошенной клиентом трассировке: выборочная
+        для журнала медленных запросов не должна удлинять сам запрос
+        """
+        if trace.sampled:
+            return
+        started = time.perf_counter()
+        trace.add_rules(engine.triage.profile(self._fields(url, params)))
+        trace.add('trace.rule_profile', started, time.perf_counter())
+    
+    def flush_clusters(self):
+        """Сохраняет кластеры нагрузок, созданные с прошлой записи в базу"""
+        new_clusters = self.clusterer.drain_new()
+        if new_clusters:
+            self.db_manager.save_payload_clusters(new_clusters)
+    
+    def count_detections(self, detections: List[Dict[str, Any]]) -> Dict[str, int]:
+        """Считает приращения статистики для одного запроса за один проход"""
+        counts = {
+            'total_requests': 1,
+            'detected_attacks': 1 if detections else 0,
+            'sql_injections': 0,
+            'xss_attacks': 0,
+            'path_traversals': 0
+        }
+        for detection in detections:
+            stat_key = self.STAT_KEY_BY_TYPE.get(detection['type'])
+            if stat_key:
+                counts[stat_key] += 1
+        return counts
+    
+    def _build_result(self, method: str, url: str, params: Dict[str, Any], request_id: int, detections: List[Dict[str, Any]], persisted: bool = True, alerts: List[Dict[str, Any]] = None, anomaly: Dict[str, Any] = None, mode: str = 'full') -> Dict[str, Any]:
+        """Формирует результат анализа одного запроса"""
+        result = {
             'request_info': {
                 'method': method,
                 'url': url,
                 'params_count': len(params),
-                'request_id': request_id
+                'request_id': format_id(request_id),
+                'persisted': persisted,
+                'evaluation_mode': mode
             },
-            'detections': all_detections,
+            'detections': detections,
             'summary': {
-                'total_detections': len(all_detections),
-                'risk_level': self._calculate_risk_level(all_detections),
-                'recommendation': self._get_recommendation(all_detections)
-            }
+                'total_detections': len(detections),
+                'risk_level': self._calculate_risk_level(detections),
+                'recommendation': self._get_recommendation(detections)
+            },
+            'alerts': alerts or [],
+            'anomaly': anomaly or {'score': 0.0, 'param': None, 'feature': None}
         }
+        if mode == 'triage':
+            # Триаж сообщает только о правилах CRITICAL/HIGH: обнаружение - блокировка
+            result['summary']['decision'] = 'BLOCK' if detections else 'ALLOW'
+        return result
     
     def _calculate_risk_level(self, detections: List[Dict[str, Any]]) -> str:
         """Определяет общий уровень риска"""
@@ -136,9 +531,14 @@ class CyberRangeDetector:
         
         return "; ".join(recommendations)
     
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Статистика с момента запуска (в многопроцессном режиме - по всем воркерам)"""
+        return self.get_stats()
+
     def get_stats(self) -> Dict[str, Any]:
         """Возвращает статистику работы системы"""
-        return self.stats
+        return self.stats_service.snapshot()['memory_stats']
     
     def get_database_stats(self) -> Dict[str, Any]:
         """Возвращает статистику из базы данных"""
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+ПОВТОРНЫЙ АНАЛИЗ АРХИВНЫХ ЛОГОВ ДОСТУПА
+
+Разбирает логи nginx/Apache (common/combined) и JSON логи, прогоняет
+запросы через CyberRangeDetector в пуле процессов и сохраняет результаты
+в базу пакетами.
+
+Запуск: python replay_logs.py /var/log/nginx/access.log* --workers 8
+"""
+
+import argparse
+import os
+import sys
+
+from services.log_replay import replay_logs, DEFAULT_CHUNK_SIZE
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Повторный анализ архивных логов доступа")
+    parser.add_argument("paths", nargs="+", help="файлы логов")
+    parser.add_argument("--format", choices=("auto", "combined", "json"), default="auto", help="формат строк")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="число процессов")
+    parser.add_argument("--chunk-mb", type=int, default=DEFAULT_CHUNK_SIZE // (1024 * 1024), help="размер фрагмента, МБ")
+    parser.add_argument("--sandbox-id", default=None, help="sandbox_id для строк без песочницы")
+    parser.add_argument("--db", default="detector.db", help="файл базы данных")
+    parser.add_argument("--no-persist", action="store_true", help="только анализ, без записи в базу")
+    parser.add_argument("--attacks-only", action="store_true", help="сохранять только запросы с атаками")
+    parser.add_argument("--update-stats", action="store_true", help="добавить запросы в дневную статистику")
+    args = parser.parse_args()
+
+    missing = [path for path in args.paths if not os.path.isfile(path)]
+    if missing:
+        print(f"❌ Файлы не найдены: {', '.join(missing)}")
+        return 1
+
+    db_manager = None
+    if not args.no_persist:
+        from database.db_manager import DatabaseManager
+        db_manager = DatabaseManager(args.db)
+
+    print("🔁 ПОВТОРНЫЙ АНАЛИЗ ЛОГОВ")
+    print("=" * 60)
+
+    def progress(report):
+        print(f"\r   Фрагментов: {report['chunks_done']}/{report['chunks']} | строк: {report['lines']}", end="", flush=True)
+
+    report = replay_logs(
+        args.paths,
+        workers=args.workers,
+        chunk_size=args.chunk_mb * 1024 * 1024,
+        log_format=args.format,
+        default_sandbox=args.sandbox_id,
+        persist=not args.no_persist,
+        attacks_only=args.attacks_only,
+        update_stats=args.update_stats,
+        db_manager=db_manager,
+        progress=progress
+    )
+
+    print()
+    print(f"📄 Файлов: {report['files']} | фрагментов: {report['chunks']} | процессов: {report['workers']}")
+    print(f"📊 Строк: {report['lines']} (не разобрано: {report['skipped']})")
+    print(f"   Запросов: {report['requests']} | с атаками: {report['detected_attacks']} | обнаружений: {report['detections']}")
+    print(f"💾 Сохранено запросов: {report['persisted']}")
+    print(f"⏱  {report['seconds']} с | {report['lines_per_sec']:.0f} строк/с")
+    print("=" * 60)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
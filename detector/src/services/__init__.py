@@ -0,0 +1,3 @@
+from .stats_service import StatsService
+
+__all__ = ['StatsService']
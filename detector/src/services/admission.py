@@ -0,0 +1,179 @@
+import math
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Any, Iterable, Tuple
+
+from services.logging_service import get_logger
+from services.metrics import SHED_REQUESTS
+
+
+class OverloadedError(Exception):
+    """Запрос отклонён контролем нагрузки (ответ 429 с Retry-After)"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"сервис перегружен ({reason}), повторите через {retry_after} с")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """Разрешение на обработку одного запроса"""
+
+    __slots__ = ("endpoint", "sandbox_ids", "degraded", "released")
+
+    def __init__(self, endpoint: str, sandbox_ids: Tuple[str, ...], degraded: bool):
+        self.endpoint = endpoint
+        self.sandbox_ids = sandbox_ids  # песочницы, чьи счётчики занимает запрос
+        self.degraded = degraded
+        self.released = False
+
+
+class AdmissionController:
+    """
+    Контроль допуска запросов к анализу.
+
+    Запрос отклоняется (OverloadedError), если:
+    - на эндпоинте уже обрабатывается endpoint_limits[endpoint] запросов;
+    - по одному sandbox_id обрабатывается sandbox_limit запросов (сканер,
+      направленный на одну песочницу, не вытесняет остальные); пакетный
+      запрос (sandbox_ids) занимает место у каждой своей песочницы;
+    - задержка в очередях (зонды add_delay_probe) больше max_queue_delay.
+
+    Так задержка для принятых запросов остаётся ограниченной, а лишние
+    сразу получают 429 вместо бесконечного ожидания.
+
+    При degraded_mode запросы, принятые под высокой нагрузкой (занято
+    degrade_ratio лимита или очередь близка к max_queue_delay), помечаются
+    degraded: их результаты не сохраняются в базу.
+    """
+
+    def __init__(self, endpoint_limits: Dict[str, int] = None, default_limit: int = 64,
+                 sandbox_limit: int = 16, max_queue_delay: float = 0.5,
+                 degraded_mode: bool = False, degrade_ratio: float = 0.75,
+                 retry_after: int = 1, on_shed: Callable[[str, str], None] = None,
+                 on_degraded: Callable[[str], None] = None):
+        self.endpoint_limits = dict(endpoint_limits or {})
+        self.default_limit = default_limit
+        self.sandbox_limit = sandbox_limit
+        self.max_queue_delay = max_queue_delay
+        self.degraded_mode = degraded_mode
+        self.degrade_ratio = degrade_ratio
+        self.retry_after = retry_after
+        # Необязательные обработчики для учёта в общей статистике
+        self.on_shed = on_shed
+        self.on_degraded = on_degraded
+
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, int] = {}
+        self._sandbox_in_flight: Dict[str, int] = {}
+        self._delay_probes: Dict[str, Callable[[], float]] = {}
+
+        self.admitted = 0
+        self.degraded = 0
+        self.shed: Dict[str, int] = {}
+
+    def add_delay_probe(self, name: str, probe: Callable[[], float]):
+        """Регистрирует источник задержки очереди (секунды ожидания)"""
+        self._delay_probes[name] = probe
+
+    def queue_delay(self) -> float:
+        """Наибольшая текущая задержка среди очередей"""
+        delay = 0.0
+        for probe in self._delay_probes.values():
+            try:
+                delay = max(delay, probe())
+            except Exception:
+                continue
+        return delay
+
+    def limit_for(self, endpoint: str) -> int:
+        return self.endpoint_limits.get(endpoint, self.default_limit)
+
+    def acquire(self, endpoint: str, sandbox_id: str = None, sandbox_ids: Iterable[str] = ()) -> Ticket:
+        """
+        Допускает запрос или бросает OverloadedError (sandbox_ids - песочницы
+        пакетного запроса: отклоняется, если любая из них на пределе)
+        """
+        sandboxes = tuple(set(sandbox_ids))
+        if sandbox_id is not None and sandbox_id not in sandboxes:
+            sandboxes += (sandbox_id,)
+        delay = self.queue_delay()
+        if delay > self.max_queue_delay:
+            self._shed(endpoint, "queue_delay", max(self.retry_after, math.ceil(delay)))
+
+        limit = self.limit_for(endpoint)
+        with self._lock:
+            in_flight = self._in_flight.get(endpoint, 0)
+            if in_flight >= limit:
+                reason = "endpoint_limit"
+            elif any(self._sandbox_in_flight.get(sandbox, 0) >= self.sandbox_limit for sandbox in sandboxes):
+                reason = "sandbox_limit"
+            else:
+                reason = None
+                self._in_flight[endpoint] = in_flight + 1
+                for sandbox in sandboxes:
+                    self._sandbox_in_flight[sandbox] = self._sandbox_in_flight.get(sandbox, 0) + 1
+                self.admitted += 1
+
+        if reason is not None:
+            self._shed(endpoint, reason, self.retry_after)
+
+        degraded = self.degraded_mode and (
+            in_flight + 1 >= limit * self.degrade_ratio or delay >= self.max_queue_delay * self.degrade_ratio
+        )
+        if degraded:
+            with self._lock:
+                self.degraded += 1
+            if self.on_degraded is not None:
+                self.on_degraded(endpoint)
+        return Ticket(endpoint, sandboxes, degraded)
+
+    def release(self, ticket: Ticket):
+        """Освобождает место, занятое запросом (повторный вызов ничего не делает)"""
+        with self._lock:
+            if ticket.released:
+                return
+            ticket.released = True
+            self._in_flight[ticket.endpoint] -= 1
+            for sandbox in ticket.sandbox_ids:
+                remaining = self._sandbox_in_flight[sandbox] - 1
+                if remaining:
+                    self._sandbox_in_flight[sandbox] = remaining
+                else:
+                    # Не храним счётчики песочниц без активных запросов
+                    del self._sandbox_in_flight[sandbox]
+
+    @contextmanager
+    def admit(self, endpoint: str, sandbox_id: str = None, sandbox_ids: Iterable[str] = ()):
+        """Контекстный менеджер: acquire при входе, release при выходе"""
+        ticket = self.acquire(endpoint, sandbox_id, sandbox_ids)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def _shed(self, endpoint: str, reason: str, retry_after: int):
+        with self._lock:
+            self.shed[reason] = self.shed.get(reason, 0) + 1
+        SHED_REQUESTS.labels(endpoint, reason).inc()
+        if self.on_shed is not None:
+            self.on_shed(endpoint, reason)
+        # Под перегрузкой отказы идут потоком: пишем их в ограниченную по
+        # частоте категорию (точное число - в метрике SHED_REQUESTS)
+        get_logger("admission").info("Запрос отклонён контролем нагрузки", extra={
+            "endpoint": endpoint, "reason": reason, "retry_after": retry_after
+        })
+        raise OverloadedError(reason, retry_after)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Текущее состояние для /api/stats (счётчики этого процесса)"""
+        with self._lock:
+            return {
+                "admitted": self.admitted,
+                "degraded": self.degraded,
+                "shed": dict(self.shed),
+                "in_flight": dict(self._in_flight),
+                "busy_sandboxes": len(self._sandbox_in_flight),
+                "queue_delay_ms": round(self.queue_delay() * 1000, 1),
+                "degraded_mode": self.degraded_mode
+            }
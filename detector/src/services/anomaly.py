@@ -0,0 +1,169 @@
+import math
+import threading
+from array import array
+from collections import Counter, OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+# Признаки значения параметра
+FEATURES = ('length', 'entropy', 'letters', 'digits', 'spaces', 'specials')
+_N = len(FEATURES)
+
+# Сколько символов значения учитывается в признаках
+MAX_VALUE_CHARS = 4096
+# Сколько последних значений хранится в кеше признаков
+FEATURE_CACHE_SIZE = 4096
+# Кешируются значения не длиннее (длинные редко повторяются, а ключ кеша
+# удерживал бы в памяти всё значение целиком)
+FEATURE_CACHE_MAX_CHARS = 256
+
+# Классы символов ASCII: a - буквы, d - цифры, s - пробельные, остальные -> p
+_CLASS_TABLE = str.maketrans({
+    chr(code): ('a' if chr(code).isalpha() else 'd' if chr(code).isdigit() else
+                's' if chr(code).isspace() else 'p')
+    for code in range(128)
+})
+
+
+def value_features(value: str) -> Tuple[float, ...]:
+    """
+    Признаки значения: длина, энтропия Шеннона (бит на символ) и доли
+    букв, цифр, пробельных и прочих символов (не-ASCII считаются прочими).
+    """
+    value = value[:MAX_VALUE_CHARS]
+    length = len(value)
+    if not length:
+        return (0.0,) * _N
+    entropy = 0.0
+    # Для коротких значений str.count по уникальным символам быстрее Counter
+    counts = [value.count(char) for char in set(value)] if length <= 64 else Counter(value).values()
+    for count in counts:
+        p = count / length
+        entropy -= p * math.log2(p)
+    classes = value.translate(_CLASS_TABLE)
+    letters = classes.count('a')
+    digits = classes.count('d')
+    spaces = classes.count('s')
+    return (
+        float(length),
+        entropy,
+        letters / length,
+        digits / length,
+        spaces / length,
+        (length - letters - digits - spaces) / length
+    )
+
+
+class AnomalyBaselines:
+    """
+    Потоковые базовые профили значений параметров и оценка аномальности.
+
+    Для каждого ключа (sandbox_id, путь URL, имя параметра) хранится
+    array('d') из 1 + 2 * len(FEATURES) чисел: число наблюдений, средние
+    и суммы квадратов отклонений (онлайн-алгоритм Уэлфорда). Оценка
+    значения - наибольшее |z| по признакам относительно профиля; пока
+    наблюдений меньше min_samples, оценка 0. Обновление и оценка - O(1)
+    на параметр.
+
+    Профили учатся только на запросах без обнаружений (известные атаки
+    не размывают норму). Число ключей ограничено max_keys (LRU).
+    """
+
+    def __init__(self, max_keys: int = 50000, min_samples: int = 20, min_std: Tuple[float, ...] = None):
+        self.max_keys = max_keys
+        self.min_samples = min_samples
+        # Нижняя граница стандартного отклонения по признакам: постоянное
+        # значение не должно давать бесконечную оценку на любом отличии
+        self.min_std = min_std or (1.0, 0.25, 0.05, 0.05, 0.05, 0.05)
+        self._min_var = tuple(std * std for std in self.min_std)
+        self._lock = threading.Lock()
+        self._profiles: 'OrderedDict[Tuple[Optional[str], str, str], array]' = OrderedDict()
+        # Значения параметров часто повторяются: признаки берутся из кеша
+        self._feature_cache: Dict[str, Tuple[float, ...]] = {}
+
+    def score(self, sandbox_id: Optional[str], path: str, params: Dict[str, Any],
+              learn: bool = True) -> Dict[str, Any]:
+        """
+        Оценивает параметры запроса и (при learn=True) обновляет профили.
+
+        Возвращает {'score': наибольшее |z|, 'param': параметр, 'feature': признак}
+        (param и feature - None, если оценивать пока не по чему).
+        """
+        cache = self._feature_cache
+        features_by_param = []
+        for name, value in params.items():
+            if not isinstance(value, str):
+                continue
+            if len(value) > FEATURE_CACHE_MAX_CHARS:
+                features = value_features(value)
+            else:
+                features = cache.get(value)
+                if features is None:
+                    features = value_features(value)
+                    if len(cache) >= FEATURE_CACHE_SIZE:
+                        cache.clear()
+                    cache[value] = features
+            features_by_param.append((name, features))
+        if not features_by_param:
+            return {'score': 0.0, 'param': None, 'feature': None}
+
+        # Сравниваются квадраты z, корень берётся один раз в конце
+        best_z2, best_param, best_feature = 0.0, None, None
+        min_samples = self.min_samples
+        min_var = self._min_var
+        with self._lock:
+            profiles = self._profiles
+            for name, features in features_by_param:
+                key = (sandbox_id, path, name)
+                profile = profiles.get(key)
+                if profile is None:
+                    if not learn:
+                        continue
+                    profile = array('d', bytes(8 * (1 + 2 * _N)))
+                    profiles[key] = profile
+                    if len(profiles) > self.max_keys:
+                        profiles.popitem(last=False)
+                else:
+                    profiles.move_to_end(key)
+
+                count = profile[0]
+                scoring = count >= min_samples
+                variance_divisor = count - 1
+                if learn:
+                    count += 1
+                    profile[0] = count
+                # Оценка по профилю до этого значения и обновление по Уэлфорду
+                # (среднее и сумма квадратов отклонений) за один проход
+                for index in range(_N):
+                    value = features[index]
+                    mean = profile[1 + index]
+                    delta = value - mean
+                    if scoring:
+                        variance = profile[1 + _N + index] / variance_divisor
+                        z2 = delta * delta / (variance if variance > min_var[index] else min_var[index])
+                        if z2 > best_z2:
+                            best_z2, best_param, best_feature = z2, name, FEATURES[index]
+                    if learn:
+                        mean += delta / count
+                        profile[1 + index] = mean
+                        profile[1 + _N + index] += delta * (value - mean)
+
+        return {'score': round(math.sqrt(best_z2), 2), 'param': best_param, 'feature': best_feature}
+
+    def profile(self, sandbox_id: Optional[str], path: str, param: str) -> Optional[Dict[str, Any]]:
+        """Текущий профиль параметра: число наблюдений, средние и отклонения"""
+        with self._lock:
+            profile = self._profiles.get((sandbox_id, path, param))
+            if profile is None:
+                return None
+            count = profile[0]
+            return {
+                'samples': int(count),
+                'mean': {name: round(profile[1 + i], 4) for i, name in enumerate(FEATURES)},
+                'std': {
+                    name: round(math.sqrt(profile[1 + _N + i] / (count - 1)), 4) if count > 1 else 0.0
+                    for i, name in enumerate(FEATURES)
+                }
+            }
+
+    def size(self) -> int:
+        return len(self._profiles)
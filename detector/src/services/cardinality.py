@@ -0,0 +1,261 @@
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+from services.heavy_hitters import payload_fingerprint
+from services.logging_service import get_logger
+
+# Что считается: уникальные атакующие IP и различные отпечатки нагрузок
+METRICS = ('attackers', 'payloads')
+# Размер корзины скетчей (секунды): часовые скетчи объединяются в любые диапазоны
+BUCKET_SECONDS = 3600
+
+
+class HyperLogLog:
+    """
+    Оценка числа различных значений в фиксированной памяти (HyperLogLog).
+
+    2^precision регистров по байту (precision=12: 4 КиБ, стандартная
+    ошибка 1.04 / sqrt(4096) ~ 1.6%). Скетчи одной точности объединяются
+    поэлементным максимумом: объединение идемпотентно и не зависит от
+    порядка, поэтому часовые скетчи разных воркеров можно сливать в
+    базе в любые диапазоны времени.
+    """
+
+    __slots__ = ('precision', 'm', 'registers', '_estimate')
+
+    def __init__(self, precision: int = 12, registers: Optional[bytes] = None):
+        if not 4 <= precision <= 16:
+            raise ValueError("precision должна быть от 4 до 16")
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.m)
+        if len(self.registers) != self.m:
+            raise ValueError("число регистров не соответствует precision")
+        self._estimate = None
+
+    def add(self, value: str) -> bool:
+        """Добавляет значение; True, если скетч изменился"""
+        hashed = int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+        index = hashed >> (64 - self.precision)
+        rest_bits = 64 - self.precision
+        rest = hashed & ((1 << rest_bits) - 1)
+        rank = rest_bits - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            self._estimate = None
+            return True
+        return False
+
+    def merge(self, other: 'HyperLogLog'):
+        """Объединяет с другим скетчем той же точности (на месте)"""
+        if other.precision != self.precision:
+            raise ValueError("нельзя объединить скетчи разной точности")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        self._estimate = None
+
+    def count(self) -> int:
+        """Оценка числа различных значений (кешируется до следующего изменения)"""
+        if self._estimate is None:
+            m = self.m
+            registers = self.registers
+            harmonic = math.fsum(2.0 ** -r for r in registers)
+            alpha = 0.7213 / (1 + 1.079 / m) if m >= 128 else {16: 0.673, 32: 0.697, 64: 0.709}[m]
+            estimate = alpha * m * m / harmonic
+            zeros = registers.count(0)
+            if estimate <= 2.5 * m and zeros:
+                # Малые значения: линейный подсчёт точнее
+                estimate = m * math.log(m / zeros)
+            self._estimate = int(round(estimate))
+        return self._estimate
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'HyperLogLog':
+        precision = (len(data)).bit_length() - 1
+        return cls(precision, data)
+
+
+def merge_registers(left: bytes, right: bytes) -> bytes:
+    """Объединение двух сохранённых скетчей (для DatabaseManager.merge_sketches)"""
+    if len(left) != len(right):
+        raise ValueError("нельзя объединить скетчи разной точности")
+    return bytes(map(max, left, right))
+
+
+class CardinalityTracker:
+    """
+    Уникальные атакующие и различные нагрузки по песочницам и часам.
+
+    Для каждой пары (sandbox_id, час) ведутся два скетча HyperLogLog:
+    IP-адреса, с которых пришли атаки, и отпечатки нагрузок (как в
+    /api/top). Раз в flush_interval секунд фоновый поток (start/stop)
+    сливает изменённые скетчи (максимумом регистров) с сохранёнными в
+    таблице cardinality_sketches рядом с дневной статистикой, поэтому
+    данные всех воркеров и прошлых запусков объединяются, а запись в базу
+    не задерживает обработку запросов. В памяти держатся только последние
+    retain_hours часов.
+
+    Запрос за произвольный диапазон объединяет часовые скетчи из базы и
+    памяти: память и время ответа не зависят от числа атакующих.
+    """
+
+    def __init__(self, db_manager=None, precision: int = 12, flush_interval: float = 30.0,
+                 retain_hours: int = 25, clock=time.time):
+        self.db_manager = db_manager
+        self.precision = precision
+        self.flush_interval = flush_interval
+        self.retain_hours = retain_hours
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # (sandbox_id, начало часа, метрика) -> скетч
+        self._sketches: Dict[Tuple[str, int, str], HyperLogLog] = {}
+        self._dirty = set()
+        self._today_cache = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def observe(self, source_ip: Optional[str], sandbox_id: Optional[str],
+                detections: List[Dict[str, Any]], timestamp: Optional[float] = None):
+        """Учитывает запрос с обнаружениями (без обнаружений или sandbox_id - ничего не делает)"""
+        if not detections or not sandbox_id:
+            return
+        now = self.clock() if timestamp is None else timestamp
+        bucket = int(now // BUCKET_SECONDS) * BUCKET_SECONDS
+        with self._lock:
+            if source_ip:
+                self._add((sandbox_id, bucket, 'attackers'), source_ip)
+            for detection in detections:
+                self._add((sandbox_id, bucket, 'payloads'), payload_fingerprint(detection))
+
+    def _add(self, key: Tuple[str, int, str], value: str):
+        sketch = self._sketches.get(key)
+        if sketch is None:
+            sketch = self._sketches[key] = HyperLogLog(self.precision)
+        if sketch.add(value):
+            self._dirty.add(key)
+
+    # ===== СОХРАНЕНИЕ =====
+
+    def start(self):
+        """Запускает фоновое сохранение раз в flush_interval секунд"""
+        with self._start_lock:
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="cardinality-flush", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Останавливает фоновое сохранение и дописывает оставшиеся изменения"""
+        with self._start_lock:
+            thread = self._thread
+            if thread is not None:
+                self._stop.set()
+                thread.join(timeout)
+                self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                get_logger("stats").exception("Ошибка фонового сохранения скетчей")
+
+    def flush(self):
+        """Сливает изменённые скетчи с базой и забывает устаревшие часы"""
+        if not self._flush_lock.acquire(blocking=False):
+            return  # уже сохраняет другой поток
+        try:
+            with self._lock:
+                dirty = [(key, self._sketches[key].to_bytes()) for key in self._dirty]
+                self._dirty = set()
+                oldest = int(self.clock() // BUCKET_SECONDS - self.retain_hours) * BUCKET_SECONDS
+                for key in [key for key in self._sketches if key[1] < oldest]:
+                    del self._sketches[key]
+
+            if dirty and self.db_manager is not None:
+                rows = [(sandbox_id, bucket, metric, registers) for (sandbox_id, bucket, metric), registers in dirty]
+                try:
+                    self.db_manager.merge_sketches(rows, merge_registers)
+                except Exception as e:
+                    get_logger("stats").warning("Ошибка сохранения скетчей", extra={"error": str(e)})
+                    with self._lock:
+                        self._dirty.update(key for key, _ in dirty if key in self._sketches)
+        finally:
+            self._flush_lock.release()
+
+    # ===== ЗАПРОСЫ =====
+
+    def _collect(self, metric: str, start: float, end: float,
+                 sandbox_id: Optional[str] = None) -> Dict[str, HyperLogLog]:
+        """Объединённые по часам скетчи метрики за [start, end): sandbox_id -> скетч"""
+        if metric not in METRICS:
+            raise ValueError(f"Неизвестная метрика: {metric} (доступны: {', '.join(METRICS)})")
+        start_bucket = int(start // BUCKET_SECONDS) * BUCKET_SECONDS
+        rows = []
+        if self.db_manager is not None:
+            rows.extend(self.db_manager.get_sketches(metric, start_bucket, end, sandbox_id))
+        with self._lock:
+            rows.extend(
+                (key_sandbox, sketch.to_bytes())
+                for (key_sandbox, bucket, key_metric), sketch in self._sketches.items()
+                if key_metric == metric and start_bucket <= bucket < end
+                and (sandbox_id is None or key_sandbox == sandbox_id)
+            )
+
+        merged: Dict[str, HyperLogLog] = {}
+        for row_sandbox, registers in rows:
+            if len(registers) != 1 << self.precision:
+                continue  # скетч другой точности
+            sketch = merged.get(row_sandbox)
+            if sketch is None:
+                merged[row_sandbox] = HyperLogLog(self.precision, registers)
+            else:
+                sketch.registers = bytearray(map(max, sketch.registers, registers))
+        return merged
+
+    def sketch(self, metric: str, start: float, end: float, sandbox_id: Optional[str] = None) -> HyperLogLog:
+        """Объединённый скетч метрики за [start, end) (sandbox_id=None - по всем песочницам)"""
+        total = HyperLogLog(self.precision)
+        for sketch in self._collect(metric, start, end, sandbox_id).values():
+            total.merge(sketch)
+        return total
+
+    def estimate(self, metric: str, start: float, end: float, sandbox_id: Optional[str] = None) -> int:
+        """Оценка числа различных значений метрики за [start, end)"""
+        return self.sketch(metric, start, end, sandbox_id).count()
+
+    def summary(self, start: float, end: float) -> Dict[str, Any]:
+        """Оценки обеих метрик за [start, end): всего и по песочницам"""
+        result = {"start": start, "end": end, "unique_attackers": 0, "distinct_payloads": 0, "sandboxes": {}}
+        for metric, field in (('attackers', 'unique_attackers'), ('payloads', 'distinct_payloads')):
+            total = HyperLogLog(self.precision)
+            for sandbox_id, sketch in self._collect(metric, start, end).items():
+                result["sandboxes"].setdefault(sandbox_id, {"unique_attackers": 0, "distinct_payloads": 0})[field] = sketch.count()
+                total.merge(sketch)
+            result[field] = total.count()
+        result["sandboxes"] = dict(sorted(result["sandboxes"].items()))
+        return result
+
+    def today(self) -> Dict[str, Any]:
+        """
+        Уникальные атакующие и нагрузки за сегодня, всего и по песочницам
+        (для /api/stats). Пересчитывается не чаще раза в flush_interval секунд.
+        """
+        cached = self._today_cache
+        if cached is not None and time.monotonic() - cached[0] < self.flush_interval:
+            return cached[1]
+        now = self.clock()
+        start = datetime.fromtimestamp(now).replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+        result = self.summary(start, now + BUCKET_SECONDS)
+        self._today_cache = (time.monotonic(), result)
+        return result
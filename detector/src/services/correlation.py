@@ -0,0 +1,315 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Any, List, Optional, Tuple
+
+from services.metrics import CORRELATION_ALERTS
+
+# Типы производных оповещений
+SCANNER_ALERT = 'SCANNER'
+MULTI_VECTOR_ALERT = 'MULTI_VECTOR'
+
+
+class SlidingWindow:
+    """
+    Счётчики за последние window секунд, разбитые на корзины по bucket секунд.
+
+    Добавление - O(1) амортизированно: значения прибавляются к последней
+    корзине и к итогам окна, устаревшие корзины снимаются с начала очереди
+    (каждая корзина добавляется и удаляется ровно один раз). Итоги окна
+    точны с точностью до одной корзины.
+    """
+
+    __slots__ = ('bucket', 'size', 'buckets', 'totals', 'last_seen')
+
+    def __init__(self, window: float, bucket: float):
+        self.bucket = bucket
+        self.size = max(1, int(round(window / bucket)))
+        # Очередь корзин: [номер корзины, {счётчик: значение}]
+        self.buckets = deque()
+        self.totals: Dict[str, int] = {}
+        self.last_seen = 0.0
+
+    def add(self, now: float, counts: Dict[str, int]):
+        index = int(now // self.bucket)
+        self.expire(now)
+        if self.buckets and self.buckets[-1][0] >= index:
+            # Та же корзина (или запоздавшее значение - учитываем в последней)
+            current = self.buckets[-1][1]
+        else:
+            current = {}
+            self.buckets.append([index, current])
+        totals = self.totals
+        for key, value in counts.items():
+            current[key] = current.get(key, 0) + value
+            totals[key] = totals.get(key, 0) + value
+        self.last_seen = max(self.last_seen, now)
+
+    def expire(self, now: float):
+        """Снимает корзины, вышедшие из окна"""
+        oldest = int(now // self.bucket) - self.size + 1
+        buckets = self.buckets
+        totals = self.totals
+        while buckets and buckets[0][0] < oldest:
+            for key, value in buckets.popleft()[1].items():
+                remaining = totals[key] - value
+                if remaining:
+                    totals[key] = remaining
+                else:
+                    del totals[key]
+
+    def get(self, key: str) -> int:
+        return self.totals.get(key, 0)
+
+
+class CorrelationEngine:
+    """
+    Корреляция обнаружений по атакующему в скользящем окне.
+
+    Для каждого source_ip и каждой пары (source_ip, sandbox_id) ведутся
+    счётчики SlidingWindow: запросы, запросы с атаками, обнаружения и
+    обнаружения по типам атак. По ним выдаются производные оповещения:
+      - SCANNER      - больше scanner_threshold обнаружений от одного IP за окно
+      - MULTI_VECTOR - не меньше multi_vector_types разных типов атак от
+                       одного IP на одну песочницу за окно
+    Повтор оповещения того же типа по тому же ключу - не чаще alert_cooldown.
+
+    Кампания - накопительная сводка по паре (source_ip, sandbox_id) с первого
+    обращения: типы атак, пути, оповещения. Кампания закрывается после
+    campaign_idle секунд без запросов. Окна и кампании без активности
+    удаляются, а их число ограничено max_keys и max_campaigns, поэтому
+    память не растёт с числом атакующих.
+
+    Состояние живёт в памяти процесса (как MemoryEventStore): при нескольких
+    воркерах каждый видит свою часть трафика.
+    """
+
+    def __init__(self, window: float = 60.0, bucket: float = 5.0, scanner_threshold: int = 20,
+                 multi_vector_types: int = 2, alert_cooldown: float = 60.0, campaign_idle: float = 1800.0,
+                 max_keys: int = 100000, max_campaigns: int = 10000, max_alerts: int = 1000,
+                 max_campaign_paths: int = 50, clock=time.time):
+        self.window = window
+        self.bucket = bucket
+        self.scanner_threshold = scanner_threshold
+        self.multi_vector_types = multi_vector_types
+        self.alert_cooldown = alert_cooldown
+        self.campaign_idle = campaign_idle
+        self.max_keys = max_keys
+        self.max_campaigns = max_campaigns
+        self.max_campaign_paths = max_campaign_paths
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        # Ключ -> SlidingWindow; порядок - по последнему обновлению (старые в начале)
+        self._windows: 'OrderedDict[Tuple, SlidingWindow]' = OrderedDict()
+        # (source_ip, sandbox_id) -> сводка кампании; порядок - по последнему обновлению
+        self._campaigns: 'OrderedDict[Tuple[str, Optional[str]], Dict[str, Any]]' = OrderedDict()
+        # (тип оповещения, ключ) -> время последнего оповещения
+        self._last_alert: Dict[Tuple, float] = {}
+        self._alerts = deque(maxlen=max_alerts)
+        self._alert_totals: Dict[str, int] = {}
+        self._closed_campaigns = 0
+
+    # ===== ОБНОВЛЕНИЕ =====
+
+    def observe(self, source_ip: Optional[str], sandbox_id: Optional[str], detections: List[Dict[str, Any]],
+                url: Optional[str] = None, timestamp: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Учитывает проанализированный запрос; возвращает новые оповещения (обычно пустой список)"""
+        if not source_ip:
+            return []
+        return self.observe_many([(source_ip, sandbox_id, detections, url)], timestamp)
+
+    def observe_many(self, entries: List[tuple], timestamp: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Учитывает пакет кортежей (source_ip, sandbox_id, detections, url)
+        под одной блокировкой. Записи без source_ip пропускаются.
+        """
+        now = self.clock() if timestamp is None else timestamp
+        alerts = []
+        with self._lock:
+            for source_ip, sandbox_id, detections, url in entries:
+                if not source_ip:
+                    continue
+                counts = {'requests': 1}
+                if detections:
+                    counts['attack_requests'] = 1
+                    counts['detections'] = len(detections)
+                    for detection in detections:
+                        type_key = 'type:' + detection['type']
+                        counts[type_key] = counts.get(type_key, 0) + 1
+
+                ip_window = self._update(('ip', source_ip), now, counts)
+                pair_window = self._update(('pair', source_ip, sandbox_id), now, counts)
+                campaign = self._update_campaign(source_ip, sandbox_id, now, counts, url)
+
+                if detections:
+                    alerts.extend(self._check_alerts(source_ip, sandbox_id, ip_window, pair_window, campaign, now))
+            self._expire(now)
+        return alerts
+
+    def _update(self, key: Tuple, now: float, counts: Dict[str, int]) -> SlidingWindow:
+        window = self._windows.get(key)
+        if window is None:
+            window = SlidingWindow(self.window, self.bucket)
+            self._windows[key] = window
+        else:
+            self._windows.move_to_end(key)
+        window.add(now, counts)
+        return window
+
+    def _update_campaign(self, source_ip: str, sandbox_id: Optional[str], now: float,
+                         counts: Dict[str, int], url: Optional[str]) -> Dict[str, Any]:
+        key = (source_ip, sandbox_id)
+        campaign = self._campaigns.get(key)
+        if campaign is not None and now - campaign['last_seen'] > self.campaign_idle:
+            # Долгая пауза - начинается новая кампания
+            del self._campaigns[key]
+            self._closed_campaigns += 1
+            campaign = None
+        if campaign is None:
+            campaign = {
+                'source_ip': source_ip,
+                'sandbox_id': sandbox_id,
+                'first_seen': now,
+                'last_seen': now,
+                'requests': 0,
+                'attack_requests': 0,
+                'detections': 0,
+                'attack_types': {},
+                'paths': {},
+                'alerts': {}
+            }
+            self._campaigns[key] = campaign
+        else:
+            self._campaigns.move_to_end(key)
+
+        campaign['last_seen'] = max(campaign['last_seen'], now)
+        campaign['requests'] += 1
+        campaign['attack_requests'] += counts.get('attack_requests', 0)
+        campaign['detections'] += counts.get('detections', 0)
+        attack_types = campaign['attack_types']
+        for counter, value in counts.items():
+            if counter.startswith('type:'):
+                attack_type = counter[5:]
+                attack_types[attack_type] = attack_types.get(attack_type, 0) + value
+        if url and counts.get('attack_requests'):
+            paths = campaign['paths']
+            if url in paths or len(paths) < self.max_campaign_paths:
+                paths[url] = paths.get(url, 0) + 1
+        return campaign
+
+    def _check_alerts(self, source_ip: str, sandbox_id: Optional[str], ip_window: SlidingWindow,
+                      pair_window: SlidingWindow, campaign: Dict[str, Any], now: float) -> List[Dict[str, Any]]:
+        alerts = []
+
+        detections = ip_window.get('detections')
+        if detections > self.scanner_threshold:
+            alert = self._raise(SCANNER_ALERT, (source_ip,), now, {
+                'source_ip': source_ip,
+                'sandbox_id': sandbox_id,
+                'detections': detections,
+                'requests': ip_window.get('requests'),
+                'description': f"Сканер: {detections} обнаружений за {int(self.window)} с"
+            })
+            if alert:
+                alerts.append(alert)
+
+        attack_types = sorted(key[5:] for key in pair_window.totals if key.startswith('type:'))
+        if len(attack_types) >= self.multi_vector_types:
+            alert = self._raise(MULTI_VECTOR_ALERT, (source_ip, sandbox_id), now, {
+                'source_ip': source_ip,
+                'sandbox_id': sandbox_id,
+                'attack_types': attack_types,
+                'detections': pair_window.get('detections'),
+                'description': f"Комбинированная атака: {', '.join(attack_types)}"
+            })
+            if alert:
+                alerts.append(alert)
+
+        for alert in alerts:
+            campaign['alerts'][alert['type']] = campaign['alerts'].get(alert['type'], 0) + 1
+        return alerts
+
+    def _raise(self, alert_type: str, key: Tuple, now: float, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Создаёт оповещение, если по этому ключу не было такого же в течение alert_cooldown"""
+        cooldown_key = (alert_type,) + key
+        last = self._last_alert.get(cooldown_key)
+        if last is not None and now - last < self.alert_cooldown:
+            return None
+        self._last_alert[cooldown_key] = now
+        alert = {'type': alert_type, 'timestamp': now, 'window_seconds': self.window, **data}
+        self._alerts.append(alert)
+        self._alert_totals[alert_type] = self._alert_totals.get(alert_type, 0) + 1
+        CORRELATION_ALERTS.labels(alert_type).inc()
+        return alert
+
+    def _expire(self, now: float):
+        """Удаляет неактивные окна, кампании и отметки оповещений (самые старые - в начале)"""
+        windows = self._windows
+        while windows:
+            key, window = next(iter(windows.items()))
+            if len(windows) <= self.max_keys and now - window.last_seen < self.window:
+                break
+            windows.popitem(last=False)
+
+        campaigns = self._campaigns
+        while campaigns:
+            campaign = next(iter(campaigns.values()))
+            if len(campaigns) <= self.max_campaigns and now - campaign['last_seen'] <= self.campaign_idle:
+                break
+            campaigns.popitem(last=False)
+            self._closed_campaigns += 1
+
+        if len(self._last_alert) > self.max_keys:
+            self._last_alert = {
+                key: at for key, at in self._last_alert.items() if now - at < self.alert_cooldown
+            }
+
+    # ===== ЧТЕНИЕ =====
+
+    def recent_alerts(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Последние оповещения (новые в конце)"""
+        with self._lock:
+            alerts = list(self._alerts)
+        return alerts[-limit:] if limit > 0 else []
+
+    def campaigns(self, sandbox_id: Optional[str] = None, source_ip: Optional[str] = None,
+                  limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        Активные кампании (новые первыми), с фильтром по песочнице и/или IP.
+
+        Для каждой кампании добавляются текущие счётчики окна и длительность.
+        """
+        now = self.clock()
+        results = []
+        with self._lock:
+            for key in reversed(self._campaigns):
+                if len(results) >= limit:
+                    break
+                campaign = self._campaigns[key]
+                if sandbox_id is not None and campaign['sandbox_id'] != sandbox_id:
+                    continue
+                if source_ip is not None and campaign['source_ip'] != source_ip:
+                    continue
+                window = self._windows.get(('pair',) + key)
+                if window is not None:
+                    window.expire(now)
+                view = dict(campaign)
+                view['attack_types'] = dict(campaign['attack_types'])
+                view['paths'] = dict(campaign['paths'])
+                view['alerts'] = dict(campaign['alerts'])
+                view['duration_seconds'] = round(campaign['last_seen'] - campaign['first_seen'], 3)
+                view['window'] = dict(window.totals) if window is not None else {}
+                results.append(view)
+        return results
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Размеры состояния и число оповещений по типам"""
+        with self._lock:
+            return {
+                'window_seconds': self.window,
+                'tracked_keys': len(self._windows),
+                'active_campaigns': len(self._campaigns),
+                'closed_campaigns': self._closed_campaigns,
+                'alerts': dict(self._alert_totals)
+            }
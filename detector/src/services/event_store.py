@@ -0,0 +1,61 @@
+from typing import Dict, Any, List, Optional
+
+
+class MemoryEventStore:
+    """Хранилище событий в памяти процесса (режим с одним воркером)"""
+
+    def __init__(self):
+        self.events: List[Dict[str, Any]] = []
+        self.attacks: List[Dict[str, Any]] = []
+
+    def add(self, event_data: Dict[str, Any], attack_event: Optional[Dict[str, Any]] = None):
+        """Сохраняет событие и, если есть, атаку из него"""
+        self.events.append(event_data)
+        if attack_event is not None:
+            self.attacks.append(attack_event)
+
+    def add_many(self, entries: List[tuple]):
+        """Сохраняет пакет кортежей (event_data, attack_event)"""
+        for event_data, attack_event in entries:
+            self.add(event_data, attack_event)
+
+    def recent_events(self, limit: int = 10) -> List[Dict[str, Any]]:
+        return self.events[-limit:] if self.events and limit > 0 else []
+
+    def recent_attacks(self, limit: int = 10) -> List[Dict[str, Any]]:
+        return self.attacks[-limit:] if self.attacks and limit > 0 else []
+
+    def depths(self) -> Dict[str, int]:
+        """Размеры буферов для метрик"""
+        return {"events_storage": len(self.events), "detected_attacks": len(self.attacks)}
+
+
+class DatabaseEventStore:
+    """
+    Хранилище событий в базе данных (многопроцессный режим).
+
+    Все воркеры пишут в одну таблицу events, поэтому /api/events и
+    /api/attacks возвращают одинаковые данные независимо от воркера.
+    """
+
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+
+    def add(self, event_data: Dict[str, Any], attack_event: Optional[Dict[str, Any]] = None):
+        """Сохраняет событие и, если есть, атаку из него"""
+        self.db_manager.save_event(event_data, attack_event)
+
+    def add_many(self, entries: List[tuple]):
+        """Сохраняет пакет кортежей (event_data, attack_event) одной транзакцией"""
+        if entries:
+            self.db_manager.save_events(entries)
+
+    def recent_events(self, limit: int = 10) -> List[Dict[str, Any]]:
+        return self.db_manager.get_recent_events(limit) if limit > 0 else []
+
+    def recent_attacks(self, limit: int = 10) -> List[Dict[str, Any]]:
+        return self.db_manager.get_recent_event_attacks(limit) if limit > 0 else []
+
+    def depths(self) -> Dict[str, int]:
+        """В памяти ничего не буферизуется"""
+        return {"events_storage": 0, "detected_attacks": 0}
@@ -0,0 +1,229 @@
+import heapq
+import re
+import threading
+import time
+from typing import Dict, Any, Hashable, List, Optional, Tuple
+
+# Измерения, по которым ведутся самые частые значения
+DIMENSIONS = ('source_ip', 'url', 'payload', 'sandbox_id')
+# Сколько разных запросов top (n, корзины) помнит кеш WindowedTopK
+TOP_CACHE_SIZE = 64
+
+_DIGITS_RE = re.compile(r'\d+')
+_SPACES_RE = re.compile(r'\s+')
+
+
+def payload_fingerprint(detection: Dict[str, Any]) -> str:
+    """
+    Отпечаток полезной нагрузки: тип атаки и нормализованный образец входа
+    (нижний регистр, числа -> 0, пробелы схлопнуты), чтобы варианты одной
+    атаки с разными числами и регистром считались вместе.
+    """
+    sample = detection.get('input_sample') or ''
+    sample = _SPACES_RE.sub(' ', _DIGITS_RE.sub('0', sample.lower())).strip()
+    return f"{detection['type']}:{sample}"
+
+
+class SpaceSaving:
+    """
+    Самые частые элементы потока в фиксированной памяти (алгоритм Space-Saving).
+
+    Хранится не больше capacity счётчиков. Новый элемент при заполненной
+    таблице вытесняет элемент с минимальным счётчиком и наследует его
+    значение как погрешность: count - error <= истинная частота <= count.
+    Любой элемент с частотой больше N / capacity гарантированно в таблице.
+    Минимум ищется по куче с ленивым удалением устаревших записей.
+    """
+
+    __slots__ = ('capacity', 'counts', 'total', '_heap')
+
+    def __init__(self, capacity: int = 100):
+        self.capacity = capacity
+        # Элемент -> [счётчик, погрешность]
+        self.counts: Dict[Hashable, List[int]] = {}
+        self.total = 0
+        self._heap: List[Tuple[int, int, Hashable]] = []
+
+    def add(self, key: Hashable, weight: int = 1):
+        self.total += weight
+        counts = self.counts
+        entry = counts.get(key)
+        if entry is not None:
+            entry[0] += weight
+        elif len(counts) < self.capacity:
+            entry = counts[key] = [weight, 0]
+        else:
+            minimum = self._pop_min()
+            entry = counts[key] = [minimum + weight, minimum]
+        heapq.heappush(self._heap, (entry[0], id(key), key))
+        if len(self._heap) > 4 * self.capacity:
+            # Слишком много устаревших записей - пересобираем кучу
+            self._heap = [(entry[0], id(k), k) for k, entry in counts.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_min(self) -> int:
+        """Удаляет элемент с минимальным счётчиком и возвращает этот счётчик"""
+        heap = self._heap
+        counts = self.counts
+        while True:
+            count, _, key = heapq.heappop(heap)
+            entry = counts.get(key)
+            if entry is not None and entry[0] == count:
+                del counts[key]
+                return count
+
+    def min_count(self) -> int:
+        """
+        Наибольшая возможная частота элемента, которого нет в таблице:
+        минимальный счётчик заполненной таблицы, иначе 0
+        """
+        if len(self.counts) < self.capacity:
+            return 0
+        return min(entry[0] for entry in self.counts.values())
+
+    def top(self, n: int) -> List[Tuple[Hashable, int, int]]:
+        """n самых частых: (элемент, счётчик, погрешность)"""
+        return [
+            (key, entry[0], entry[1])
+            for key, entry in heapq.nlargest(n, self.counts.items(), key=lambda item: item[1][0])
+        ]
+
+
+class WindowedTopK:
+    """
+    Space-Saving по корзинам времени: каждая корзина (bucket секунд) -
+    отдельная таблица, хранятся последние window / bucket корзин.
+
+    Память фиксирована: корзины * capacity счётчиков. Запрос за последние
+    seconds секунд объединяет нужные корзины: счётчики и погрешности
+    складываются, а за корзину, где значения нет, к обоим добавляется её
+    минимальный счётчик (столько значение могло набрать и быть вытеснено),
+    так что count - error <= истинная частота <= count сохраняется.
+    n ограничено capacity. Результат кешируется на cache_ttl секунд
+    (не больше TOP_CACHE_SIZE последних запросов), поэтому частый опрос
+    дашбордами не зависит от объёма трафика.
+    """
+
+    def __init__(self, capacity: int = 100, window: float = 3600.0, bucket: float = 300.0,
+                 cache_ttl: float = 1.0, clock=time.time):
+        self.capacity = capacity
+        self.bucket = bucket
+        self.size = max(1, int(round(window / bucket)))
+        self.cache_ttl = cache_ttl
+        self.clock = clock
+        # Кольцо корзин: позиция -> (номер корзины, SpaceSaving)
+        self._buckets: List[Optional[Tuple[int, SpaceSaving]]] = [None] * self.size
+        # (n, корзины) -> (время, результат); порядок ключей - от давно использованных
+        self._cache: Dict[Tuple[int, int], Tuple[float, List[Dict[str, Any]]]] = {}
+
+    def add(self, key: Hashable, now: float, weight: int = 1):
+        index = int(now // self.bucket)
+        position = index % self.size
+        slot = self._buckets[position]
+        if slot is None or slot[0] != index:
+            if slot is not None and slot[0] > index:
+                # Запоздавшее значение из уже перезаписанной корзины
+                return
+            slot = (index, SpaceSaving(self.capacity))
+            self._buckets[position] = slot
+        slot[1].add(key, weight)
+
+    def top(self, n: int = 10, seconds: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Самые частые значения за последние seconds секунд (по умолчанию - всё окно)"""
+        now = self.clock()
+        n = max(0, min(n, self.capacity))
+        buckets = self.size if seconds is None else max(1, min(self.size, int(-(-seconds // self.bucket))))
+        cache_key = (n, buckets)
+        cached = self._cache.pop(cache_key, None)
+        if cached is not None and now - cached[0] < self.cache_ttl:
+            self._cache[cache_key] = cached
+            return cached[1]
+
+        oldest = int(now // self.bucket) - buckets + 1
+        sketches = [slot[1] for slot in self._buckets if slot is not None and slot[0] >= oldest]
+        if len(sketches) == 1:
+            items = sketches[0].top(n)
+        else:
+            # Значение -> [счётчик, погрешность, сумма минимумов корзин, где оно есть]
+            floors = [sketch.min_count() for sketch in sketches]
+            floor_total = sum(floors)
+            merged: Dict[Hashable, List[int]] = {}
+            for sketch, floor in zip(sketches, floors):
+                for key, (count, error) in sketch.counts.items():
+                    entry = merged.get(key)
+                    if entry is None:
+                        merged[key] = [count, error, floor]
+                    else:
+                        entry[0] += count
+                        entry[1] += error
+                        entry[2] += floor
+            items = heapq.nlargest(n, (
+                (key, count + floor_total - present, error + floor_total - present)
+                for key, (count, error, present) in merged.items()
+            ), key=lambda item: item[1])
+
+        result = [{'value': key, 'count': count, 'error': error} for key, count, error in items]
+        self._cache[cache_key] = (now, result)
+        if len(self._cache) > TOP_CACHE_SIZE:
+            del self._cache[next(iter(self._cache))]
+        return result
+
+    def total(self, seconds: Optional[float] = None) -> int:
+        """Сколько значений учтено за последние seconds секунд"""
+        buckets = self.size if seconds is None else max(1, min(self.size, int(-(-seconds // self.bucket))))
+        oldest = int(self.clock() // self.bucket) - buckets + 1
+        return sum(slot[1].total for slot in self._buckets if slot is not None and slot[0] >= oldest)
+
+
+class HeavyHitters:
+    """
+    Потоковый top-K атакующих IP, атакуемых URL, отпечатков нагрузок и песочниц.
+
+    Учитываются только запросы с обнаружениями: IP, URL и песочница - по
+    одному на запрос, отпечаток - по одному на обнаружение. Ответ на
+    "top 20 IP за последний час" не требует GROUP BY по detections.
+    """
+
+    def __init__(self, capacity: int = 200, window: float = 3600.0, bucket: float = 300.0, clock=time.time):
+        self.window = window
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._sketches = {
+            dimension: WindowedTopK(capacity, window, bucket, clock=clock)
+            for dimension in DIMENSIONS
+        }
+
+    def observe(self, source_ip: Optional[str], sandbox_id: Optional[str], url: Optional[str],
+                detections: List[Dict[str, Any]], timestamp: Optional[float] = None):
+        """Учитывает проанализированный запрос (без обнаружений - ничего не делает)"""
+        if not detections:
+            return
+        now = self.clock() if timestamp is None else timestamp
+        sketches = self._sketches
+        with self._lock:
+            if source_ip:
+                sketches['source_ip'].add(source_ip, now)
+            if sandbox_id:
+                sketches['sandbox_id'].add(sandbox_id, now)
+            if url:
+                sketches['url'].add(url, now)
+            payloads = sketches['payload']
+            for detection in detections:
+                payloads.add(payload_fingerprint(detection), now)
+
+    def top(self, dimension: str, n: int = 20, seconds: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Top-n значений измерения за последние seconds секунд (ValueError для неизвестного измерения)"""
+        sketch = self._sketches.get(dimension)
+        if sketch is None:
+            raise ValueError(f"Неизвестное измерение: {dimension} (доступны: {', '.join(DIMENSIONS)})")
+        with self._lock:
+            return sketch.top(n, seconds)
+
+    def snapshot(self, n: int = 20, seconds: Optional[float] = None) -> Dict[str, Any]:
+        """Top-n по всем измерениям"""
+        with self._lock:
+            return {
+                'window_seconds': self.window if seconds is None else min(seconds, self.window),
+                'top': {dimension: sketch.top(n, seconds) for dimension, sketch in self._sketches.items()},
+                'totals': {dimension: sketch.total(seconds) for dimension, sketch in self._sketches.items()}
+            }
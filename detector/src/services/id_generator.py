@@ -0,0 +1,128 @@
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Начало отсчёта времени в идентификаторах (2024-01-01 00:00:00 UTC, мс)
+EPOCH_MS = 1704067200000
+
+# Раскладка 64-битного идентификатора: [0][время 41][воркер 10][последовательность 12]
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+SEQUENCE_MASK = (1 << SEQUENCE_BITS) - 1
+TIMESTAMP_SHIFT = WORKER_BITS + SEQUENCE_BITS
+# Сколько последних миллисекунд помнит id_at (последовательность внутри каждой)
+HISTORIC_MS_LIMIT = 65536
+
+
+class SnowflakeIdGenerator:
+    """
+    Генератор 64-битных идентификаторов в стиле Snowflake.
+
+    Идентификатор = время в мс от EPOCH_MS, номер воркера и номер внутри
+    миллисекунды. Воркеры с разными worker_id никогда не пересекаются,
+    поэтому ни межпроцессных блокировок, ни обращений к базе не нужно.
+    Внутри процесса идентификаторы строго возрастают: при переводе часов
+    назад или исчерпании последовательности генератор продолжает счёт
+    от последней выданной миллисекунды, а не ждёт.
+
+    Так как старшие биты - время, идентификаторы сортируются по времени
+    создания и подходят как кластерный ключ таблиц (см. min_id_for_time).
+    """
+
+    def __init__(self, worker_id: int, epoch_ms: int = EPOCH_MS):
+        if not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError(f"worker_id должен быть в диапазоне 0..{MAX_WORKER_ID}")
+        self.worker_id = worker_id
+        self.epoch_ms = epoch_ms
+        self._worker_bits = worker_id << SEQUENCE_BITS
+        self._last_ms = -1
+        self._sequence = 0
+        # Последовательности id_at: миллисекунда -> следующий номер
+        self._historic: Dict[int, int] = {}
+        # Блокировка только между потоками своего процесса
+        self._lock = threading.Lock()
+
+    def next_id(self) -> int:
+        """Возвращает следующий идентификатор"""
+        with self._lock:
+            return self._advance()
+
+    def next_ids(self, count: int) -> List[int]:
+        """Возвращает count идущих подряд идентификаторов (для пакетов)"""
+        with self._lock:
+            return [self._advance() for _ in range(count)]
+
+    def id_at(self, timestamp: float) -> int:
+        """
+        Идентификатор для момента timestamp в прошлом (повторный анализ
+        архивных логов): выборки по диапазону времени находят запрос по
+        времени из лога, а не по времени повторного анализа. Номера внутри
+        миллисекунды ведутся для HISTORIC_MS_LIMIT последних миллисекунд -
+        для логов, упорядоченных по времени, идентификаторы не повторяются.
+        Время в логах обычно с точностью до секунды: когда номера
+        миллисекунды исчерпаны (больше 4096 строк с одним временем), берётся
+        следующая миллисекунда со свободными номерами
+        """
+        ms = max(int(timestamp * 1000) - self.epoch_ms, 0)
+        with self._lock:
+            sequence = self._historic.get(ms, 0)
+            while sequence > SEQUENCE_MASK:
+                ms += 1
+                sequence = self._historic.get(ms, 0)
+            self._historic.pop(ms, None)
+            if len(self._historic) >= HISTORIC_MS_LIMIT:
+                # Забываем самую давно использованную миллисекунду
+                del self._historic[next(iter(self._historic))]
+            self._historic[ms] = sequence + 1
+        return (ms << TIMESTAMP_SHIFT) | self._worker_bits | sequence
+
+    def _advance(self) -> int:
+        """Сдвигает время/последовательность (вызывается под блокировкой)"""
+        now_ms = int(time.time() * 1000) - self.epoch_ms
+        if now_ms > self._last_ms:
+            self._last_ms = now_ms
+            self._sequence = 0
+        else:
+            self._sequence = (self._sequence + 1) & SEQUENCE_MASK
+            if self._sequence == 0:
+                # Последовательность исчерпана - занимаем следующую миллисекунду
+                self._last_ms += 1
+        return (self._last_ms << TIMESTAMP_SHIFT) | self._worker_bits | self._sequence
+
+
+def parse_id(snowflake_id: int, epoch_ms: int = EPOCH_MS) -> Tuple[float, int, int]:
+    """Раскладывает идентификатор на (unix-время в секундах, worker_id, последовательность)"""
+    timestamp_ms = (snowflake_id >> TIMESTAMP_SHIFT) + epoch_ms
+    worker_id = (snowflake_id >> SEQUENCE_BITS) & MAX_WORKER_ID
+    return timestamp_ms / 1000, worker_id, snowflake_id & SEQUENCE_MASK
+
+
+def format_id(snowflake_id: Optional[int]) -> Optional[str]:
+    """
+    Идентификатор для JSON ответа. 64-битные значения больше
+    Number.MAX_SAFE_INTEGER (2^53 - 1) и теряют точность в JavaScript,
+    поэтому наружу они передаются строкой; в базе остаются числами
+    """
+    return None if snowflake_id is None else str(snowflake_id)
+
+
+def min_id_for_time(timestamp: float, epoch_ms: int = EPOCH_MS) -> int:
+    """Наименьший идентификатор для момента времени (граница для выборок по диапазону)"""
+    return max(int(timestamp * 1000) - epoch_ms, 0) << TIMESTAMP_SHIFT
+
+
+def resolve_worker_id(shared=None) -> int:
+    """
+    Определяет номер воркера для генератора.
+
+    Порядок: переменная DETECTOR_WORKER_ID, затем строка воркера в
+    разделяемой памяти (уникальна среди живых воркеров), затем PID.
+    """
+    configured = os.environ.get("DETECTOR_WORKER_ID")
+    if configured:
+        return int(configured)
+    if shared is not None:
+        return shared.worker_slot
+    return os.getpid() & MAX_WORKER_ID
@@ -0,0 +1,361 @@
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qsl, unquote
+
+from services.stats_service import STAT_KEYS
+
+# Размер фрагмента файла для одного задания пула (байты)
+DEFAULT_CHUNK_SIZE = 32 * 1024 * 1024
+# Сколько запросов сохраняется одной транзакцией
+PERSIST_BATCH_SIZE = 5000
+
+# nginx/Apache: common и combined (referer и user-agent необязательны)
+COMBINED_RE = re.compile(
+    r'^(?P<remote>\S+) \S+ \S+ \[(?P<time>[^\]]+)\] '
+    r'"(?P<method>[A-Za-z]+) (?P<target>\S+)(?: [^"]*)?" '
+    r'(?P<status>\d{3}) \S+'
+    r'(?: "(?P<referer>[^"]*)" "(?P<agent>[^"]*)")?'
+)
+# Имя хоста песочницы (см. SandboxService: http://sandbox-{id}.localhost)
+SANDBOX_HOST_RE = re.compile(r'sandbox-([A-Za-z0-9_-]+)\.')
+
+# Возможные имена полей JSON логов (nginx log_format escape=json, Caddy, Traefik...)
+_JSON_FIELDS = {
+    'method': ('method', 'request_method', 'http_method'),
+    'url': ('url', 'uri', 'request_uri', 'path'),
+    'query': ('query', 'args', 'query_string'),
+    'request': ('request',),
+    'host': ('host', 'http_host', 'server_name'),
+    'agent': ('user_agent', 'http_user_agent', 'agent'),
+    'remote': ('remote_addr', 'client_ip', 'source_ip', 'remote'),
+    'time': ('time', 'time_local', 'time_iso8601', 'timestamp'),
+}
+
+
+# ===== РАЗБОР СТРОК =====
+
+@lru_cache(maxsize=4096)
+def _parse_time_text(value: str) -> Optional[float]:
+    """Время из текста лога в unix-секундах (строки одной секунды разбираются один раз)"""
+    try:
+        return float(value)  # $msec nginx
+    except ValueError:
+        pass
+    for parse in (datetime.fromisoformat, lambda text: datetime.strptime(text, '%d/%b/%Y:%H:%M:%S %z')):
+        try:
+            return parse(value).timestamp()
+        except ValueError:
+            continue
+    return None
+
+
+def parse_timestamp(value: Any) -> Optional[float]:
+    """
+    Время строки лога в unix-секундах: [10/Oct/2000:13:55:36 -0700],
+    ISO 8601 или число секунд (миллисекунд); None, если время не распознано
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value / 1000 if value > 1e11 else float(value)
+    if isinstance(value, str):
+        return _parse_time_text(value.strip())
+    return None
+
+
+def _split_target(target: str) -> Tuple[str, Dict[str, str]]:
+    """Делит цель запроса на путь и параметры (с декодированием %XX)"""
+    path, _, query = target.partition('?')
+    return unquote(path), dict(parse_qsl(query, keep_blank_values=True))
+
+
+def _first(record: Dict[str, Any], field: str) -> Any:
+    for key in _JSON_FIELDS[field]:
+        value = record.get(key)
+        if value not in (None, '', '-'):
+            return value
+    return None
+
+
+def parse_combined(line: str, default_sandbox: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Разбирает строку формата common/combined; None, если строка не подходит"""
+    match = COMBINED_RE.match(line)
+    if match is None:
+        return None
+    url, params = _split_target(match.group('target'))
+    agent = match.group('agent')
+    return {
+        'method': match.group('method').upper(),
+        'url': url,
+        'params': params,
+        'headers': {'User-Agent': agent} if agent and agent != '-' else {},
+        'sandbox_id': default_sandbox,
+        'source_ip': match.group('remote'),
+        'timestamp': parse_timestamp(match.group('time'))
+    }
+
+
+def parse_json(line: str, default_sandbox: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Разбирает строку JSON лога; None, если это не объект с запросом"""
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(record, dict):
+        return None
+
+    method = _first(record, 'method')
+    target = _first(record, 'url')
+    request_line = _first(record, 'request')
+    if (method is None or target is None) and isinstance(request_line, str):
+        # Поле request вида "GET /path?q=1 HTTP/1.1"
+        parts = request_line.split(' ')
+        if len(parts) >= 2:
+            method, target = method or parts[0], target or parts[1]
+    if not isinstance(method, str) or not isinstance(target, str):
+        return None
+
+    url, params = _split_target(target)
+    query = _first(record, 'query')
+    if isinstance(query, str):
+        params.update(parse_qsl(query.lstrip('?'), keep_blank_values=True))
+
+    sandbox_id = record.get('sandbox_id')
+    if sandbox_id is None:
+        host = _first(record, 'host')
+        host_match = SANDBOX_HOST_RE.search(host) if isinstance(host, str) else None
+        sandbox_id = host_match.group(1) if host_match else default_sandbox
+
+    agent = _first(record, 'agent')
+    return {
+        'method': method.upper(),
+        'url': url,
+        'params': params,
+        'headers': {'User-Agent': agent} if isinstance(agent, str) else {},
+        'sandbox_id': sandbox_id,
+        'source_ip': _first(record, 'remote'),
+        'timestamp': parse_timestamp(_first(record, 'time'))
+    }
+
+
+def parse_line(line: str, log_format: str = 'auto', default_sandbox: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Разбирает строку лога: log_format = 'combined', 'json' или 'auto'"""
+    line = line.strip()
+    if not line:
+        return None
+    if log_format == 'json' or (log_format == 'auto' and line[0] == '{'):
+        return parse_json(line, default_sandbox)
+    return parse_combined(line, default_sandbox)
+
+
+# ===== ФРАГМЕНТЫ ФАЙЛА =====
+
+def split_chunks(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> List[Tuple[int, int]]:
+    """Делит файл на диапазоны байт [start, end), границы которых совпадают с концами строк"""
+    size = os.path.getsize(path)
+    chunks = []
+    with open(path, 'rb') as f:
+        start = 0
+        while start < size:
+            end = start + chunk_size
+            if end >= size:
+                end = size
+            else:
+                f.seek(end)
+                f.readline()  # дочитываем строку, на которую попала граница
+                end = f.tell()
+            chunks.append((start, end))
+            start = end
+    return chunks
+
+
+def iter_chunk_lines(path: str, start: int, end: int) -> Iterator[str]:
+    """Строки диапазона [start, end) файла"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        position = start
+        while position < end:
+            raw = f.readline()
+            if not raw:
+                break
+            position += len(raw)
+            yield raw.decode('utf-8', errors='replace')
+
+
+# ===== ОБРАБОТКА В ПУЛЕ ПРОЦЕССОВ =====
+
+_worker_detector = None
+
+
+def _init_worker(db_path: Optional[str] = None):
+    """
+    Создаёт детектор в процессе пула (один раз на процесс). db_path - база,
+    в которую сохраняется повторный анализ (None - без записи: база не
+    открывается и не создаётся)
+    """
+    global _worker_detector
+    from main import CyberRangeDetector
+
+    _worker_detector = CyberRangeDetector(db_path=db_path)
+    # Метрики правил в процессе пула никто не читает - не тратим время на замеры
+    for rule_detector in (_worker_detector.sql_detector, _worker_detector.xss_detector,
+                          _worker_detector.path_traversal_detector):
+        rule_detector.rule_observer = None
+
+
+def _process_chunk(task: Tuple[str, int, int, str, Optional[str], bool]) -> Dict[str, Any]:
+    """
+    Разбирает и анализирует один фрагмент; возвращает записи для сохранения
+    (со временем строки) и счётчики - всего и по дням строк (None - время
+    не распознано)
+    """
+    path, start, end, log_format, default_sandbox, attacks_only = task
+    detector = _worker_detector
+
+    entries = []
+    lines = skipped = detections_total = 0
+    counts = dict.fromkeys(STAT_KEYS, 0)
+    counts_by_day: Dict[Optional[date], Dict[str, int]] = {}
+    day_cache: Dict[int, date] = {}
+
+    for line in iter_chunk_lines(path, start, end):
+        lines += 1
+        request = parse_line(line, log_format, default_sandbox)
+        if request is None:
+            skipped += 1
+            continue
+
+        timestamp = request['timestamp']
+        if timestamp is None:
+            day = None
+        else:
+            # Сутки по местному времени, как у дневной статистики
+            day = day_cache.get(int(timestamp // 3600))
+            if day is None:
+                day = day_cache[int(timestamp // 3600)] = date.fromtimestamp(timestamp)
+        day_counts = counts_by_day.get(day)
+        if day_counts is None:
+            day_counts = counts_by_day[day] = dict.fromkeys(STAT_KEYS, 0)
+
+        detections = detector.detect(request['method'], request['url'], request['params'])
+        for key, value in detector.count_detections(detections).items():
+            counts[key] += value
+            day_counts[key] += value
+        detections_total += len(detections)
+        if detections or not attacks_only:
+            entries.append((request['method'], request['url'], request['params'], request['sandbox_id'], detections,
+                            timestamp))
+
+    return {
+        'entries': entries,
+        'lines': lines,
+        'skipped': skipped,
+        'detections': detections_total,
+        'counts': counts,
+        'counts_by_day': counts_by_day
+    }
+
+
+def _db_time(timestamp: Optional[float]) -> Optional[str]:
+    """Время строки в формате столбца requests.timestamp (UTC, как CURRENT_TIMESTAMP)"""
+    if timestamp is None:
+        return None
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(timestamp))
+
+
+def replay_logs(paths: List[str], workers: Optional[int] = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                log_format: str = 'auto', default_sandbox: Optional[str] = None, persist: bool = True,
+                attacks_only: bool = False, update_stats: bool = False, db_manager=None,
+                progress=None) -> Dict[str, Any]:
+    """
+    Повторно анализирует архивные логи доступа.
+
+    Файлы делятся на фрагменты по chunk_size байт (по границам строк),
+    фрагменты разбираются и анализируются в пуле из workers процессов
+    (workers=1 - в текущем процессе). Результаты сохраняются в базу
+    (db_manager) пакетами по PERSIST_BATCH_SIZE запросов одной транзакцией
+    со временем из строк лога: оно же задаёт идентификаторы запросов и день
+    статистики. Дневная статистика меняется, только если update_stats=True.
+    При persist=False база не открывается ни здесь, ни в процессах пула.
+    progress(report) вызывается после каждого фрагмента.
+
+    Возвращает отчёт: строки, запросы, обнаружения, время и строки/сек.
+    """
+    if persist and db_manager is None:
+        from database.db_manager import DatabaseManager
+        db_manager = DatabaseManager()
+    db_path = db_manager.db_path if persist else None
+    workers = workers or os.cpu_count() or 1
+
+    tasks = [
+        (path, start, end, log_format, default_sandbox, attacks_only)
+        for path in paths
+        for start, end in split_chunks(path, chunk_size)
+    ]
+
+    from services.id_generator import SnowflakeIdGenerator, resolve_worker_id
+    ids = SnowflakeIdGenerator(resolve_worker_id())
+
+    report = {
+        'files': len(paths), 'chunks': len(tasks), 'workers': workers,
+        'lines': 0, 'skipped': 0, 'requests': 0, 'detected_attacks': 0,
+        'detections': 0, 'persisted': 0, 'chunks_done': 0
+    }
+    started = time.perf_counter()
+
+    def consume(result: Dict[str, Any]):
+        entries = result['entries']
+        report['lines'] += result['lines']
+        report['skipped'] += result['skipped']
+        report['requests'] += result['counts']['total_requests']
+        report['detected_attacks'] += result['counts']['detected_attacks']
+        report['detections'] += result['detections']
+        report['chunks_done'] += 1
+
+        if persist and entries:
+            for offset in range(0, len(entries), PERSIST_BATCH_SIZE):
+                batch = entries[offset:offset + PERSIST_BATCH_SIZE]
+                db_manager.save_analysis_batch([
+                    (ids.next_id() if timestamp is None else ids.id_at(timestamp),
+                     method, url, params, sandbox_id, detections, _db_time(timestamp))
+                    for method, url, params, sandbox_id, detections, timestamp in batch
+                ], None)
+            report['persisted'] += len(entries)
+            if update_stats:
+                for day, counts in result['counts_by_day'].items():
+                    db_manager.update_statistics(counts, day)
+
+        if progress is not None:
+            progress(report)
+
+    if workers == 1:
+        _init_worker(db_path)
+        for task in tasks:
+            consume(_process_chunk(task))
+    else:
+        # Не больше двух фрагментов на процесс в работе: результаты не
+        # накапливаются в памяти, если запись в базу медленнее анализа
+        pending = set()
+        remaining = iter(tasks)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(db_path,)) as pool:
+            while True:
+                for task in remaining:
+                    pending.add(pool.submit(_process_chunk, task))
+                    if len(pending) >= workers * 2:
+                        break
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    consume(future.result())
+
+    elapsed = time.perf_counter() - started
+    report['seconds'] = round(elapsed, 3)
+    report['lines_per_sec'] = round(report['lines'] / elapsed, 1) if elapsed > 0 else 0.0
+    return report
@@ -0,0 +1,216 @@
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+try:
+    from pythonjsonlogger import jsonlogger
+    HAS_JSON_LOGGER = True
+except ImportError:
+    HAS_JSON_LOGGER = False
+
+# Корневой логгер детектора; категории - его дочерние логгеры
+ROOT_LOGGER = "detector"
+
+# Категории логирования и уровни по умолчанию
+DEFAULT_LEVELS = {
+    "api": logging.INFO,
+    "events": logging.INFO,
+    "analysis": logging.INFO,
+    "stats": logging.WARNING,
+    "db": logging.WARNING,
+    "admission": logging.INFO,
+}
+
+# Категории, сообщения которых пишутся на каждый запрос и поэтому ограничиваются
+HOT_PATH_CATEGORIES = ("events", "analysis", "stats", "admission")
+
+# Стандартные атрибуты LogRecord - всё остальное считается полями из extra
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_setup_lock = threading.Lock()
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional["DroppingQueueHandler"] = None
+
+
+class SimpleJsonFormatter(logging.Formatter):
+    """JSON-форматтер на случай, если python-json-logger не установлен"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                data[key] = value
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Ограничивает частоту сообщений горячего пути.
+
+    Для каждого шаблона сообщения действует корзина токенов на rate
+    сообщений в секунду (с запасом burst). Сверх лимита пропускается
+    каждое sample_every-е сообщение; к пропущенным записям добавляется
+    поле suppressed с числом отброшенных до неё сообщений.
+    """
+
+    def __init__(self, rate: float = 20.0, burst: int = 50, sample_every: int = 1000):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.sample_every = sample_every
+        self._buckets: Dict[str, list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # Ошибки и предупреждения не ограничиваются
+        if record.levelno >= logging.WARNING:
+            return True
+
+        now = time.monotonic()
+        key = f"{record.name}:{record.msg}"
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            # [токены, время последнего пополнения, отброшено подряд]
+            bucket = self._buckets[key] = [float(self.burst), now, 0]
+
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+
+        if tokens >= 1.0:
+            bucket[0] = tokens - 1.0
+        else:
+            bucket[0] = tokens
+            bucket[2] += 1
+            if bucket[2] % self.sample_every:
+                return False
+
+        if bucket[2]:
+            record.suppressed = bucket[2]
+            bucket[2] = 0
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, который не блокирует запрос при переполнении очереди, а отбрасывает запись"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _parse_levels(spec: str, invalid: Optional[List[str]] = None) -> Dict[str, int]:
+    """
+    Разбирает строку вида "api=INFO,analysis=WARNING". Элементы с
+    неизвестным уровнем пропускаются и добавляются в invalid
+    """
+    levels = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        category, level = item.split("=", 1)
+        # Для неизвестного имени getLevelName возвращает строку "Level X"
+        value = logging.getLevelName(level.strip().upper())
+        if isinstance(value, int):
+            levels[category.strip()] = value
+        elif invalid is not None:
+            invalid.append(item.strip())
+    return levels
+
+
+def setup_logging(levels: Optional[Dict[str, int]] = None, queue_size: int = 10000,
+                  rate: float = 20.0, burst: int = 50, sample_every: int = 1000):
+    """
+    Настраивает структурированное логирование детектора.
+
+    Записи попадают в ограниченную очередь, а в stdout их пишет отдельный
+    поток QueueListener, поэтому обработчик запроса не ждёт вывода.
+    Уровни категорий можно переопределить переменной окружения
+    DETECTOR_LOG_LEVELS (например "analysis=WARNING,db=INFO").
+    Повторный вызов только обновляет уровни.
+    """
+    category_levels = dict(DEFAULT_LEVELS)
+    category_levels.update(levels or {})
+    invalid_levels: List[str] = []
+    category_levels.update(_parse_levels(os.environ.get("DETECTOR_LOG_LEVELS", ""), invalid_levels))
+
+    with _setup_lock:
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(logging.DEBUG)
+        root.propagate = False
+
+        for category, level in category_levels.items():
+            logging.getLogger(f"{ROOT_LOGGER}.{category}").setLevel(level)
+
+        if _listener is None:
+            _start_listener(root, queue_size, rate, burst, sample_every)
+
+    if invalid_levels:
+        get_logger("api").warning("Неизвестный уровень логирования в DETECTOR_LOG_LEVELS пропущен",
+                                  extra={"entries": invalid_levels})
+
+
+def _start_listener(root: logging.Logger, queue_size: int, rate: float, burst: int, sample_every: int):
+    """Создаёт очередь записей и поток вывода (вызывается под _setup_lock)"""
+    global _listener, _queue_handler
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if HAS_JSON_LOGGER:
+        stream_handler.setFormatter(jsonlogger.JsonFormatter("%(created)f %(levelname)s %(name)s %(message)s"))
+    else:
+        stream_handler.setFormatter(SimpleJsonFormatter())
+
+    _queue_handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+    root.addHandler(_queue_handler)
+
+    for category in HOT_PATH_CATEGORIES:
+        logger = logging.getLogger(f"{ROOT_LOGGER}.{category}")
+        if not any(isinstance(f, RateLimitFilter) for f in logger.filters):
+            logger.addFilter(RateLimitFilter(rate=rate, burst=burst, sample_every=sample_every))
+
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_logging():
+    """Останавливает поток вывода, дописав оставшиеся записи"""
+    global _listener, _queue_handler
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+        if _queue_handler is not None:
+            logging.getLogger(ROOT_LOGGER).removeHandler(_queue_handler)
+            _queue_handler = None
+
+
+def get_logger(category: str) -> logging.Logger:
+    """Возвращает логгер категории (api, events, analysis, stats, db, admission)"""
+    return logging.getLogger(f"{ROOT_LOGGER}.{category}")
+
+
+def get_dropped_count() -> int:
+    """Сколько записей отброшено из-за переполнения очереди"""
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+
+def get_queue_depth() -> int:
+    """Сколько записей ожидает вывода"""
+    return _queue_handler.queue.qsize() if _queue_handler is not None else 0
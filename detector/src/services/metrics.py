@@ -0,0 +1,293 @@
+import bisect
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Границы корзин гистограмм (секунды)
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+RULE_BUCKETS = (0.000001, 0.0000025, 0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005, 0.01)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _Shards:
+    """
+    Набор ячеек счётчика, по одной на поток.
+
+    Запись идёт в ячейку своего потока без блокировок; блокировка берётся
+    только при первой записи потока и при чтении (сборе метрик).
+    """
+
+    def __init__(self, size: int):
+        self._size = size
+        self._local = threading.local()
+        self._cells: List[list] = []
+        self._lock = threading.Lock()
+
+    def cell(self) -> list:
+        try:
+            return self._local.cell
+        except AttributeError:
+            cell = [0] * self._size
+            with self._lock:
+                self._cells.append(cell)
+            self._local.cell = cell
+            return cell
+
+    def total(self) -> list:
+        with self._lock:
+            cells = list(self._cells)
+        result = [0] * self._size
+        for cell in cells:
+            for i, value in enumerate(cell):
+                result[i] += value
+        return result
+
+
+class _CounterChild:
+    def __init__(self):
+        self._shards = _Shards(1)
+
+    def inc(self, amount: float = 1):
+        self._shards.cell()[0] += amount
+
+    def value(self) -> float:
+        return self._shards.total()[0]
+
+
+class _HistogramChild:
+    def __init__(self, buckets: Sequence[float]):
+        self._buckets = buckets
+        # [корзины..., +Inf, сумма, количество]
+        self._shards = _Shards(len(buckets) + 3)
+
+    def observe(self, value: float):
+        cell = self._shards.cell()
+        cell[bisect.bisect_left(self._buckets, value)] += 1
+        cell[-2] += value
+        cell[-1] += 1
+
+    def values(self) -> list:
+        return self._shards.total()
+
+
+class _Metric:
+    """Базовый класс метрики с метками"""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """Возвращает дочернюю метрику для значений меток (кешируется)"""
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._new_child()
+        return child
+
+    def _label_str(self, values: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for values, child in list(self._children.items()):
+            lines.append(f"{self.name}{self._label_str(values)} {_fmt(child.value())}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for values, child in list(self._children.items()):
+            totals = child.values()
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), totals):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _fmt(bound)
+                le_label = f'le="{le}"'
+                lines.append(f"{self.name}_bucket{self._label_str(values, le_label)} {_fmt(cumulative)}")
+            lines.append(f"{self.name}_sum{self._label_str(values)} {_fmt(totals[-2])}")
+            lines.append(f"{self.name}_count{self._label_str(values)} {_fmt(totals[-1])}")
+        return lines
+
+
+class Gauge(_Metric):
+    """
+    Метрика-значение, вычисляемое при сборе.
+
+    callback возвращает число либо список пар (значения меток, число).
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback: Callable, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        try:
+            value = self.callback()
+        except Exception:
+            return lines
+        samples: Iterable = [((), value)] if not self.labelnames else value
+        for values, sample in samples:
+            lines.append(f"{self.name}{self._label_str(tuple(values))} {_fmt(sample)}")
+        return lines
+
+
+class MetricsRegistry:
+    """Реестр метрик, отдаваемых эндпоинтом /metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, callback: Callable, labelnames: Sequence[str] = ()) -> Gauge:
+        metric = Gauge(name, documentation, callback, labelnames)
+        with self._lock:
+            # Колбэк можно переопределить (например, при пересоздании детектора)
+            self._metrics[name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Возвращает все метрики в текстовом формате Prometheus"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(value: float) -> str:
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+# ===== МЕТРИКИ ДЕТЕКТОРА =====
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "detector_http_request_seconds", "Время обработки HTTP запроса по эндпоинтам",
+    ("method", "endpoint", "status")
+)
+DETECTOR_MATCH_SECONDS = REGISTRY.histogram(
+    "detector_match_seconds", "Время работы детектора на один анализируемый запрос",
+    ("detector",)
+)
+RULE_MATCH_SECONDS = REGISTRY.histogram(
+    "detector_rule_match_seconds", "Время проверки одного правила",
+    ("detector", "rule"), buckets=RULE_BUCKETS
+)
+RULE_HITS = REGISTRY.counter(
+    "detector_rule_hits_total", "Количество срабатываний правила",
+    ("detector", "rule")
+)
+DB_WRITE_SECONDS = REGISTRY.histogram(
+    "detector_db_write_seconds", "Время записи в базу данных",
+    ("operation",)
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    "detector_cache_requests_total", "Обращения к кешам (hit/miss)",
+    ("cache", "result")
+)
+SHED_REQUESTS = REGISTRY.counter(
+    "detector_shed_requests_total", "Запросы, отклонённые контролем нагрузки",
+    ("endpoint", "reason")
+)
+
+CORRELATION_ALERTS = REGISTRY.counter(
+    "detector_correlation_alerts_total", "Производные оповещения корреляции по атакующим",
+    ("type",)
+)
+
+RULE_RELOADS = REGISTRY.counter(
+    "detector_rule_reloads_total", "Перезагрузки пакета правил (applied - применён, rejected - отклонён)",
+    ("result",)
+)
+
+
+def observe_rule(detector: str, rule: str, seconds: float, matched: bool):
+    """Наблюдатель правил для детекторов (см. атрибут rule_observer)"""
+    RULE_MATCH_SECONDS.labels(detector, rule).observe(seconds)
+    if matched:
+        RULE_HITS.labels(detector, rule).inc()
+
+
+def rule_cost(detector: str, rule: str, min_samples: int = 50) -> Optional[Tuple[float, float]]:
+    """
+    Замеры правила по observe_rule: (средняя длительность проверки в
+    секундах, доля срабатываний); None, если проверок меньше min_samples
+    """
+    timings = RULE_MATCH_SECONDS._children.get((detector, rule))
+    if timings is None:
+        return None
+    values = timings.values()
+    count = values[-1]
+    if count < min_samples:
+        return None
+    hits = RULE_HITS._children.get((detector, rule))
+    return values[-2] / count, (hits.value() if hits is not None else 0) / count
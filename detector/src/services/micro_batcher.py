@@ -0,0 +1,125 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List
+
+from services.logging_service import get_logger
+
+
+class MicroBatcher:
+    """
+    Группирует поступающие элементы в микропакеты.
+
+    submit() кладёт элемент в очередь и сразу возвращает Future. Фоновый
+    поток забирает элементы, пока не наберётся max_batch или не пройдёт
+    max_delay секунд с первого элемента пакета, и передаёт весь пакет в
+    process_batch(items) -> results (по одному результату на элемент;
+    элементы, для которых результата не хватило, завершаются ошибкой).
+    Так анализ и запись в БД выполняются один раз на пакет, а задержка
+    одного элемента ограничена max_delay плюс время обработки пакета.
+    """
+
+    def __init__(self, process_batch: Callable[[List[Any]], List[Any]], max_batch: int = 256,
+                 max_delay: float = 0.005, name: str = "micro-batcher"):
+        self.process_batch = process_batch
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.name = name
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = None
+        self._stopping = False
+        self._start_lock = threading.Lock()
+
+        # Статистика для метрик
+        self.batches = 0
+        self.items = 0
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Обрабатывает оставшиеся элементы и останавливает поток"""
+        with self._start_lock:
+            thread = self._thread
+            if thread is None:
+                return
+            self._stopping = True
+            self._queue.put(None)
+            thread.join(timeout)
+            self._thread = None
+
+    def submit(self, item: Any) -> Future:
+        """Ставит элемент в очередь и возвращает Future с его результатом"""
+        if self._thread is None:
+            self.start()
+        future = Future()
+        self._queue.put((item, future, time.monotonic()))
+        return future
+
+    def depth(self) -> int:
+        """Сколько элементов ожидает обработки"""
+        return self._queue.qsize()
+
+    def queue_delay(self) -> float:
+        """Сколько секунд ждёт самый старый элемент очереди (для контроля нагрузки)"""
+        try:
+            entry = self._queue.queue[0]
+        except IndexError:
+            return 0.0
+        if entry is None:
+            return 0.0
+        return time.monotonic() - entry[2]
+
+    def _collect(self, first) -> List:
+        """Добирает пакет после первого элемента"""
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is None:
+                self._stopping = True
+                break
+            batch.append(entry)
+        return batch
+
+    def _run(self):
+        while True:
+            if self._stopping and self._queue.empty():
+                return
+            entry = self._queue.get()
+            if entry is None:
+                if self._queue.empty():
+                    return
+                continue
+
+            batch = self._collect(entry)
+            items = [item for item, _, _ in batch]
+            try:
+                results = self.process_batch(items)
+            except Exception as e:
+                get_logger("api").exception("Ошибка обработки микропакета", extra={"batcher": self.name, "size": len(items)})
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.items += len(items)
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+            if len(results) < len(batch):
+                get_logger("api").error("Микропакет вернул меньше результатов, чем элементов", extra={
+                    "batcher": self.name, "size": len(items), "results": len(results)
+                })
+                error = RuntimeError(f"{self.name}: нет результата для элемента пакета")
+                for _, future, _ in batch[len(results):]:
+                    future.set_exception(error)
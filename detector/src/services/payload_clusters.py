@@ -0,0 +1,205 @@
+import hashlib
+import re
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+# Слова, которые сохраняются в форме нагрузки как есть (остальные -> w)
+KEYWORDS = frozenset((
+    # SQL
+    'select', 'union', 'all', 'from', 'where', 'and', 'or', 'not', 'null', 'insert', 'into', 'values',
+    'update', 'set', 'delete', 'drop', 'table', 'order', 'by', 'group', 'having', 'limit', 'like',
+    'sleep', 'benchmark', 'waitfor', 'delay', 'exec', 'execute', 'information_schema', 'case', 'when',
+    'then', 'else', 'end', 'char', 'concat', 'substring', 'ascii', 'version', 'user', 'database',
+    # XSS
+    'script', 'alert', 'prompt', 'confirm', 'img', 'svg', 'iframe', 'body', 'src', 'href', 'javascript',
+    'onerror', 'onload', 'onmouseover', 'onclick', 'onfocus', 'document', 'cookie', 'window', 'eval',
+    # Path traversal
+    'etc', 'passwd', 'shadow', 'hosts', 'windows', 'system32', 'win', 'ini', 'boot', 'proc', 'self', 'environ'
+))
+
+_TOKEN_RE = re.compile(r'(?P<num>\d+(?:\.\d+)?)|(?P<word>[a-z_][a-z0-9_]*)|(?P<space>\s+)|(?P<punct>.)', re.S)
+# Длина формы в токенах (хвост длинных нагрузок не влияет на кластер)
+MAX_SHAPE_TOKENS = 64
+
+
+def token_shape(text: str) -> Tuple[str, ...]:
+    """
+    Нормализованная форма нагрузки: ключевые слова SQL/HTML/путей в верхнем
+    регистре, прочие идентификаторы -> w, числа -> 0, знаки препинания как
+    есть, пробелы отброшены. "admin' OR 1=1--" и "root' or 7=7 --" дают
+    одну форму: w ' OR 0 = 0 - -.
+    """
+    tokens = []
+    for match in _TOKEN_RE.finditer(text.lower()):
+        kind = match.lastgroup
+        if kind == 'space':
+            continue
+        if kind == 'num':
+            tokens.append('0')
+        elif kind == 'word':
+            word = match.group()
+            tokens.append(word.upper() if word in KEYWORDS else 'w')
+        else:
+            tokens.append(match.group())
+        if len(tokens) >= MAX_SHAPE_TOKENS:
+            break
+    return tuple(tokens)
+
+
+class PayloadClusterer:
+    """
+    Группирует почти одинаковые нагрузки в кластеры.
+
+    Детекция получает cluster_id: нагрузки одной формы (token_shape) сразу
+    попадают в один кластер, а новая форма сравнивается с известными по
+    MinHash-подписи (num_perm 32-битных хешей над триграммами токенов) через
+    LSH: bands полос по num_perm / bands строк. Если оценка сходства
+    Жаккара с кандидатом не ниже threshold, форма присоединяется к его
+    кластеру, иначе создаётся новый. MinHash считается только для новых
+    форм, поэтому повторяющиеся варианты сканеров обходятся в один поиск
+    по словарю.
+
+    Память ограничена: max_shapes форм (LRU) и max_clusters кластеров
+    (старейшие вытесняются вместе с их записями LSH).
+    """
+
+    def __init__(self, threshold: float = 0.6, num_perm: int = 64, bands: int = 16,
+                 max_shapes: int = 50000, max_clusters: int = 10000):
+        if num_perm % bands:
+            raise ValueError("num_perm должно делиться на bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.max_shapes = max_shapes
+        self.max_clusters = max_clusters
+
+        self._lock = threading.Lock()
+        # (тип атаки, форма) -> cluster_id
+        self._shapes: 'OrderedDict[Tuple[str, Tuple[str, ...]], str]' = OrderedDict()
+        # cluster_id -> (тип атаки, подпись, ключи LSH)
+        self._clusters: 'OrderedDict[str, Tuple[str, Tuple[int, ...], List[tuple]]]' = OrderedDict()
+        # (тип атаки, номер полосы, значения полосы) -> cluster_id
+        self._buckets: Dict[tuple, str] = {}
+        # Новые кластеры, ещё не сохранённые в базу
+        self._pending: List[Dict[str, Any]] = []
+
+    # ===== НАЗНАЧЕНИЕ КЛАСТЕРОВ =====
+
+    def assign(self, detections: List[Dict[str, Any]]):
+        """Проставляет cluster_id каждой детекции (на месте)"""
+        for detection in detections:
+            detection['cluster_id'] = self.cluster_for(detection['type'], detection.get('input_sample') or '')
+
+    def cluster_for(self, attack_type: str, sample: str) -> str:
+        """cluster_id нагрузки (создаёт кластер, если похожего нет)"""
+        shape = token_shape(sample)
+        key = (attack_type, shape)
+        with self._lock:
+            cluster_id = self._shapes.get(key)
+            if cluster_id is not None:
+                self._shapes.move_to_end(key)
+                return cluster_id
+
+        # Новая форма: подпись считается вне блокировки
+        signature = self.signature(shape)
+        with self._lock:
+            cluster_id = self._find_similar(attack_type, signature)
+            if cluster_id is None:
+                cluster_id = self._create(attack_type, shape, signature, sample)
+            self._remember_shape(key, cluster_id)
+        return cluster_id
+
+    def signature(self, shape: Tuple[str, ...]) -> Tuple[int, ...]:
+        """
+        MinHash-подпись формы по триграммам токенов.
+
+        Вместо num_perm отдельных хеш-функций каждая триграмма хешируется
+        один раз в num_perm 32-битных значений (SHAKE-128), а подпись -
+        минимум по каждой позиции. Подписи детерминированы и совпадают
+        между процессами и после перезапуска.
+        """
+        if len(shape) >= 3:
+            shingles = {'\x1f'.join(shape[i:i + 3]) for i in range(len(shape) - 2)}
+        else:
+            shingles = {'\x1f'.join(shape)}
+        size = self.num_perm * 4
+        return tuple(map(min, zip(*(
+            array('I', hashlib.shake_128(shingle.encode('utf-8')).digest(size)) for shingle in shingles
+        ))))
+
+    def _band_keys(self, attack_type: str, signature: Tuple[int, ...]) -> List[tuple]:
+        rows = self.rows
+        return [(attack_type, band, signature[band * rows:(band + 1) * rows]) for band in range(self.bands)]
+
+    def _find_similar(self, attack_type: str, signature: Tuple[int, ...]) -> Optional[str]:
+        """Ближайший кластер-кандидат из LSH с оценкой сходства не ниже threshold"""
+        best_id, best_similarity = None, self.threshold
+        checked = set()
+        for band_key in self._band_keys(attack_type, signature):
+            candidate = self._buckets.get(band_key)
+            if candidate is None or candidate in checked:
+                continue
+            checked.add(candidate)
+            candidate_signature = self._clusters[candidate][1]
+            similarity = sum(x == y for x, y in zip(signature, candidate_signature)) / self.num_perm
+            if similarity >= best_similarity:
+                best_id, best_similarity = candidate, similarity
+        return best_id
+
+    def _create(self, attack_type: str, shape: Tuple[str, ...], signature: Tuple[int, ...], sample: str) -> str:
+        shape_text = ' '.join(shape)
+        digest = hashlib.blake2b(f"{attack_type}\n{shape_text}".encode('utf-8'), digest_size=6).hexdigest()
+        cluster_id = f"{attack_type.lower()}-{digest}"
+        self._index(cluster_id, attack_type, signature)
+        if len(self._pending) < self.max_clusters:
+            self._pending.append({
+                'cluster_id': cluster_id,
+                'detection_type': attack_type,
+                'shape': shape_text,
+                'representative_sample': sample,
+                'signature': array('I', signature).tobytes()
+            })
+        return cluster_id
+
+    def _index(self, cluster_id: str, attack_type: str, signature: Tuple[int, ...]):
+        band_keys = self._band_keys(attack_type, signature)
+        for band_key in band_keys:
+            self._buckets.setdefault(band_key, cluster_id)
+        self._clusters[cluster_id] = (attack_type, signature, band_keys)
+        while len(self._clusters) > self.max_clusters:
+            old_id, (_, _, old_keys) = self._clusters.popitem(last=False)
+            for band_key in old_keys:
+                if self._buckets.get(band_key) == old_id:
+                    del self._buckets[band_key]
+
+    def _remember_shape(self, key: Tuple[str, Tuple[str, ...]], cluster_id: str):
+        self._shapes[key] = cluster_id
+        if len(self._shapes) > self.max_shapes:
+            self._shapes.popitem(last=False)
+
+    # ===== СОХРАНЕНИЕ =====
+
+    def drain_new(self) -> List[Dict[str, Any]]:
+        """Забирает созданные кластеры для сохранения в базу"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        return pending
+
+    def load(self, clusters: List[Dict[str, Any]]):
+        """Восстанавливает индекс по сохранённым кластерам (с подписями)"""
+        with self._lock:
+            for cluster in clusters:
+                signature_bytes = cluster.get('signature')
+                if not signature_bytes:
+                    continue
+                signature = tuple(array('I', signature_bytes))
+                if len(signature) != self.num_perm:
+                    continue
+                self._index(cluster['cluster_id'], cluster['detection_type'], signature)
+
+    def size(self) -> Dict[str, int]:
+        with self._lock:
+            return {'clusters': len(self._clusters), 'shapes': len(self._shapes)}
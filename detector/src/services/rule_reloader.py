@@ -0,0 +1,111 @@
+import os
+import threading
+import time
+from typing import Dict, Any, Callable, Optional
+
+from detectors.rule_pack import RulePack, RulePackError, load_rule_pack
+from services.logging_service import get_logger
+from services import metrics
+
+
+class RuleReloader:
+    """
+    Следит за файлом пакета правил и применяет изменения без перезапуска.
+
+    Фоновый поток раз в interval секунд сравнивает размер и время
+    изменения файла. Изменённый пакет разбирается, компилируется и
+    проверяется своими тестами в этом же потоке, вне горячего пути, и
+    только затем передаётся в apply(pack) для атомарной замены набора
+    правил. Пакет с ошибкой отклоняется: работает прежний набор, ошибка
+    видна в status() и в метрике detector_rule_reloads_total.
+    """
+
+    def __init__(self, path: str, apply: Callable[[RulePack], None], interval: float = 2.0,
+                 current: Optional[RulePack] = None):
+        self.path = path
+        self.apply = apply
+        self.interval = interval
+        self.log = get_logger("rules")
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._file_state = self._stat()
+        self._digest = current.digest if current is not None else None
+        self.version = current.version if current is not None else None
+        self.last_error: Optional[str] = None
+        self.last_check: Optional[float] = None
+
+    def _stat(self) -> Optional[tuple]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="rule-reloader", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        with self._lock:
+            thread = self._thread
+            if thread is None:
+                return
+            self._stop.set()
+            thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                self.log.exception("Ошибка проверки пакета правил")
+
+    def check(self, force: bool = False) -> bool:
+        """
+        Загружает пакет, если файл изменился (force - в любом случае).
+        True, если применён новый набор правил.
+        """
+        self.last_check = time.time()
+        state = self._stat()
+        if not force and state == self._file_state:
+            return False
+        self._file_state = state
+
+        try:
+            pack = load_rule_pack(self.path)
+        except (OSError, RulePackError) as e:
+            self.last_error = str(e)
+            metrics.RULE_RELOADS.labels('rejected').inc()
+            self.log.warning("Пакет правил отклонён, работает прежний набор",
+                             extra={"path": self.path, "error": str(e), "version": self.version})
+            return False
+
+        if pack.digest == self._digest:
+            self.last_error = None
+            return False  # изменилось только время файла
+
+        self.apply(pack)
+        self._digest = pack.digest
+        self.version = pack.version
+        self.last_error = None
+        metrics.RULE_RELOADS.labels('applied').inc()
+        self.log.info("Пакет правил применён", extra={
+            "path": self.path, "version": pack.version, "rules": len(pack.rules)
+        })
+        return True
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "watching": self._thread is not None,
+            "interval": self.interval,
+            "version": self.version,
+            "last_check": self.last_check,
+            "last_error": self.last_error
+        }
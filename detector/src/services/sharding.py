@@ -0,0 +1,514 @@
+import bisect
+import hashlib
+import itertools
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Dict, Any, List, Optional
+
+from services.logging_service import get_logger
+from services.tracing import RequestTrace
+
+# Точек на кольце на один шард: чем больше, тем ровнее распределение песочниц
+DEFAULT_REPLICAS = 128
+# Как часто поток сбора результатов проверяет, живы ли процессы шардов (секунды)
+HEALTH_CHECK_INTERVAL = 0.5
+# Сколько по умолчанию ждать результата задания шарда (секунды)
+RESULT_TIMEOUT = 30.0
+# Сколько секунд сводка корреляции шардов для /api/stats берётся из кеша
+CORRELATION_CACHE_SECONDS = 1.0
+
+
+class ShardUnavailableError(RuntimeError):
+    """Шард не вернул результат: завершился или не ответил за result_timeout (ответ 503)"""
+
+
+def _ring_hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8', 'surrogatepass'), digest_size=8).digest(), 'big')
+
+
+class ConsistentHashRing:
+    """
+    Кольцо согласованного хеширования: sandbox_id -> номер шарда.
+
+    Каждый шард занимает replicas точек кольца, ключ обслуживает шард
+    ближайшей точки по часовой стрелке. Хеш (blake2b) не зависит от
+    процесса и PYTHONHASHSEED, поэтому после перезапуска песочница
+    попадает в тот же шард, а при изменении числа шардов с N на N+1
+    переезжает только около 1/(N+1) песочниц.
+    """
+
+    def __init__(self, shards: int, replicas: int = DEFAULT_REPLICAS):
+        if shards < 1:
+            raise ValueError("число шардов должно быть не меньше 1")
+        self.shards = shards
+        self.replicas = replicas
+        points = sorted(
+            (_ring_hash(f"shard-{shard}#{replica}"), shard)
+            for shard in range(shards)
+            for replica in range(replicas)
+        )
+        self._hashes = [point for point, _ in points]
+        self._owners = [shard for _, shard in points]
+
+    def shard_for(self, key: Optional[str]) -> int:
+        """Номер шарда для ключа (None и пустая строка - один и тот же шард)"""
+        if self.shards == 1:
+            return 0
+        position = bisect.bisect(self._hashes, _ring_hash(key or ''))
+        return self._owners[position % len(self._owners)]
+
+
+# ===== ПРОЦЕСС ШАРДА =====
+
+def _flush(detector) -> bool:
+    """Дописывает в базу накопленные скетчи уникальных значений и новые кластеры"""
+    detector.cardinality.flush()
+    detector.flush_clusters()
+    return True
+
+
+def _traced(analyze, trace, *args, **kwargs):
+    """Анализ в шарде с трассировкой: (результат, трассировка или None) - трассировка возвращается диспетчеру"""
+    if trace is not None:
+        trace.add_since_last('shard.queue')
+    return analyze(*args, trace=trace, **kwargs), trace
+
+
+# Вызовы, которые процесс шарда выполняет над своим детектором
+_SHARD_CALLS = {
+    'ping': lambda detector: os.getpid(),
+    'analyze_request': lambda detector, kwargs, trace: _traced(detector.analyze_request, trace, **kwargs),
+    'analyze_batch': lambda detector, requests, persist, mode, trace: _traced(
+        detector.analyze_batch, trace, requests, persist=persist, mode=mode),
+    'recent_alerts': lambda detector, limit: detector.correlator.recent_alerts(limit),
+    'campaigns': lambda detector, sandbox_id, source_ip, limit: detector.correlator.campaigns(
+        sandbox_id=sandbox_id, source_ip=source_ip, limit=limit),
+    'correlation': lambda detector: detector.correlator.snapshot(),
+    'top': lambda detector, dimension, n, seconds: detector.heavy_hitters.top(dimension, n, seconds),
+    'top_snapshot': lambda detector, n, seconds: detector.heavy_hitters.snapshot(n, seconds),
+    'reload_rules': lambda detector: (
+        detector.rules_reloader.check(force=True) if detector.rules_reloader is not None else False),
+    'flush': _flush,
+}
+
+
+def _shard_main(shard: int, tasks, results, shared_name: Optional[str], correlation: Dict[str, Any]):
+    """
+    Цикл процесса шарда: свой CyberRangeDetector (кеши, корреляция,
+    соединение с базой), задания выполняются строго по одному в порядке
+    очереди. None в очереди - завершение с записью накопленного в базу.
+    """
+    # Ctrl+C получает вся группа процессов: шард завершает API сервер через stop()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    from main import CyberRangeDetector
+    from services.correlation import CorrelationEngine
+    from database.db_manager import DEFAULT_DB_PATH
+    from services.shared_counters import SharedCounters
+    from services.stats_service import SHARED_KEYS, STAT_KEYS
+
+    shared = None
+    if shared_name:
+        shared = SharedCounters(shared_name, SHARED_KEYS, baseline_keys=STAT_KEYS,
+                                lock_dir=os.path.dirname(os.path.abspath(DEFAULT_DB_PATH)))
+    detector = CyberRangeDetector(shared_counters=shared, correlator=CorrelationEngine(**correlation))
+    # Метрики правил процесса шарда не попадают в /metrics API сервера - не тратим время на замеры
+    for rule_detector in detector.engine.detectors():
+        rule_detector.rule_observer = None
+    detector.cardinality.start()
+    if detector.rules_reloader is not None:
+        detector.rules_reloader.start()
+
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            task_id, name, args = task
+            try:
+                results.put((task_id, True, _SHARD_CALLS[name](detector, *args)))
+            except Exception as e:
+                results.put((task_id, False, e if isinstance(e, (ValueError, KeyError)) else RuntimeError(repr(e))))
+    finally:
+        if detector.rules_reloader is not None:
+            detector.rules_reloader.stop()
+        detector.cardinality.stop()
+        _flush(detector)
+        if shared is not None:
+            shared.close()
+
+
+class _Shard:
+    """Процесс шарда, его очередь заданий и счётчики"""
+
+    __slots__ = ('index', 'process', 'tasks', 'submitted', 'restarts')
+
+    def __init__(self, index: int):
+        self.index = index
+        self.process = None
+        self.tasks = None
+        self.submitted = 0
+        self.restarts = 0
+
+
+# ===== ДИСПЕТЧЕР =====
+
+class ShardedAnalyzer:
+    """
+    Шардированный анализ: запросы распределяются по sandbox_id между
+    shards долгоживущими процессами.
+
+    Каждый процесс держит свой CyberRangeDetector (кеши детекторов,
+    корреляцию, базовые профили, соединение с базой) и выполняет задания
+    своей очереди по одному, поэтому все запросы одной песочницы
+    анализируются одним процессом в порядке поступления, а разные
+    песочницы - параллельно на всех ядрах.
+
+    Слияние результатов:
+      - статистика - через SharedCounters (shared_name): каждый процесс
+        пишет свою строку, API сервер суммирует;
+      - уникальные значения, кластеры, обнаружения и события - через базу;
+      - оповещения, кампании и top-K - опросом всех шардов (call) и
+        объединением в API сервере.
+
+    Корреляция сканеров по source_ip ведётся внутри шарда: IP, атакующий
+    песочницы разных шардов, набирает порог в каждом шарде отдельно.
+    Число шардов меняется перезапуском; согласованное хеширование
+    переносит при этом только часть песочниц (см. ConsistentHashRing).
+    """
+
+    def __init__(self, shards: int, shared_name: Optional[str] = None,
+                 correlation: Optional[Dict[str, Any]] = None, replicas: int = DEFAULT_REPLICAS,
+                 start_timeout: float = 60.0, result_timeout: float = RESULT_TIMEOUT):
+        self.ring = ConsistentHashRing(shards, replicas)
+        self.shared_name = shared_name
+        self.correlation = dict(correlation or {})
+        self.start_timeout = start_timeout
+        self.result_timeout = result_timeout
+        self.log = get_logger("sharding")
+
+        # spawn: процесс шарда не наследует потоки и блокировки API сервера
+        self._context = multiprocessing.get_context('spawn')
+        self._results = None
+        self._shards = [_Shard(index) for index in range(shards)]
+        self._pending: Dict[int, tuple] = {}  # task_id -> (шард, Future)
+        self._task_ids = itertools.count()
+        self._lock = threading.Lock()
+        self._collector = None
+        self._running = False
+        # (момент по monotonic, сводка) - см. correlation_snapshot
+        self._correlation_lock = threading.Lock()
+        self._correlation_cache = (0.0, None)
+
+    @property
+    def shards(self) -> int:
+        return self.ring.shards
+
+    def shard_for(self, sandbox_id: Optional[str]) -> int:
+        return self.ring.shard_for(sandbox_id)
+
+    # ===== ЖИЗНЕННЫЙ ЦИКЛ =====
+
+    def start(self):
+        """Запускает процессы шардов и ждёт, пока каждый создаст детектор"""
+        with self._lock:
+            if self._running:
+                return
+            self._results = self._context.Queue()
+            for shard in self._shards:
+                self._spawn(shard)
+            self._running = True
+        self._collector = threading.Thread(target=self._collect, name="shard-collector", daemon=True)
+        self._collector.start()
+
+        started = time.perf_counter()
+        try:
+            pids = [future.result(self.start_timeout) for future in self.call_async('ping')]
+        except Exception:
+            self.stop()
+            raise
+        self.log.info("Шарды анализа запущены", extra={
+            "shards": self.shards, "pids": pids, "start_seconds": round(time.perf_counter() - started, 3)
+        })
+
+    def stop(self, timeout: float = 10.0):
+        """Завершает шарды: каждый дорабатывает свою очередь и пишет накопленное в базу"""
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+            shards = list(self._shards)
+        for shard in shards:
+            shard.tasks.put(None)
+        deadline = time.monotonic() + timeout
+        for shard in shards:
+            shard.process.join(max(0.0, deadline - time.monotonic()))
+            if shard.process.is_alive():
+                shard.process.terminate()
+                shard.process.join(1.0)
+        if self._collector is not None:
+            self._collector.join(timeout)
+            self._collector = None
+        with self._lock:
+            lost = self._take_pending(None)
+        for future in lost:
+            future.set_exception(ShardUnavailableError("шардированный анализ остановлен"))
+
+    def _spawn(self, shard: _Shard):
+        shard.tasks = self._context.Queue()
+        shard.process = self._context.Process(
+            target=_shard_main,
+            args=(shard.index, shard.tasks, self._results, self.shared_name, self.correlation),
+            name=f"detector-shard-{shard.index}",
+            daemon=True
+        )
+        shard.process.start()
+
+    def _collect(self):
+        """
+        Поток сбора результатов: разрешает Future и перезапускает упавшие
+        шарды. Проверка шардов идёт по своему таймеру: при постоянном
+        потоке результатов от других шардов очередь не бывает пустой
+        """
+        next_check = time.monotonic() + HEALTH_CHECK_INTERVAL
+        while True:
+            now = time.monotonic()
+            if now >= next_check:
+                self._check_shards()
+                next_check = now + HEALTH_CHECK_INTERVAL
+            try:
+                task_id, ok, value = self._results.get(timeout=max(0.0, next_check - now))
+            except queue.Empty:
+                if not self._running:
+                    return
+                continue
+            with self._lock:
+                entry = self._pending.pop(task_id, None)
+            if entry is None:
+                continue  # задание уже завершено с ошибкой при падении шарда
+            future = entry[1]
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def _check_shards(self):
+        for shard in self._shards:
+            if not self._running or shard.process.is_alive():
+                continue
+            exitcode = shard.process.exitcode
+            with self._lock:
+                if not self._running:
+                    return
+                # Задания в старой очереди не выполнятся: они завершаются с
+                # ошибкой, новый процесс получает новую очередь
+                lost = self._take_pending(shard.index)
+                self._spawn(shard)
+                shard.restarts += 1
+            error = ShardUnavailableError(f"шард {shard.index} завершился (код {exitcode})")
+            for future in lost:
+                future.set_exception(error)
+            self.log.error("Шард анализа перезапущен", extra={
+                "shard": shard.index, "exitcode": exitcode, "restarts": shard.restarts
+            })
+
+    def _take_pending(self, shard_index: Optional[int]) -> List[Future]:
+        """Забирает ожидающие Future шарда (None - всех шардов); вызывается под self._lock"""
+        task_ids = [
+            task_id for task_id, (index, _) in self._pending.items()
+            if shard_index is None or index == shard_index
+        ]
+        return [self._pending.pop(task_id)[1] for task_id in task_ids]
+
+    # ===== ЗАДАНИЯ =====
+
+    def submit(self, shard_index: int, name: str, *args) -> Future:
+        """Ставит вызов name(*args) в очередь шарда; Future с результатом"""
+        future = Future()
+        with self._lock:
+            if not self._running:
+                raise RuntimeError("шардированный анализ не запущен")
+            task_id = next(self._task_ids)
+            shard = self._shards[shard_index]
+            self._pending[task_id] = (shard_index, future)
+            shard.submitted += 1
+            # Под блокировкой: порядок заданий в очереди шарда совпадает с порядком submit
+            shard.tasks.put((task_id, name, args))
+        return future
+
+    def call_async(self, name: str, *args) -> List[Future]:
+        return [self.submit(shard.index, name, *args) for shard in self._shards]
+
+    def result(self, future: Future) -> Any:
+        """Результат задания; ShardUnavailableError, если его нет дольше result_timeout"""
+        try:
+            return future.result(self.result_timeout)
+        except FutureTimeoutError:
+            raise ShardUnavailableError(f"шард не ответил за {self.result_timeout:g} с") from None
+
+    def call(self, name: str, *args) -> List[Any]:
+        """Выполняет вызов на всех шардах; результаты по порядку шардов"""
+        return [self.result(future) for future in self.call_async(name, *args)]
+
+    def analyze_request(self, trace: Optional[RequestTrace] = None, **kwargs) -> Dict[str, Any]:
+        """CyberRangeDetector.analyze_request в шарде песочницы запроса"""
+        future = self.submit(self.shard_for(kwargs.get('sandbox_id')), 'analyze_request', kwargs,
+                             trace.fork() if trace is not None else None)
+        result, shard_trace = self.result(future)
+        if trace is not None:
+            trace.merge(shard_trace)
+            trace.add_since_last('shard.return')
+        return result
+
+    def analyze_batch(self, requests: List[Dict[str, Any]], persist: bool = True,
+                      mode: str = 'full', trace: Optional[RequestTrace] = None) -> List[Dict[str, Any]]:
+        """
+        CyberRangeDetector.analyze_batch с разбиением пакета по шардам.
+
+        Части пакета анализируются параллельно (одна транзакция базы на
+        часть), результаты возвращаются в порядке запросов. Участки
+        трассировки частей суммируются.
+        """
+        groups: Dict[int, List[int]] = {}
+        for position, request in enumerate(requests):
+            groups.setdefault(self.shard_for(request.get('sandbox_id')), []).append(position)
+
+        futures = [
+            (positions, self.submit(shard_index, 'analyze_batch', [requests[i] for i in positions], persist, mode,
+                                    trace.fork() if trace is not None else None))
+            for shard_index, positions in groups.items()
+        ]
+        results: List[Any] = [None] * len(requests)
+        for positions, future in futures:
+            shard_results, shard_trace = self.result(future)
+            for position, result in zip(positions, shard_results):
+                results[position] = result
+            if trace is not None:
+                trace.merge(shard_trace)
+        if trace is not None:
+            trace.add_since_last('shard.return')
+        return results
+
+    # ===== ОБЪЕДИНЁННОЕ СОСТОЯНИЕ =====
+
+    def recent_alerts(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Последние оповещения корреляции всех шардов (новые в конце)"""
+        alerts = [alert for shard_alerts in self.call('recent_alerts', limit) for alert in shard_alerts]
+        alerts.sort(key=lambda alert: alert['timestamp'])
+        return alerts[-limit:] if limit > 0 else []
+
+    def campaigns(self, sandbox_id: Optional[str] = None, source_ip: Optional[str] = None,
+                  limit: int = 50) -> List[Dict[str, Any]]:
+        """Активные кампании (новые первыми); с sandbox_id опрашивается только его шард"""
+        if sandbox_id is not None:
+            return self.result(self.submit(self.shard_for(sandbox_id), 'campaigns', sandbox_id, source_ip, limit))
+        campaigns = [
+            campaign
+            for shard_campaigns in self.call('campaigns', None, source_ip, limit)
+            for campaign in shard_campaigns
+        ]
+        campaigns.sort(key=lambda campaign: campaign['last_seen'], reverse=True)
+        return campaigns[:limit]
+
+    def correlation_snapshot(self, max_age: float = CORRELATION_CACHE_SECONDS) -> Dict[str, Any]:
+        """
+        Сводка корреляции: размеры состояния и оповещения, просуммированные
+        по шардам. Сводка моложе max_age секунд берётся из кеша, поэтому
+        частый опрос /api/stats не ставит задания в очереди шардов
+        """
+        with self._correlation_lock:
+            cached_at, cached = self._correlation_cache
+            if cached is not None and time.monotonic() - cached_at < max_age:
+                return cached
+            merged = self._merge_correlation(self.call('correlation'))
+            self._correlation_cache = (time.monotonic(), merged)
+            return merged
+
+    @staticmethod
+    def _merge_correlation(snapshots: List[Dict[str, Any]]) -> Dict[str, Any]:
+        merged = dict(snapshots[0])
+        merged['alerts'] = {}
+        for key in ('tracked_keys', 'active_campaigns', 'closed_campaigns'):
+            merged[key] = sum(snapshot[key] for snapshot in snapshots)
+        for snapshot in snapshots:
+            for alert_type, count in snapshot['alerts'].items():
+                merged['alerts'][alert_type] = merged['alerts'].get(alert_type, 0) + count
+        return merged
+
+    def top(self, dimension: str, n: int = 20, seconds: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Top-n измерения: счётчики одного значения из разных шардов складываются"""
+        return _merge_top(self.call('top', dimension, n, seconds), n)
+
+    def top_snapshot(self, n: int = 20, seconds: Optional[float] = None) -> Dict[str, Any]:
+        snapshots = self.call('top_snapshot', n, seconds)
+        return {
+            'window_seconds': snapshots[0]['window_seconds'],
+            'top': {
+                dimension: _merge_top([snapshot['top'][dimension] for snapshot in snapshots], n)
+                for dimension in snapshots[0]['top']
+            },
+            'totals': {
+                dimension: sum(snapshot['totals'][dimension] for snapshot in snapshots)
+                for dimension in snapshots[0]['totals']
+            }
+        }
+
+    def flush(self):
+        """Все шарды дописывают в базу уникальные значения и кластеры (перед чтением из базы)"""
+        self.call('flush')
+
+    def reload_rules(self) -> List[bool]:
+        """Перечитывает пакет правил в каждом шарде"""
+        return self.call('reload_rules')
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Состояние шардов для /api/stats"""
+        with self._lock:
+            in_flight = [0] * self.shards
+            for index, _ in self._pending.values():
+                in_flight[index] += 1
+            return {
+                'shards': self.shards,
+                'running': self._running,
+                'workers': [
+                    {
+                        'shard': shard.index,
+                        'pid': shard.process.pid if shard.process is not None else None,
+                        'alive': shard.process is not None and shard.process.is_alive(),
+                        'in_flight': in_flight[shard.index],
+                        'submitted': shard.submitted,
+                        'restarts': shard.restarts
+                    }
+                    for shard in self._shards
+                ]
+            }
+
+
+def _merge_top(tops: List[List[Dict[str, Any]]], n: int) -> List[Dict[str, Any]]:
+    """
+    Объединяет top-n шардов. Если значения нет в полном (n значений) списке
+    шарда, в шарде оно могло набрать до счётчика последнего значения списка:
+    он добавляется к счётчику и погрешности, как при объединении корзин
+    """
+    floors = [top[-1]['count'] if top and len(top) >= n else 0 for top in tops]
+    floor_total = sum(floors)
+    merged: Dict[Any, Dict[str, Any]] = {}
+    for top, floor in zip(tops, floors):
+        for item in top:
+            entry = merged.get(item['value'])
+            if entry is None:
+                merged[item['value']] = entry = {**item, 'count': 0, 'error': 0}
+                entry['present'] = 0
+            entry['count'] += item['count']
+            entry['error'] += item['error']
+            entry['present'] += floor
+    for entry in merged.values():
+        missing = floor_total - entry.pop('present')
+        entry['count'] += missing
+        entry['error'] += missing
+    return sorted(merged.values(), key=lambda item: item['count'], reverse=True)[:n]
@@ -0,0 +1,262 @@
+import os
+import threading
+from contextlib import contextmanager
+from datetime import date
+from multiprocessing import shared_memory
+from typing import Dict, Optional, Sequence, Set, Tuple
+
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
+# Размер ячейки массива (int64)
+_CELL = 8
+
+# Строки, занятые в этом процессе: путь файла строк -> (файл, номера строк).
+# POSIX-блокировки (lockf) принадлежат процессу: блокировка строки не
+# мешает другому экземпляру в том же процессе, а закрытие любого
+# дескриптора файла снимает все блокировки процесса. Поэтому файл строк
+# общий для экземпляров процесса, а занятые строки учитываются здесь.
+_process_rows: Dict[str, Tuple[object, Set[int]]] = {}
+_process_rows_lock = threading.Lock()
+
+
+class SharedCounters:
+    """
+    Счётчики в разделяемой памяти для нескольких процессов-воркеров.
+
+    Сегмент - массив int64: строка 0 - заголовок (база сверки с БД),
+    строки 1..slots - по одной на воркер: [pid, поколение, счётчики...].
+    Каждый воркер пишет только в свою строку, поэтому увеличение счётчика
+    не требует межпроцессных блокировок (потоки воркера сериализуются
+    локальной); читатели суммируют строки.
+    Межпроцессная блокировка (flock) берётся только при захвате строки
+    и при работе с заголовком.
+
+    Пока воркер жив, он держит блокировку байта своей строки в файле строк
+    (lockf); ядро снимает её при завершении процесса, поэтому занятость
+    строки не зависит от переиспользования pid. Строка завершившегося
+    воркера не обнуляется: её занимает следующий воркер и продолжает счёт.
+    Если при подключении ни одна строка не занята, сегмент остался
+    от прошлого запуска и обнуляется.
+
+    Файлы блокировок создаются в lock_dir - рядом с базой данных,
+    которую разделяют воркеры (по умолчанию текущий каталог).
+    """
+
+    def __init__(self, name: str, keys: Sequence[str], baseline_keys: Sequence[str] = (), slots: int = 64,
+                 lock_dir: Optional[str] = None):
+        if not HAS_FCNTL:
+            raise RuntimeError("Многопроцессный режим требует fcntl (Linux/Unix)")
+
+        self.name = name
+        self.keys = tuple(keys)
+        self.baseline_keys = tuple(baseline_keys)
+        self.slots = slots
+        self._index = {key: i for i, key in enumerate(self.keys)}
+
+        # Заголовок: [день, время сверки (мс), база[baseline], сумма на момент сверки[baseline]]
+        self._row_width = max(2 + len(self.keys), 2 + 2 * len(self.baseline_keys))
+        size = (slots + 1) * self._row_width * _CELL
+
+        lock_dir = os.path.abspath(lock_dir or os.curdir)
+        self._lock_path = os.path.join(lock_dir, f"{name}.lock")
+        self._rows_path = os.path.join(lock_dir, f"{name}.rows.lock")
+        self._lock_file = open(self._lock_path, "a+")
+        # flock не разделяет потоки одного процесса (общий файловый дескриптор):
+        # потоки исключаются RLock, вложенный lock() не снимает flock раньше времени
+        self._thread_lock = threading.RLock()
+        self._lock_depth = 0
+        # add() вызывают несколько потоков процесса (обработчики запросов, микробатчер)
+        self._add_lock = threading.Lock()
+        self._row = 0
+
+        with self.lock():
+            try:
+                self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+                created = True
+            except FileExistsError:
+                self._shm = shared_memory.SharedMemory(name=name)
+                created = False
+                if self._shm.size < size:
+                    # Сегмент прошлой версии с другим набором счётчиков
+                    self._shm.close()
+                    self._shm.unlink()
+                    self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+                    created = True
+
+            _untrack(self._shm)
+
+            self._cells = self._shm.buf.cast("q")
+            if not created and not self._has_live_workers():
+                for i in range(len(self._cells)):
+                    self._cells[i] = 0
+            self._row = self._claim_row()
+
+    # ===== БЛОКИРОВКА =====
+
+    @contextmanager
+    def lock(self):
+        """Межпроцессная (и межпоточная) блокировка сегмента; допускает вложенный захват"""
+        with self._thread_lock:
+            if self._lock_depth == 0:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    # ===== СТРОКИ ВОРКЕРОВ =====
+
+    def _offset(self, row: int) -> int:
+        return row * self._row_width
+
+    def _process_rows_entry(self):
+        """Файл строк и строки, занятые в этом процессе (вызывается под _process_rows_lock)"""
+        entry = _process_rows.get(self._rows_path)
+        if entry is None:
+            entry = _process_rows[self._rows_path] = (open(self._rows_path, "a+"), set())
+        return entry
+
+    def _row_busy(self, rows_file, local_rows: Set[int], row: int) -> bool:
+        """Занята ли строка живым воркером (вызывается под блокировкой)"""
+        if row in local_rows:
+            return True
+        try:
+            fcntl.lockf(rows_file, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, row)
+        except OSError:
+            return True
+        fcntl.lockf(rows_file, fcntl.LOCK_UN, 1, row)
+        return False
+
+    def _has_live_workers(self) -> bool:
+        with _process_rows_lock:
+            rows_file, local_rows = self._process_rows_entry()
+            for row in range(1, self.slots + 1):
+                if self._cells[self._offset(row)] and self._row_busy(rows_file, local_rows, row):
+                    return True
+        return False
+
+    def _claim_row(self) -> int:
+        """Занимает свободную строку или строку завершившегося воркера (под блокировкой)"""
+        with _process_rows_lock:
+            rows_file, local_rows = self._process_rows_entry()
+            for row in range(1, self.slots + 1):
+                if row in local_rows:
+                    continue
+                try:
+                    fcntl.lockf(rows_file, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, row)
+                except OSError:
+                    continue  # строку держит живой воркер
+                local_rows.add(row)
+                self._cells[self._offset(row)] = os.getpid()
+                return row
+        raise RuntimeError(f"В сегменте {self.name} нет свободных строк ({self.slots})")
+
+    def _release_row(self):
+        """Освобождает строку этого экземпляра"""
+        with _process_rows_lock:
+            rows_file, local_rows = _process_rows.get(self._rows_path, (None, set()))
+            if rows_file is None or self._row not in local_rows:
+                return
+            fcntl.lockf(rows_file, fcntl.LOCK_UN, 1, self._row)
+            local_rows.discard(self._row)
+            if not local_rows:
+                del _process_rows[self._rows_path]
+                rows_file.close()
+
+    @property
+    def worker_slot(self) -> int:
+        """Номер строки этого воркера (уникален среди живых воркеров)"""
+        return self._row
+
+    # ===== СЧЁТЧИКИ =====
+
+    def add(self, deltas: Dict[str, int]):
+        """
+        Увеличивает счётчики своей строки. Межпроцессная блокировка
+        не нужна, но += над ячейкой - это чтение и запись, поэтому
+        потоки процесса сериализуются локальной блокировкой
+        """
+        base = self._offset(self._row)
+        cells = self._cells
+        index = self._index
+        with self._add_lock:
+            for key, value in deltas.items():
+                if value:
+                    cells[base + 2 + index[key]] += value
+            cells[base + 1] += 1
+
+    def totals(self) -> Dict[str, int]:
+        """Суммы счётчиков по всем воркерам"""
+        sums = [0] * len(self.keys)
+        for row in range(1, self.slots + 1):
+            base = self._offset(row)
+            if self._cells[base] == 0:
+                continue
+            for i in range(len(self.keys)):
+                sums[i] += self._cells[base + 2 + i]
+        return dict(zip(self.keys, sums))
+
+    def generation(self) -> int:
+        """Суммарное число обновлений; меняется при любой записи любого воркера"""
+        total = self._cells[1]
+        for row in range(1, self.slots + 1):
+            total += self._cells[self._offset(row) + 1]
+        return total
+
+    # ===== ЗАГОЛОВОК (СВЕРКА С БД) =====
+
+    def get_baseline(self) -> Tuple[int, int, Dict[str, int], Dict[str, int]]:
+        """Возвращает (день, время сверки в мс, база, суммы на момент сверки) (вызывать под lock())"""
+        count = len(self.baseline_keys)
+        day, reconciled_at = self._cells[0], self._cells[1]
+        base = [self._cells[2 + i] for i in range(count)]
+        sums = [self._cells[2 + count + i] for i in range(count)]
+        return day, reconciled_at, dict(zip(self.baseline_keys, base)), dict(zip(self.baseline_keys, sums))
+
+    def set_baseline(self, day: date, reconciled_at_ms: int, base: Dict[str, int], sums: Dict[str, int]):
+        """Записывает результат сверки с БД (вызывать под lock())"""
+        count = len(self.baseline_keys)
+        for i, key in enumerate(self.baseline_keys):
+            self._cells[2 + i] = base.get(key, 0)
+            self._cells[2 + count + i] = sums.get(key, 0)
+        self._cells[0] = day.toordinal()
+        # Поле времени сверки также служит поколением заголовка
+        self._cells[1] = reconciled_at_ms
+
+    def close(self):
+        """Отключается от сегмента (строка остаётся за следующим воркером)"""
+        self._release_row()
+        self._cells.release()
+        self._shm.close()
+        self._lock_file.close()
+
+
+def _forget_process_rows():
+    """В дочернем процессе после fork блокировки родителя не действуют"""
+    _process_rows.clear()
+
+
+if HAS_FCNTL:
+    os.register_at_fork(after_in_child=_forget_process_rows)
+
+
+def _untrack(shm: shared_memory.SharedMemory):
+    """
+    Не даёт resource_tracker удалить сегмент при выходе процесса.
+
+    Сегмент общий для всех воркеров и переживает любой из них, а трекер
+    (до Python 3.13 - и для подключённых сегментов) удалил бы его,
+    как только завершится процесс, который его зарегистрировал.
+    """
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
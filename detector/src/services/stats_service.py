@@ -0,0 +1,261 @@
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Any, Tuple
+
+from services.logging_service import get_logger
+from services.metrics import CACHE_REQUESTS
+
+# Счётчики, которые ведутся и в памяти, и в таблице statistics
+STAT_KEYS = ('total_requests', 'detected_attacks', 'sql_injections', 'xss_attacks', 'path_traversals')
+# Часть счётчиков STAT_KEYS от запросов, не записанных в базу (упрощённый режим)
+UNPERSISTED_KEYS = tuple(f"unpersisted_{key}" for key in STAT_KEYS)
+# Счётчики событий, принятых через /api/events
+EVENT_KEYS = ('total_events', 'event_attacks')
+# Счётчики контроля нагрузки (отклонённые и обработанные без сохранения запросы)
+ADMISSION_KEYS = ('shed_requests', 'degraded_requests')
+# Полный набор счётчиков для разделяемой памяти (многопроцессный режим)
+SHARED_KEYS = STAT_KEYS + UNPERSISTED_KEYS + EVENT_KEYS + ADMISSION_KEYS
+
+_SNAPSHOT_HITS = CACHE_REQUESTS.labels('stats_snapshot', 'hit')
+_SNAPSHOT_MISSES = CACHE_REQUESTS.labels('stats_snapshot', 'miss')
+
+
+class StatsService:
+    """
+    Сервис статистики с инкрементальным снимком в памяти.
+
+    Счётчики обновляются из пути анализа (record_request / record_event),
+    а дневная статистика периодически сверяется с базой данных.
+    Чтение снимка не обращается к базе и не пересчитывает данные,
+    если с прошлого чтения ничего не изменилось.
+
+    Если передан shared (SharedCounters), счётчики живут в разделяемой
+    памяти и общие для всех воркеров: дневная статистика считается как
+    база последней сверки с БД плюс приращения всех воркеров после неё,
+    поэтому любой воркер возвращает одни и те же числа.
+
+    Запись статистики запроса в базу и его учёт в счётчиках выполняются
+    в persisting(): сверка берёт ту же блокировку, поэтому не видит
+    запрос, уже записанный в базу, но ещё не учтённый (иначе он был бы
+    посчитан дважды).
+    """
+
+    def __init__(self, db_manager=None, reconcile_interval: float = 30.0, shared=None):
+        self.db_manager = db_manager
+        self.reconcile_interval = reconcile_interval
+        self.shared = shared
+
+        self._lock = threading.Lock()
+        # Запись в базу + учёт запроса и сверка с базой (см. persisting)
+        self._persist_lock = threading.RLock()
+        # Проверка версии снимка и его замена
+        self._snapshot_lock = threading.Lock()
+        self._version = 0
+        self._snapshot_version = -1
+        self._snapshot = None
+
+        # Статистика процесса (с момента запуска)
+        self.memory_stats = dict.fromkeys(STAT_KEYS, 0)
+        # Дневная статистика (как в таблице statistics)
+        self.database_stats = dict.fromkeys(STAT_KEYS, 0)
+        # Статистика событий, принятых через /api/events
+        self.events_stats = {'total_events': 0, 'detected_attacks': 0}
+        # Статистика контроля нагрузки
+        self.admission_stats = dict.fromkeys(ADMISSION_KEYS, 0)
+
+        self._day = datetime.now().date()
+        self._last_reconcile = 0.0
+        self.reconcile()
+
+    @contextmanager
+    def persisting(self):
+        """
+        Блокировка на запись статистики запроса в базу и record_request:
+        with stats_service.persisting(): запись в базу; record_request(counts)
+        """
+        with (self.shared.lock() if self.shared is not None else self._persist_lock):
+            yield
+
+    def record_request(self, counts: Dict[str, int], persisted: bool = True):
+        """
+        Учитывает проанализированный запрос (counts - приращения по STAT_KEYS).
+        persisted=False - запрос не записан в базу: меняется только
+        статистика процесса, дневная (как в таблице statistics) - нет
+        """
+        if self.shared is not None:
+            if not persisted:
+                counts = {**counts, **{f"unpersisted_{key}": value for key, value in counts.items()}}
+            self.shared.add(counts)
+        else:
+            with self._lock:
+                self._roll_day()
+                for key in STAT_KEYS:
+                    value = counts.get(key, 0)
+                    if value:
+                        self.memory_stats[key] += value
+                        if persisted:
+                            self.database_stats[key] += value
+                self._version += 1
+
+        self.maybe_reconcile()
+
+    def record_event(self, is_attack: bool):
+        """Учитывает одно событие от детектора"""
+        self.record_events(1, 1 if is_attack else 0)
+
+    def record_events(self, total: int, attacks: int):
+        """Учитывает пакет событий: total событий, из них attacks с атаками"""
+        if self.shared is not None:
+            self.shared.add({'total_events': total, 'event_attacks': attacks})
+            return
+
+        with self._lock:
+            self.events_stats['total_events'] += total
+            self.events_stats['detected_attacks'] += attacks
+            self._version += 1
+
+    def record_admission(self, key: str):
+        """Учитывает отклонённый ('shed_requests') или упрощённо обработанный ('degraded_requests') запрос"""
+        if self.shared is not None:
+            self.shared.add({key: 1})
+            return
+
+        with self._lock:
+            self.admission_stats[key] += 1
+            self._version += 1
+
+    def event_counts(self) -> Tuple[int, int]:
+        """Возвращает (всего событий, событий с атаками) по всем воркерам"""
+        if self.shared is not None:
+            totals = self.shared.totals()
+            return totals['total_events'], totals['event_attacks']
+        return self.events_stats['total_events'], self.events_stats['detected_attacks']
+
+    def maybe_reconcile(self):
+        """Сверяет снимок с базой, если прошло больше reconcile_interval секунд"""
+        if time.monotonic() - self._last_reconcile >= self.reconcile_interval:
+            self.reconcile()
+
+    def reconcile(self):
+        """Перечитывает дневную статистику из базы данных"""
+        self._last_reconcile = time.monotonic()
+        if self.db_manager is None:
+            return
+
+        if self.shared is not None:
+            self._reconcile_shared()
+            return
+
+        with self._persist_lock:
+            try:
+                db_stats = self.db_manager.get_daily_stats()
+            except Exception as e:
+                get_logger("stats").warning("Ошибка сверки статистики с БД", extra={"error": str(e)})
+                return
+
+            with self._lock:
+                self._day = datetime.now().date()
+                for key in STAT_KEYS:
+                    self.database_stats[key] = db_stats.get(key, 0)
+                self._version += 1
+
+    def _reconcile_shared(self):
+        """Сверка в многопроцессном режиме: один воркер на интервал обновляет общую базу"""
+        today = datetime.now().date()
+        now_ms = int(time.time() * 1000)
+
+        with self.shared.lock():
+            day, reconciled_at, _, _ = self.shared.get_baseline()
+            if day == today.toordinal() and now_ms - reconciled_at < self.reconcile_interval * 1000:
+                return  # другой воркер уже сверил
+
+            try:
+                db_stats = self.db_manager.get_daily_stats()
+            except Exception as e:
+                get_logger("stats").warning("Ошибка сверки статистики с БД", extra={"error": str(e)})
+                return
+
+            self.shared.set_baseline(today, now_ms, db_stats, _persisted(self.shared.totals()))
+
+    def _roll_day(self):
+        """Обнуляет дневные счётчики при смене даты (вызывается под блокировкой)"""
+        today = datetime.now().date()
+        if today != self._day:
+            self._day = today
+            for key in STAT_KEYS:
+                self.database_stats[key] = 0
+
+    def _read_counters(self):
+        """Возвращает (версия, статистика процесса, дневная статистика, статистика событий, контроль нагрузки)"""
+        if self.shared is None:
+            with self._lock:
+                return (self._version, dict(self.memory_stats), dict(self.database_stats),
+                        dict(self.events_stats), dict(self.admission_stats))
+
+        generation = self.shared.generation()
+        with self.shared.lock():
+            day, _, base, sums = self.shared.get_baseline()
+        if day != datetime.now().date().toordinal():
+            # Новые сутки: база вчерашняя, перечитываем её из БД
+            self._last_reconcile = 0.0
+            self.reconcile()
+            generation = self.shared.generation()
+            with self.shared.lock():
+                day, _, base, sums = self.shared.get_baseline()
+
+        totals = self.shared.totals()
+        persisted = _persisted(totals)
+        memory_stats = {key: totals[key] for key in STAT_KEYS}
+        db_stats = {key: base[key] + persisted[key] - sums[key] for key in STAT_KEYS}
+        events_stats = {'total_events': totals['total_events'], 'detected_attacks': totals['event_attacks']}
+        admission_stats = {key: totals[key] for key in ADMISSION_KEYS}
+        return generation, memory_stats, db_stats, events_stats, admission_stats
+
+    def _current_version(self) -> int:
+        return self._version if self.shared is None else self.shared.generation()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Возвращает снимок статистики для /api/stats без обращения к базе"""
+        with self._snapshot_lock:
+            if self._snapshot_version == self._current_version():
+                _SNAPSHOT_HITS.inc()
+                return self._snapshot
+            _SNAPSHOT_MISSES.inc()
+            return self._build_snapshot()
+
+    def _build_snapshot(self) -> Dict[str, Any]:
+        """Пересчитывает снимок (вызывается под _snapshot_lock)"""
+        version, memory_stats, db_stats, events_stats, admission_stats = self._read_counters()
+
+        total_requests = db_stats['total_requests']
+        total_events = events_stats['total_events']
+
+        self._snapshot = {
+            "memory_stats": memory_stats,
+            "database_stats": db_stats,
+            "summary": {
+                "total_requests": total_requests,
+                "total_attacks": db_stats['detected_attacks'],
+                "attack_ratio": f"{(db_stats['detected_attacks'] / total_requests * 100):.1f}%" if total_requests > 0 else "0%",
+                "detectors": {
+                    "sql_injection": db_stats['sql_injections'],
+                    "xss": db_stats['xss_attacks'],
+                    "path_traversal": db_stats['path_traversals']
+                }
+            },
+            "events_stats": {
+                "total_events": total_events,
+                "detected_attacks": events_stats['detected_attacks'],
+                "events_attack_ratio": f"{(events_stats['detected_attacks'] / total_events * 100):.1f}%" if total_events > 0 else "0%"
+            },
+            "admission_stats": admission_stats
+        }
+        self._snapshot_version = version
+        return self._snapshot
+
+
+def _persisted(totals: Dict[str, int]) -> Dict[str, int]:
+    """Счётчики STAT_KEYS только по записанным в базу запросам"""
+    return {key: totals[key] - totals[f"unpersisted_{key}"] for key in STAT_KEYS}
@@ -0,0 +1,109 @@
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+# Сколько самых медленных правил попадает в отчёт трассировки
+REPORT_RULES = 10
+
+
+class RequestTrace:
+    """
+    Трассировка одного запроса: участки (span) конвейера анализа по
+    монотонным часам (time.perf_counter).
+
+    Создаётся только для запросов с ?trace=1 (или выбранных для журнала
+    медленных запросов), а код конвейера добавляет участки под условием
+    "trace is not None": без трассировки не выполняется ничего.
+
+    Участки с одинаковым именем суммируются (пакет из N запросов даёт
+    один участок detector.xss с count=N). Время отдельных правил
+    замеряется повторной проверкой полей запроса (участок trace.rule_profile)
+    и в отчёте даётся по самым медленным правилам; в выборочной трассировке
+    (sampled) правила не замеряются.
+
+    Часы perf_counter в Linux общие для всех процессов, поэтому трассировка
+    передаётся в процесс шарда и обратно без пересчёта времени.
+    """
+
+    __slots__ = ('started', 'last', 'sampled', 'spans', 'rules')
+
+    def __init__(self, started: Optional[float] = None, sampled: bool = False):
+        self.started = time.perf_counter() if started is None else started
+        # Конец последнего записанного участка: начало следующего неучтённого
+        self.last = self.started
+        # True - трассировка для журнала медленных запросов, в ответ не попадает
+        self.sampled = sampled
+        # Имя -> [начало первого, суммарная длительность, количество]
+        self.spans: Dict[str, list] = {}
+        # (детектор, правило) -> [суммарные секунды, срабатывания]
+        self.rules: Dict[Tuple[str, str], list] = {}
+
+    def fork(self) -> 'RequestTrace':
+        """Пустая трассировка с тем же началом (для части запроса в другом процессе, см. merge)"""
+        child = RequestTrace(self.started, self.sampled)
+        child.last = self.last
+        return child
+
+    def add(self, name: str, started: float, ended: float):
+        """Записывает участок [started, ended) (значения perf_counter)"""
+        span = self.spans.get(name)
+        if span is None:
+            self.spans[name] = [started, ended - started, 1]
+        else:
+            span[1] += ended - started
+            span[2] += 1
+        if ended > self.last:
+            self.last = ended
+
+    def add_since_last(self, name: str) -> float:
+        """Записывает участок от конца предыдущего до текущего момента; возвращает момент"""
+        now = time.perf_counter()
+        self.add(name, self.last, now)
+        return now
+
+    def add_rules(self, timings: List[Tuple[str, str, float, bool]]):
+        """Добавляет замеры правил [(детектор, правило, секунды, сработало)]"""
+        for detector, rule, seconds, matched in timings:
+            entry = self.rules.get((detector, rule))
+            if entry is None:
+                self.rules[(detector, rule)] = [seconds, int(matched)]
+            else:
+                entry[0] += seconds
+                entry[1] += matched
+
+    def merge(self, other: 'RequestTrace'):
+        """Добавляет участки другой трассировки (fork, вернувшийся из процесса шарда)"""
+        for name, (started, duration, count) in other.spans.items():
+            span = self.spans.get(name)
+            if span is None:
+                self.spans[name] = [started, duration, count]
+            else:
+                span[0] = min(span[0], started)
+                span[1] += duration
+                span[2] += count
+        self.last = max(self.last, other.last)
+        self.add_rules([(detector, rule, seconds, hits) for (detector, rule), (seconds, hits) in other.rules.items()])
+
+    def total(self) -> float:
+        """Секунды с начала трассировки"""
+        return time.perf_counter() - self.started
+
+    def report(self) -> Dict[str, Any]:
+        """Разбивка для ответа: участки в порядке начала, миллисекунды от начала запроса"""
+        spans = sorted(self.spans.items(), key=lambda item: item[1][0])
+        rules = sorted(self.rules.items(), key=lambda item: item[1][0], reverse=True)[:REPORT_RULES]
+        return {
+            'total_ms': round(self.total() * 1000, 3),
+            'spans': [
+                {
+                    'name': name,
+                    'start_ms': round((started - self.started) * 1000, 3),
+                    'duration_ms': round(duration * 1000, 3),
+                    'count': count
+                }
+                for name, (started, duration, count) in spans
+            ],
+            'slowest_rules': [
+                {'detector': detector, 'rule': rule, 'duration_ms': round(seconds * 1000, 4), 'hits': hits}
+                for (detector, rule), (seconds, hits) in rules
+            ]
+        }
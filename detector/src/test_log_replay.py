@@ -0,0 +1,38 @@
+import os
+import sqlite3
+import tempfile
+from datetime import datetime, timezone
+
+from database.db_manager import DatabaseManager
+from services.id_generator import parse_id
+from services.log_replay import replay_logs
+
+# Больше номеров одной миллисекунды (4096): всплеск сканера за одну секунду
+BURST_LINES = 5000
+
+
+def test_replay_burst_in_one_second():
+    """Повторный анализ лога, где больше 4096 строк с одним временем (точность - секунда)"""
+    second = datetime(2025, 10, 10, 13, 55, 36, tzinfo=timezone.utc).timestamp()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        log_path = os.path.join(workdir, "burst.log")
+        with open(log_path, "w", encoding="utf-8") as log:
+            for index in range(BURST_LINES):
+                log.write(f'10.0.0.{index % 250} - - [10/Oct/2025:13:55:36 +0000] '
+                          f'"GET /item?id={index} HTTP/1.1" 200 12 "-" "scanner"\n')
+
+        db_path = os.path.join(workdir, "replay.db")
+        report = replay_logs([log_path], workers=1, db_manager=DatabaseManager(db_path))
+        assert report["persisted"] == BURST_LINES
+
+        with sqlite3.connect(db_path) as connection:
+            ids = [row[0] for row in connection.execute("SELECT id FROM requests")]
+        assert len(ids) == len(set(ids)) == BURST_LINES
+        # Все идентификаторы - внутри той же секунды
+        assert all(second <= parse_id(request_id)[0] < second + 1 for request_id in ids)
+
+
+if __name__ == "__main__":
+    test_replay_burst_in_one_second()
+    print("✅ Повторный анализ всплеска за одну секунду: идентификаторы не повторяются")